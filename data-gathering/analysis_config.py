@@ -0,0 +1,71 @@
+'''
+Settings of one bot.py analysis as an explicit object, so that the analysis can be run from
+other scripts (super_bot.py, benchmark.py, a long-lived worker) without command-line arguments.
+config_for() builds it from an entry of wikipedia_config.json; every field can be overridden.
+'''
+
+import json
+import os
+from collections import namedtuple
+
+from pageviews import DEFAULT_WINDOWS, windows_from_config
+from pipeline_metrics import METRICS_EVERY
+
+
+# next to this module, so that the configuration is found from any working directory
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wikipedia_config.json")
+
+# language_code/country_id: the wikipedia_config.json key (es, 77), language: the wiki that is analysed,
+# discussion_url: the quoted talk namespace prefix, result_file: None when nothing is written next to it,
+# profile: the fraction of articles profiled (0 = off), metrics: the metric names of metric_registry.py that are
+# computed (None = all), fast: sizes from the prop=info page lengths instead of the wikitext. The other fields mirror the command-line options of bot.py.
+AnalysisConfig = namedtuple("AnalysisConfig", [
+    "language_code", "country_id", "language", "discussion_url", "warnings_config",
+    "featured_template", "display_window_template", "pageview_windows",
+    "file_to_be_analysed", "article_file", "subject_file", "result_file", "sparql_endpoint",
+    "dump_file", "pageview_dumps", "resume", "verbose", "progress_every", "metrics_every", "profile",
+    "metrics", "fast",
+], defaults=[
+    DEFAULT_WINDOWS,
+    None, None, None, None, None,
+    None, None, False, False, 100, METRICS_EVERY, 0,
+    None, False,
+])
+
+
+def load_entries(path=CONFIG_FILE):
+    with open(path, "r") as config_file:
+        return json.load(config_file)
+
+
+# This function builds the configuration of a wikipedia_config.json entry; `options` override any field.
+def config_from_entry(key, entry, **options):
+    language_code, country_id = key.rsplit("_", 1)
+    config = AnalysisConfig(
+        language_code=language_code,
+        country_id=country_id,
+        language=entry["language"],
+        discussion_url=entry["discussionURL"],
+        warnings_config=entry["warnings_config"],
+        featured_template=entry["featured_template"],
+        display_window_template=entry["display_window_template"],
+        pageview_windows=windows_from_config(entry),
+        file_to_be_analysed=entry["file_to_be_analysed"],
+        article_file=entry["article_file"],
+        subject_file=entry["subject_file"],
+        result_file=entry["result_file"],
+        sparql_endpoint=entry.get("sparql_endpoint"),
+        metrics=entry.get("metrics"),
+        fast=bool(entry.get("fast", False)),
+    )
+    return config._replace(**options)
+
+
+# This function returns the configuration of a language and country, e.g. config_for("es", "77", result_file=None).
+# Raises ValueError for combinations that are not in wikipedia_config.json.
+def config_for(language_code, country_id, path=CONFIG_FILE, **options):
+    key = f"{language_code}_{country_id}"
+    entry = load_entries(path).get(key)
+    if not entry:
+        raise ValueError("Unsupported language or country code.")
+    return config_from_entry(key, entry, **options)
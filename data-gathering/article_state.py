@@ -0,0 +1,69 @@
+'''
+State kept between bot.py runs: the revision id of every analysed article and the
+metrics computed from its wikitext, so that unchanged articles are not re-analysed.
+'''
+
+import json
+import os
+import threading
+
+
+# bumped whenever a wikitext metric is computed differently, so that stored values are recomputed
+STATE_VERSION = 2
+
+
+# This function returns the state file that belongs to a result file (chile_results.txt -> chile_results_state.json).
+def state_path(result_file):
+    return os.path.splitext(result_file)[0] + "_state.json"
+
+
+class ArticleState:
+    # settings: the configuration values the wikitext metrics depend on; a state written with
+    # different settings is ignored so that every article is recomputed. path None keeps the state in memory only.
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = settings
+        self.previous = {}
+        self.current = {}
+        self.lock = threading.Lock()
+
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("version") == STATE_VERSION and data.get("settings") == settings:
+                self.previous = data.get("articles", {})
+
+    # Returns the stored metrics of an article when its revision did not change since the last run, else None.
+    def reuse(self, title, revid):
+        entry = self.previous.get(title)
+        if revid is None or entry is None or entry.get("revid") != revid:
+            return None
+        with self.lock:
+            self.current[title] = entry
+        return entry["metrics"]
+
+    def update(self, title, revid, metrics):
+        with self.lock:
+            self.current[title] = {"revid": revid, "metrics": metrics}
+
+    # Keeps the stored entries of articles that were not analysed in this run (e.g. finished before a resume).
+    def carry_over(self, titles):
+        with self.lock:
+            for title in titles:
+                if title in self.previous and title not in self.current:
+                    self.current[title] = self.previous[title]
+
+    # Returns a dict title -> revision id of the articles analysed in the previous run.
+    def known_revisions(self):
+        return {title: entry["revid"] for title, entry in self.previous.items()}
+
+    # Writes the articles seen in this run; articles that left the curriculum are dropped.
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            data = {"version": STATE_VERSION, "settings": self.settings, "articles": self.current}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -1,33 +1,6 @@
 @echo off
 
-rem Fetch Ghana's data
-py bot.py en 117
-
-rem Wait for the first script to finish
-echo Waiting for the first script to finish...
-timeout /t 10 /nobreak
-
-rem Run the translation script
-py translate.py Ghana
-
-rem Fetch Uruguay script
-py bot.py es 77
-
-rem Wait for the second script to finish
-echo Waiting for the second script to finish...
-timeout /t 10 /nobreak
-
-rem Run the translation script again
-py translate.py Uruguay
+rem Run query, bot and translate for Ghana (English and Twi) and Uruguay in one process;
+rem every step waits for the steps it needs, so no pause between the scripts is required
+py super_bot.py en_117 es_77 tw_117
 pause
-
-rem Fetch Ghana tw's data
-py bot.py tw 117
-
-rem Wait for the second script to finish
-echo Waiting for the second script to finish...
-timeout /t 10 /nobreak
-
-rem Run the translation script again
-py translate.py ghana
-pause
\ No newline at end of file
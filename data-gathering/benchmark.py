@@ -0,0 +1,252 @@
+'''
+Offline benchmark of bot.py.
+Starts replay_server.py, points a fresh HTTP client (with an empty cache) at it and analyses
+title lists with bot.analyse_titles(), so that the speed of the bot can be compared before
+and after a change without sending any traffic to Wikimedia. For every list it reports
+articles per second, requests per article, p50/p99 latency of the requests and of the
+analysis of an article, and the CPU time spent in the text-metric functions:
+
+    python3 benchmark.py                                  # Chile, Uruguay and 100000 synthetic titles
+    python3 benchmark.py es_298 --latency 50 --jitter 20 --error-rate 0.01
+    python3 benchmark.py synthetic --synthetic-size 5000 --output benchmark.json
+    python3 benchmark.py es_77 --metrics size,pageviews
+    python3 benchmark.py es_77 --fast
+
+Run it from the data-gathering directory, like bot.py.
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import bot
+from analysis_config import config_for
+from host_scheduler import HostScheduler, HostSettings
+from http_cache import ResponseCache
+from http_client import HttpClient, use_shared_client
+from page_facts import PageFacts
+from replay_server import STATS_PATH
+
+
+# The text-metric functions of bot.py whose CPU time is reported; wikitext_metrics includes the next four
+METRIC_FUNCTIONS = ["wikitext_metrics", "scan_wikitext", "warnings", "vdq", "featured_in", "dimension"]
+
+# wikipedia_config.json entry of each list; synthetic titles are analysed with the settings of Uruguay
+LISTS = {"es_298": "es_298", "es_77": "es_77", "synthetic": "es_77"}
+
+# Without --real-limits the per-host limits of host_scheduler.py are lifted, so that the bot and not
+# the politeness towards Wikimedia is measured
+UNLIMITED = HostSettings(initial=64, min=1, max=64, rate=1e9, burst=1e9, healthy_latency=60.0)
+
+
+# This function returns the p-th percentile (0-100) of a list of numbers, nearest rank.
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))]
+
+
+# This class replaces functions of a module by wrappers that add up the CPU time of the calling thread.
+# Used as a context manager, the original functions are put back at the end.
+class FunctionTimers:
+    def __init__(self, module, names):
+        self.module = module
+        self.names = names
+        self.originals = {}
+        self.cpu = {name: 0.0 for name in names}
+        self.calls = {name: 0 for name in names}
+        self.wall = {name: [] for name in names}
+        self.lock = threading.Lock()
+
+    def wrap(self, name, function):
+        def timed(*args, **kwargs):
+            cpu_started = time.thread_time()
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                cpu = time.thread_time() - cpu_started
+                with self.lock:
+                    self.cpu[name] += cpu
+                    self.calls[name] += 1
+                    self.wall[name].append(elapsed)
+        return timed
+
+    def __enter__(self):
+        for name in self.names:
+            self.originals[name] = getattr(self.module, name)
+            setattr(self.module, name, self.wrap(name, self.originals[name]))
+        return self
+
+    def __exit__(self, *exc):
+        for name, function in self.originals.items():
+            setattr(self.module, name, function)
+
+
+# This function starts replay_server.py in its own process, so that its CPU time is not counted, and returns (process, URL).
+def start_server(options):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "replay_server.py"),
+               "--port", "0", "--latency", str(options.latency), "--jitter", str(options.jitter),
+               "--error-rate", str(options.error_rate), "--error-status", str(options.error_status)]
+    if options.recorded:
+        command += ["--recorded", options.recorded]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = server.stdout.readline()
+    if not line.startswith("Replaying at "):
+        server.kill()
+        raise RuntimeError("replay_server.py did not start")
+    return server, line.split("Replaying at ", 1)[1].strip()
+
+
+def server_stats(upstream):
+    with urllib.request.urlopen(upstream + STATS_PATH) as response:
+        return json.load(response)
+
+
+def synthetic_titles(size):
+    return [f"Artículo sintético {number:06d}" for number in range(size)]
+
+
+# This function analyses `titles` with the settings of a wikipedia_config.json entry against the replay server.
+def run(name, key, titles, upstream, options):
+    workdir = tempfile.mkdtemp(prefix="wikicurricula-benchmark-")
+    language_code, country_id = key.rsplit("_", 1)
+
+    client = HttpClient(
+        cache=ResponseCache(os.path.join(workdir, "http_cache.sqlite")),
+        scheduler=HostScheduler(settings=None if options.real_limits else UNLIMITED),
+        upstream=upstream,
+    )
+    latencies = []
+    send = client.request
+
+    def timed_request(url, headers=None):
+        started = time.perf_counter()
+        try:
+            return send(url, headers)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    client.request = timed_request
+    use_shared_client(client)
+
+    # the facts store and the state file of the run are empty, like a first run
+    bot.page_facts = PageFacts(os.path.join(workdir, "page_facts.sqlite"))
+    bot.configure(config_for(language_code, country_id, result_file=os.path.join(workdir, "results.txt"),
+                             progress_every=0, metrics=options.metrics, fast=options.fast))
+
+    before = server_stats(upstream)
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    with FunctionTimers(bot, METRIC_FUNCTIONS + ["analysis"]) as timers:
+        journal = bot.analyse_titles(titles)
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    after = server_stats(upstream)
+
+    bot.page_facts.close()
+    bot.page_facts = None
+    retries = client.scheduler.retries
+    use_shared_client(None)
+    if not options.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    articles = len(journal.entries)
+    requests = after["requests"] - before["requests"]
+    return {
+        "list": name,
+        "config": key,
+        "titles": len(titles),
+        "articles": articles,
+        "seconds": round(wall, 3),
+        "cpu_seconds": round(cpu, 3),
+        "articles_per_second": round(articles / wall, 2) if wall else None,
+        "requests": requests,
+        "requests_per_article": round(requests / articles, 3) if articles else None,
+        "retries": retries,
+        "injected_errors": after["injected_errors"] - before["injected_errors"],
+        "recorded_responses": after["recorded"] - before["recorded"],
+        "synthetic_responses": after["synthetic"] - before["synthetic"],
+        "request_ms": {"p50": milliseconds(percentile(latencies, 50)), "p99": milliseconds(percentile(latencies, 99))},
+        "article_ms": {
+            "p50": milliseconds(percentile(timers.wall["analysis"], 50)),
+            "p99": milliseconds(percentile(timers.wall["analysis"], 99)),
+        },
+        "metric_cpu": {
+            name: {
+                "calls": timers.calls[name],
+                "cpu_seconds": round(timers.cpu[name], 4),
+                "cpu_us_per_article": round(timers.cpu[name] / articles * 1e6, 1) if articles else None,
+                "share_of_cpu": round(timers.cpu[name] / cpu, 4) if cpu else None,
+            }
+            for name in METRIC_FUNCTIONS
+        },
+        "work_directory": workdir if options.keep else None,
+    }
+
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def print_report(result):
+    print(f"\n{result['list']} ({result['config']}): {result['articles']} articles from {result['titles']} titles")
+    print(f"  {result['articles_per_second']} articles/s, {result['seconds']} s wall, {result['cpu_seconds']} s CPU")
+    print(f"  {result['requests_per_article']} requests/article ({result['requests']} requests, {result['retries']} retries, "
+          f"{result['injected_errors']} injected errors, {result['recorded_responses']} recorded / {result['synthetic_responses']} synthetic)")
+    print(f"  request latency p50 {result['request_ms']['p50']} ms, p99 {result['request_ms']['p99']} ms")
+    print(f"  article analysis p50 {result['article_ms']['p50']} ms, p99 {result['article_ms']['p99']} ms")
+    print("  CPU in text metrics:")
+    for name, figures in result["metric_cpu"].items():
+        print(f"    {name:<18} {figures['cpu_seconds']:>9.3f} s  {figures['cpu_us_per_article']:>9} us/article  "
+              f"{figures['calls']:>8} calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark bot.py offline against replay_server.py.")
+    parser.add_argument("lists", nargs="*", choices=list(LISTS), help="title lists to run (default: all)")
+    parser.add_argument("--synthetic-size", type=int, default=100000, help="number of synthetic titles")
+    parser.add_argument("--recorded", metavar="CACHE", help="HTTP cache file of a live run to replay")
+    parser.add_argument("--latency", type=float, default=0.0, help="added latency per request, in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency, in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--real-limits", action="store_true", help="keep the per-host limits of host_scheduler.py")
+    parser.add_argument("--metrics", metavar="NAMES", help="only compute these comma-separated metrics, like bot.py --metrics")
+    parser.add_argument("--fast", action="store_true", help="take the sizes from the page info, like bot.py --fast")
+    parser.add_argument("--keep", action="store_true", help="keep the result, journal and cache files of every run")
+    parser.add_argument("--output", metavar="FILE", help="also write the figures to a JSON file")
+    options = parser.parse_args()
+
+    server, upstream = start_server(options)
+    results = []
+    try:
+        for name in options.lists or list(LISTS):
+            key = LISTS[name]
+            if name == "synthetic":
+                titles = synthetic_titles(options.synthetic_size)
+            else:
+                titles = bot.read_titles(config_for(*key.rsplit("_", 1)).file_to_be_analysed)
+            result = run(name, key, titles, upstream, options)
+            print_report(result)
+            results.append(result)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            json.dump({"options": vars(options), "results": results}, file, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,35 +4,51 @@ This script appears to collect data from Wikipedia and Wikidata,
 process it, and save the results to a file named "resuls.txt". 
 '''
 
-import concurrent.futures
+import argparse
+import glob
+import os
+import queue
+import re
+import threading
 import urllib
 import sys
-import json
-import datetime
-from urllib.request import urlopen
 import urllib.parse
-import chardet
-from datetime import datetime
-from query import store_articles, fetch_wikidata_info, get_id_and_subjects_and_grade
+from query import fetch_bindings, store_query_results
+from http_client import shared_client, map_concurrently
+from mediawiki import fetch_pages, fetch_lengths, batched
+from wikidata import load_entities, Entity
+from pageviews import pageview_summary
+from article_state import ArticleState, state_path
+from wikitext_scanner import scan_wikitext
+from template_matcher import matcher_for, normalise_text, WARNING_CATEGORIES
+from result_writer import ResultWriter
+from journal import Journal, journal_path
+from page_facts import PageFacts
+from dump_reader import dump_pages, normalise_title
+from pageview_dumps import PageviewAggregator
+from result_schema import result_columns, format_row, columnar_path, write_columnar
+from pipeline_metrics import shared_metrics, MetricsReporter, metrics_prefix, METRICS_EVERY
+from profiling import StageProfiler, DEFAULT_FRACTION
+from analysis_config import config_for
+from metric_registry import FetchPlan, METRICS_BY_NAME
 
 
 # Accept 
-if len(sys.argv) > 2:
-   WIKIPEDIA_LANGUAGE_CODE  = sys.argv[1]
-   WIKIDATA_COUNTRY_ID = sys.argv[2]
-else:
-   print("Please provide the wikipedia language and code as a command-line argument (e.g., 'bot.py en 117' for Ghana's curriculum in English wikipedia).")
-   sys.exit(1)
-
-# Open and read the JSON configuration file and access the configuration data as a dictionary
-with open("wikipedia_config.json", "r") as config_file:
-   wikipedia_config = json.load(config_file)
-
-config_key = f"{WIKIPEDIA_LANGUAGE_CODE}_{WIKIDATA_COUNTRY_ID}"
-file_mapping = wikipedia_config.get(config_key)
-if not file_mapping:
-   print("Unsupported language or country code.")
-   sys.exit(1)
+parser = argparse.ArgumentParser(description="Collect metrics about the Wikipedia articles of a national curriculum.")
+parser.add_argument("language", nargs="?", help="Wikipedia language code, e.g. es")
+parser.add_argument("country", nargs="?", help="Wikidata id of the country without the Q, e.g. 77")
+parser.add_argument("--verbose", action="store_true", help="print every result row")
+parser.add_argument("--progress-every", type=int, default=100, help="print a progress line every N articles (0 to disable)")
+parser.add_argument("--resume", action="store_true", help="continue an interrupted run: keep the finished rows of the journal and analyse only the remaining articles")
+parser.add_argument("--dump", metavar="FILE", help="read the articles from a local pages-articles.xml.bz2 dump instead of the MediaWiki API")
+parser.add_argument("--pageview-dumps", metavar="FILE", nargs="+", help="read the pageviews from local pageview dump files (wildcards allowed) instead of the REST API")
+parser.add_argument("--profile", type=float, nargs="?", const=DEFAULT_FRACTION, metavar="FRACTION",
+                    help=f"profile CPU time and allocations of a sampled fraction of the articles (default {DEFAULT_FRACTION})")
+parser.add_argument("--metrics-every", type=int, default=METRICS_EVERY, metavar="SECONDS", help="write the run metrics every N seconds (0: only at the end)")
+parser.add_argument("--metrics", metavar="NAMES", help=f"only compute these comma-separated metrics and skip the requests the others need ({','.join(METRICS_BY_NAME)})")
+parser.add_argument("--fast", action="store_true", help="take the article and talk page sizes (in bytes) from the page info, 50 pages per request, instead of downloading their wikitext")
+parser.add_argument("--dry-run", action="store_true", help="print the number of requests the run would send to every host, without analysing anything")
+
 
 # if WIKIPEDIA_LANGUAGE_CODE in wikipedia_config:
 #    language_config = wikipedia_config[WIKIPEDIA_LANGUAGE_CODE]
@@ -40,144 +56,310 @@ if not file_mapping:
 #    print(f"Configuration not found for language '{WIKIPEDIA_LANGUAGE_CODE}'.") # Handle this case appropriately (e.g, exit the script).
 
 
-id_wikidata = 1,
-dimension = 1,
-first_edit = 1,
-note = 1,
-images = 1,
-views = 1,
-commons_pages =  1,
-commons_gallery = 1,
-itwikisource = 1,
-wikiversity = 1,
-wikibooks = 1,
-featured_in = 1,
-quality = 1,
-review = 1,
-bibliography = 1,
-coordinate = 1,
-incipit_size = 1,
-discussion_size = 1
-
-# Access configuration variables based on the language
-file_to_be_analysed = file_mapping["file_to_be_analysed"]
-result_file = file_mapping["result_file"]
-language = file_mapping["language"]
-discussionURL = file_mapping["discussionURL"]
-warnings_config = file_mapping["warnings_config"]
-featured_template = file_mapping["featured_template"]
-display_window_template = file_mapping["display_window_template"]
-
-# delete the contents of the file before starting
-results = open(result_file,"w")
-results.truncate(0)
-results.close()
-
-
-def main():     
-  
-   article_file, subject_file = file_mapping['article_file'], file_mapping['subject_file']
-   # fetch wikidata info, store article names and get id, subject, grade of article.
-   query_results = fetch_wikidata_info(WIKIPEDIA_LANGUAGE_CODE, WIKIDATA_COUNTRY_ID)
-   store_articles(query_results, article_file )
-   get_id_and_subjects_and_grade(query_results, subject_file)
-   
+# Maximum number of articles analysed at the same time (adjust as needed);
+# the requests of each upstream host are further limited by the adaptive limiter of the HTTP client
+MAX_WORKERS = 16
+
+# running pageview sums read from local dump files, see --pageview-dumps
+pageview_totals = None
+
+# creation dates, QIDs and redirects of the articles seen by earlier runs, they never change
+page_facts = None
+
+# request counts, cache hits, retries, errors and latency histograms of the run, see pipeline_metrics.py
+run_metrics = shared_metrics()
+
+# CPU and memory profile of sampled articles with --profile, a no-op otherwise
+profiler = StageProfiler()
+
+# the selected metrics and the resources they need, see metric_registry.py and --metrics
+fetch_plan = FetchPlan()
+
+
+# This function sets up the module for one analysis; config is an analysis_config.AnalysisConfig. The module
+# holds one configuration at a time, so analyses with different configurations run one after the other.
+def configure(config):
+   global run_config, WIKIPEDIA_LANGUAGE_CODE, result_file, language, discussionURL, warnings_config, featured_template
+   global display_window_template, pageview_windows, dump_file, pageview_totals, article_state, page_facts, profiler, fetch_plan
+
+   run_config = config
+   WIKIPEDIA_LANGUAGE_CODE = config.language_code
+   result_file = config.result_file
+   language = config.language
+   discussionURL = config.discussion_url
+   warnings_config = config.warnings_config
+   featured_template = config.featured_template
+   display_window_template = config.display_window_template
+   pageview_windows = config.pageview_windows
+   dump_file = config.dump_file
+   pageview_totals = None
+   profiler = StageProfiler(config.profile or 0)
+   fetch_plan = FetchPlan(config.metrics, config.fast)
+
+   # revision ids and wikitext metrics of the previous run, used to skip articles that were not edited
+   article_state = ArticleState(state_path(result_file) if result_file else None, {
+      "warnings_config": warnings_config,
+      "featured_template": featured_template,
+      "display_window_template": display_window_template,
+   })
+
+   if page_facts is None:
+      page_facts = PageFacts()
+
+
+# This function turns the parsed command-line arguments into the configuration of their wikipedia_config.json entry.
+def config_from_options(options):
+   config = config_for(
+      options.language, options.country,
+      dump_file=options.dump,
+      pageview_dumps=options.pageview_dumps,
+      resume=options.resume,
+      verbose=options.verbose,
+      progress_every=options.progress_every,
+      metrics_every=options.metrics_every,
+      profile=options.profile or 0,
+   )
+   # --metrics replaces the "metrics" list of the entry, if it has one
+   if options.metrics:
+      config = config._replace(metrics=options.metrics)
+   if options.fast:
+      config = config._replace(fast=True)
+   return config
+
+
+# This function runs the SPARQL query of the configuration and writes the article and subject files.
+# Returns the article names of the query with their QIDs.
+def run_query():
+   # fetch wikidata info page by page, store article names and get id, subject, grade of article in one pass.
+   bindings = fetch_bindings(run_config.language_code, run_config.country_id, run_config.sparql_endpoint)
+   return store_query_results(bindings, run_config.article_file, run_config.subject_file)
+
+
+# This function reads the titles of an article file, whatever its encoding.
+def read_titles(path):
+   # chardet is only needed here, it is not loaded by the scripts that import this module for the analysis
+   import chardet
+
    # Detect the encoding of the file
-   with open(file_to_be_analysed, 'rb') as rawdata:
+   with open(path, 'rb') as rawdata:
       result = chardet.detect(rawdata.read(10000))
 
    # Open the file with the detected encoding
-   with open(file_to_be_analysed, 'r', encoding=result['encoding'], errors="replace") as file:
+   with open(path, 'r', encoding=result['encoding'], errors="replace") as file:
       articles = file.readlines()
-   file.close()
-   # Set the maximum number of concurrent processes (adjust as needed)
-   max_workers = 5
 
-   # Process articles in parallel
-   with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-      executor.map(analysis, articles)
+   return [article.strip() for article in articles if article.strip()]
 
-# Function to get average page views: returns visits since the beginning of time, average dayly visits since the begininning of time, average daily visits in the specified year
-def get_avg_pageviews(article_title, start, end, language):
-   SUM = 0
 
+# Command-line entry point: bot.py <language> <country> [options]
+def main(argv=None):
+   options = parser.parse_args(argv)
+   if options.country is None:
+      print("Please provide the wikipedia language and code as a command-line argument (e.g., 'bot.py en 117' for Ghana's curriculum in English wikipedia).")
+      sys.exit(1)
    try:
-
-      url = "https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/"+language+".wikipedia/all-access/user/"+article_title+"/daily/"+start+"/"+end
-      html = urlopen(url).read()
-      html = str(html)
-      html = html.replace('{"items":[',"")
-      html = html.replace(']}',"")
-      n = html.count("}")
-
-
-      for i in range(n):
-
-         txt = html[:html.find("}")+1]
-         SUM += int(txt[txt.find('"views":')+len('"views":'):-1])
-         html =html.replace(txt,"",1)
-      
-      d1 = datetime.strptime(start, "%Y%m%d")
-      d2 = datetime.strptime(end, "%Y%m%d")
-      days = (abs((d2 - d1).days)+1)
-      result = str(int(round((SUM/days),0)))
-
-   except:
-      result = "ERROR"
-   
-   return result
-
-# This function returns visits since the beginning of time, average dayly visits since the begininning of time, average daily visits in the specified year
+      configure(config_from_options(options))
+   except ValueError as error:
+      print(error)
+      sys.exit(1)
+
+   if options.dry_run:
+      dry_run()
+      return
+
+   article_qids = run_query()
+   titles = read_titles(run_config.file_to_be_analysed)
+   analyse_titles(titles, qids_by_title(article_qids) if dump_file else None)
+
+   page_facts.close()
+   if shared_client().cache is not None:
+      print(shared_client().cache.summary())
+   print(f"HTTP retries: {shared_client().scheduler.retries}")
+   print(f"Run metrics written to {metrics_prefix(result_file)}_metrics.prom and _metrics.json")
+
+
+# This function prints the requests a run of the configuration would send to every host, see --dry-run.
+# The article file of an earlier query is used when there is one, otherwise the query runs first.
+def dry_run():
+   if not os.path.exists(run_config.file_to_be_analysed):
+      run_query()
+   titles = set(read_titles(run_config.file_to_be_analysed))
+   planned = fetch_plan.planned_requests(len(titles), language, dump_file, run_config.pageview_dumps)
+
+   print(f"Planned requests for {len(titles)} titles ({fetch_plan.describe()}):")
+   for host, count in sorted(planned.items()):
+      print(f"   {host:<24} {count:>8}")
+   print(f"   {'total':<24} {sum(planned.values()):>8}")
+   print("These are upper bounds: cached responses, unedited articles, redirects and known creation dates are not requested again.")
+
+
+# Library entry point: analyses `titles` with `config` (an analysis_config.AnalysisConfig) and yields the record
+# of every distinct page (column name -> value, see result_schema.py) in the order of `titles`.
+# Nothing is written next to the result file; the HTTP cache and the facts store are shared with every other run
+# of the process. qids (title -> QID) is only needed with a dump_file.
+def analyze(titles, config, qids=None):
+   configure(config)
+   titles = list(titles)
+   if config.pageview_dumps and fetch_plan.needs("pageviews"):
+      load_pageview_dumps(titles, config.pageview_dumps)
+
+   # the analysis runs on worker threads, its records come back through a queue
+   finished = queue.Queue()
+
+   def run():
+      try:
+         analyse_pages(page_source(titles, qids), lambda number, page, record: finished.put((number, record)))
+      except Exception as error:
+         finished.put((None, error))
+      else:
+         finished.put((None, None))
+
+   threading.Thread(target=run, name="analyze", daemon=True).start()
+   pending = {}
+   next_number = 0
+   while True:
+      number, record = finished.get()
+      if number is None:
+         if record is not None:
+            raise record
+         return
+      pending[number] = record
+      while next_number in pending:
+         record = pending.pop(next_number)
+         next_number += 1
+         # failed analyses and alias pages have no record
+         if record is not None and not isinstance(record, Exception):
+            yield record
+
+
+# This function analyses `titles` and writes one row per distinct page to the result file, in the order of `titles`.
+# qids (title -> QID) is only needed with --dump. Returns the closed journal, whose entries hold every row.
+def analyse_titles(titles, qids=None):
+   first_index = {}
+   for index, title in enumerate(titles):
+      first_index.setdefault(title, index)
+
+   # Every finished row goes to the journal; with --resume the rows finished by the interrupted run are kept
+   journal = Journal(journal_path(result_file), resume=run_config.resume)
+   done_titles = journal.done_titles()
+   done_pages = journal.done_pages()
+   remaining = [title for title in titles if title not in done_titles]
+   if run_config.resume:
+      print(f"Resuming: {len(journal.entries)} articles already finished, {len(remaining)} titles left")
+      article_state.carry_over(done_pages)
+
+   if run_config.pageview_dumps and fetch_plan.needs("pageviews"):
+      load_pageview_dumps(remaining, run_config.pageview_dumps)
+
+   # a title left over by the journal may redirect to a page that was already finished, it is only journaled as its alias
+   pages = (page._replace(alias=True) if page.title in done_pages else page for page in page_source(remaining, qids))
+
+   # Every record becomes a row of the tab-separated file and, at the end, of the columnar file
+   columns = result_columns(warnings_config)
+
+   # A single writer thread owns the result file and writes the rows in the order of the input file
+   # (pages come out of a dump in the order of the dump, their rows are sorted at the end)
+   writer = ResultWriter(result_file, ordered=not dump_file, progress_every=run_config.progress_every, verbose=run_config.verbose)
+   # The metrics are written next to the result file every --metrics-every seconds and at the end
+   reporter = MetricsReporter(run_metrics, metrics_prefix(result_file), run_config.metrics_every)
+
+   def write(number, page, record):
+      if record is None:
+         # the titles of an alias page belong to the row of a page analysed before
+         journal.add_titles(page.title, page.sources)
+      if record is None or isinstance(record, Exception):
+         writer.put(number, None)
+         return
+      row = format_row(record, columns)
+      # the row of a page that could not be fetched is written but not journaled, --resume sends its titles again
+      journal.record(first_index[page.sources[0]], page.title, page.sources, row, record, retry=record.get("failed", False))
+      writer.put(number, row)
+
+   analyse_pages(pages, write)
+   writer.close()
+   journal.close()
+
+   if run_config.resume or dump_file:
+      # put the rows of both runs back in the order of the input file
+      with open(result_file, "w", encoding="utf-8", errors="replace") as results:
+         results.write("".join(row + "\n" for row in journal.rows_in_order()))
+
+   write_columnar(columnar_path(result_file), journal.records_in_order(columns), columns, run_config.subject_file)
+   article_state.save()
+   reporter.stop()
+   if profiler.enabled:
+      print(f"Profile written to {profiler.write(metrics_prefix(result_file))}")
+   return journal
+
+
+# This function returns the pages of `titles`, from the dump of the configuration or from the MediaWiki API.
+def page_source(titles, qids=None):
+   if dump_file:
+      # Stream the dump once, keeping only the pages of the articles to analyse; the QIDs come from the query results
+      return with_known_qids(dump_pages(dump_file, titles, qids))
+   # Resolve titles, redirects, QIDs and wikitext 50 articles per request; titles redirecting to the same page come out once.
+   # The wikitext is only downloaded when a selected metric needs it
+   return fetch_pages(titles, language, known_revisions=article_state.known_revisions(), content=fetch_plan.needs("wikitext"))
+
+
+# This function reads the pageviews of `titles` from local dump files, in one pass for the input titles
+# and the canonical titles seen by earlier runs.
+def load_pageview_dumps(titles, patterns):
+   global pageview_totals
+   known = (page_facts.lookup_title(language, title) for title in titles)
+   wanted = set(titles) | {fact[1] for fact in known if fact}
+   paths = [path for pattern in patterns for path in (glob.glob(pattern) or [pattern])]
+   with run_metrics.measure("pageview_dumps"), profiler.stage("pageview_dumps", sample=False):
+      pageview_totals = PageviewAggregator(wanted, language, pageview_windows).add_files(paths)
+   print(f"Pageviews read from {pageview_totals.files} of {len(paths)} dump files")
+
+
+# This function analyses pages on MAX_WORKERS threads and calls handle(number, page, record) as each one finishes,
+# numbering the pages in the order they come; record is the exception when the analysis failed, None for an alias page.
+def analyse_pages(pages, handle):
+   def analyse(item):
+      number, (page, entity) = item
+      if page.alias:
+         # more titles of a page analysed before: only its redirects are stored
+         if page.pageid and page.qid:
+            page_facts.remember_page(language, page.pageid, page.title, page.qid, page.sources)
+         handle(number, page, None)
+         return
+      if page.failed:
+         # its page info could not be loaded: the row is left empty, it is not an article that does not exist
+         run_metrics.count("articles_total", {"outcome": "failed"})
+         handle(number, page, {"article": page.title.replace(" ", "_"), "failed": True})
+         return
+      try:
+         with profiler.stage("analysis"):
+            record = analysis(page, entity)
+      except Exception as error:
+         run_metrics.count("articles_total", {"outcome": "failed"})
+         print(f"Failed to analyse {page.title}: {error}")
+         handle(number, page, error)
+         return
+      run_metrics.count("articles_total", {"outcome": "missing" if record.get("missing") else "analysed"})
+      handle(number, page, record)
+
+   # Process articles concurrently, all requests share the keep-alive connections of one client
+   # (the entities and the talk page lengths are only loaded when a selected metric needs them)
+   if fetch_plan.needs("talk_length") and not dump_file:
+      pages = with_talk_lengths(pages)
+   pairs = ((page, None) for page in pages) if dump_file or not fetch_plan.needs("entity") else with_entities(pages)
+   map_concurrently(analyse, enumerate(pairs), MAX_WORKERS)
+
+
+# This function returns visits since the beginning of time, average dayly visits since the begininning of time,
+# average daily visits in the previous year and average daily visits in the current year.
+# The windows come from the optional "pageview_windows" entry of wikipedia_config.json.
+@run_metrics.timed("visit")
 def visit(article, language):
-
-   #YYYYMMGG Date Format
-   START_ALL_TIME = "20150701"; 
-   START_PREV_YEAR = "20230101"; 
-   END_PREV_YEAR = "20231231"; 
-   START_CURRENT_YEAR = "20240101"; 
-   END_CURRENT_YEAR   = "20240531"; 
-
-   DATE = []
-
-
-   #calculate result1, total pageviews since the beginning of time, and result2, average pageviews since de beginning of time
-   d1 = datetime.strptime(START_ALL_TIME, "%Y%m%d")
-   d2 = datetime.strptime(END_CURRENT_YEAR, "%Y%m%d")
-   days = (abs((d2 - d1).days)+1)
-   ARTICLE = article.replace(" ","_")
-
-   SUM = 0
-
-   try:
-
-      url ="https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/"+language+".wikipedia/all-access/user/"+ARTICLE+"/daily/"+START_ALL_TIME +"/" + END_CURRENT_YEAR
-      html = urlopen(url).read()
-      ecc = 0 # to change
-      if ecc == 0:
-         html = str(html)
-         html = html.replace('{"items":[',"")
-         html = html.replace(']}',"")
-         n = html.count("}")
-
-         for i in range(n):
-            txt = html[:html.find("}")+1]
-            SUM += int(txt[txt.find('"views":')+len('"views":'):-1])
-            html =html.replace(txt,"",1)
-
-         result1 = str(SUM)
-         result2 = str(int(round((SUM/days),0)))
-
-   except:
-      result1 = "ERROR"
-      result2 = "ERROR"
-
-   #calculate result3, average pageviews from previous year
-   result3 = get_avg_pageviews(article, START_PREV_YEAR, END_PREV_YEAR, language)
-
-   #calculate result4, average pageviews from current year
-   result4 = get_avg_pageviews(article, START_CURRENT_YEAR, END_CURRENT_YEAR, language)
-   
-   return str(result1), str(result2), str(result3), str(result4)
+   if pageview_totals is not None and article in pageview_totals:
+      return pageview_totals.summary(article)
+   if dump_file:
+      # pageviews are not part of the dump
+      return "", "", "", ""
+   return pageview_summary(article, language, pageview_windows)
 
 
 
@@ -191,7 +373,7 @@ def nome2Q(item):
 
 #This function counts the number of times the substring "</ref>" appears within the input string "text" and converts the count (which is an integer) into a string
 def note(text):
-   return str(text.count('</ref>'))
+   return str(scan_wikitext(text).notes)
 
 
 
@@ -203,19 +385,18 @@ def dimension(text):
 
 # this function counts the occurrences of specific image file extensions within a given string and returns that count as a string.
 def images(text):
-   t = text.lower()
-   img = str(t.count('.jpg')+t.count('.svg')+t.count('.jpeg')+t.count('.png')+t.count('.tiff')+t.count('.gif')+t.count('.tif')+t.count('.xcf'))
-   return img
+   return str(scan_wikitext(text).images)
 
 '''This function relies on external web scraping 
 it reads the HTML content of the page and converts it's content to a string and then extracts a specific portion of the HTML using string manipulation. 
 Specifically, it looks for the substring "created_at" and extracts the following 10 characters, which should represent the creation date of the Wikipedia article.'''
 
+@run_metrics.timed("first_edit")
 def first_edit(article, language):
    try:
 
       url ="https://xtools.wmflabs.org/api/page/articleinfo/"+language+".wikipedia.org/"+article.replace(" ","_")
-      html = urlopen(url).read()
+      html = shared_client().get(url)
 
       html = str(html)
 
@@ -230,122 +411,54 @@ def first_edit(article, language):
    return html
 
 
+# This function returns the creation date of a page, asking XTools only for pages not in the facts store.
+@run_metrics.timed("creation_date")
+def creation_date(page, article2):
+   created = page_facts.creation_date(language, page.pageid)
+   if created is None and dump_file:
+      return ""
+   if created is None:
+      created = first_edit(article2, language)
+      # errors and unexpected answers are not stored, they are retried by the next run
+      if re.fullmatch(r"\d{4}-\d{2}-\d{2}", created):
+         page_facts.remember_creation(language, page.pageid, created)
+   return created
+
+
 
 
 # This function analyzes and count specific types of tags within a given text. The results are returned as strings, making them suitable for further processing.
 
+@run_metrics.timed("warnings")
 def warnings(t): 
 
-   t_tmp =t
-   t = t.replace("\n","")
-   t = t.replace(" ","")
-   t = t.lower()
    # tmp  == template
-    
-   with open("language_template_config.json", "r") as config_file:
-      language_template_config = json.load(config_file)
-
-   if WIKIPEDIA_LANGUAGE_CODE in language_template_config:
-      language_config = language_template_config[WIKIPEDIA_LANGUAGE_CODE]
-   else:
-      print(f"Configuration not found for language '{WIKIPEDIA_LANGUAGE_CODE}'.") # Handle this case appropriately (e.g, exit the script).
-
-   tmp_to_check = sum(t.count(template) for template in language_config.get("to_check"))
-   tmp_synoptic = sum(t.count(template) for template in language_config.get("synoptic"))
-   tmp_correct = sum(t.count(template) for template in language_config.get("correct"))
-   tmp_curiosity = sum(t.count(template) for template in language_config.get("curiosity"))
-   tmp_divide = sum(t.count(template) for template in language_config.get("divide")) 
-   tmp_sources = sum(t.count(template) for template in language_config.get("sources"))
-   tmp_localism = sum(t.count(template) for template in language_config.get("localism"))
-   tmp_pov = sum(t.count(template) for template in language_config.get("pov"))
-   tmp_nn = sum(t.count(template) for template in language_config.get("nn"))
-   tmp_recentism = sum(t.count(template) for template in language_config.get("recentism"))
-   tmp_manual_style = sum(t.count(template) for template in language_config.get("manual_style"))
-   tmp_translation = sum(t.count(template) for template in language_config.get("translation"))
-   tmp_wikificare = sum(t.count(template) for template in language_config.get("wikificare")) 
-   tmp_stub = sum(t.count(template) for template in language_config.get("stub"))
-   tmp_stub_section = sum(t.count(template) for template in language_config.get("stub_section"))
-   tmp_copy_control = sum(t.count(template) for template in language_config.get("copy_control"))
-
-   sum_of_warnings = tmp_to_check + tmp_synoptic + tmp_correct + tmp_curiosity + tmp_divide + tmp_sources + tmp_localism + tmp_pov
-   sum_of_warnings += tmp_nn + tmp_recentism + tmp_manual_style + tmp_translation + tmp_wikificare + tmp_stub + tmp_stub_section + tmp_copy_control
-
-
-   tmp_without_sources = sum(t.count(template) for template in language_config.get("without_sources"))
-   tmp_to_clarify = sum(t.count(template) for template in language_config.get("clarify"))
-
-   return str(sum_of_warnings), str(tmp_without_sources), str(tmp_to_clarify)
-
-
-
-
-# This function is designed to iteratively find and extract templates from a text until no more templates are present
-def find_template(text):
+   # the configuration is loaded and compiled once per process, the text is then scanned once for every category
+   matcher = matcher_for(WIKIPEDIA_LANGUAGE_CODE)
+   counts = matcher.count_categories(normalise_text(t))
 
-   tmp = text[2:]
-   tmp2 = text[2:]
-   tmp = tmp[:tmp.find("}}")+2]
+   sum_of_warnings = sum(counts.get(category, 0) for category in WARNING_CATEGORIES)
 
-   if "{{" in tmp:
+   tmp_without_sources = counts.get("without_sources", 0)
+   tmp_to_clarify = counts.get("clarify", 0)
 
-      tmp3 = tmp[tmp.find("{{"):]
-      tmp2 = tmp2.replace(tmp3,"$$$$$$$$$$$$$$")
-
-
-      tmp2 = tmp2[:tmp2.find("}}")+2]
-      tmp2 = tmp2.replace("$$$$$$$$$$$$$$",tmp3)
-
-      return tmp2
-   return tmp
+   return str(sum_of_warnings), str(tmp_without_sources), str(tmp_to_clarify)
 
 
 
 
 # Function to calculate the length of the introduction
 #Incipit means the opening of a manuscript, early printed book. Hence, incipit == introduction 
+# Templates (nested ones included), <ref> tags and link markup are not counted, see wikitext_scanner.py
+@run_metrics.timed("calculate_introduction_length")
 def calculate_introduction_length(text):
-   incipit = text
-   incipit = incipit[:incipit.find("\n==")]
-   template_count  =incipit.count('{{')
-
-   # incipitclear = incipit
-   format_num = incipit.count("{{formatnum:")
-
-   for i in range(format_num):
-      tmp = incipit[incipit.find("{{formatnum:"):]
-      tmp = tmp[:tmp.find("}}")+2]
-      tmp2 = tmp.replace("{{formatnum:","")
-
-      tmp2 = tmp2.replace("}}","")
-      incipit = incipit.replace(tmp, tmp2)
-
-   template_count = incipit.count("{{")
-
-   for i in range(template_count):
-      text = incipit[incipit.find("{{"):]
-      template = find_template(text)
-      text = text.replace("{{"+template,"")
-      incipit = incipit.replace("{{"+template,"")
-   incipit = incipit.replace("</ref>","")
-
-   n = incipit.count("<ref")
-
-   for i in range(n):
-
-      tmp = incipit[incipit.find("<ref"):]
-      tmp = tmp[:tmp.find(">")+1]
-      incipit = incipit.replace(tmp,"")
-
-   incipit = incipit.replace("[[","")
-   incipit = incipit.replace("]]","")
-   incipit = incipit.replace("|","")
-   introduction_length = len(incipit)
-   return str(introduction_length)
+   return str(scan_wikitext(text).intro_length)
 
 
 
 
 # Function to check if the article is a "good article"
+@run_metrics.timed("vdq")
 def vdq(text, display_window_template):
    if display_window_template in text.lower():
       return "1"
@@ -355,6 +468,7 @@ def vdq(text, display_window_template):
 
 
 # This function checks to if a specific template (defined by the featured_template variable) is present in the provided text.
+@run_metrics.timed("featured_in")
 def featured_in(text, featured_template):
    if featured_template in text.lower():
       return "1"
@@ -363,158 +477,150 @@ def featured_in(text, featured_template):
       return "0"
 
     
-# Main analysis function
-def analysis(article):
-   # Remove the newline character at the end of the article
-   article = article[:-1]
-   article= article.replace(" ","_") # Wikipedia page titles are case-sensitive and spaces in page titles should be replaced with underscores.
-   result = ""
-   wikitext = ""
-
-   article2 = urllib.parse.quote(article) 
-   article = article.replace(" ","_")
-
+# This function computes every metric that only depends on the wikitext of the article.
+# The results are kept in the state file and reused as long as the article is not edited.
+@run_metrics.timed("wikitext_metrics")
+def wikitext_metrics(wikitext):
+   # size, images, notes and introduction length come from a single scan of the text
+   with run_metrics.measure("scan_wikitext"):
+      scan = scan_wikitext(wikitext)
+   return {
+      "dimension": str(scan.size),
+      "images": str(scan.images),
+      "note": str(scan.notes),
+      "warnings": list(warnings(wikitext)) if warnings_config else [],
+      "incipit_size": str(scan.intro_length),
+      "vdq": vdq(wikitext, display_window_template),
+      "featured_in": featured_in(wikitext, featured_template),
+   }
+
+
+# Wikitext metrics of the articles whose wikitext is not downloaded because no selected metric needs it
+NO_WIKITEXT_METRICS = {
+   "dimension": None, "images": None, "note": None, "warnings": [None, None, None],
+   "incipit_size": None, "vdq": None, "featured_in": None,
+}
+
+
+# This function keys the QIDs of the SPARQL results by the titles used in the dump.
+def qids_by_title(article_qids):
+   return {normalise_title(name): qid for name, qid in article_qids.items() if qid}
+
+
+# This function completes the QIDs of dump pages with the ones recorded in the facts store by earlier runs.
+def with_known_qids(pages):
+   for page in pages:
+      if not page.missing and not page.qid:
+         known = page_facts.lookup_title(language, page.title)
+         if known:
+            page = page._replace(qid=known[2])
+      yield page
+
+
+# This function loads the Wikidata entities of the pages 50 at a time and yields (page, entity) pairs.
+def with_entities(pages):
+   for batch in batched(pages, 50):
+      with profiler.stage("entities"):
+         entities = load_entities(page.qid for page in batch if page.qid and not page.alias)
+      for page in batch:
+         yield page, entities.get(page.qid)
+
+
+# This function adds the length of their talk page to the pages, 50 pages per request (--fast).
+# The length stays None when its request failed, the discussion_size column of the page is then left empty.
+def with_talk_lengths(pages):
+   talk_prefix = urllib.parse.unquote(discussionURL)
+   for batch in batched(pages, 50):
+      titles = (talk_prefix + page.title for page in batch if not (page.missing or page.alias or page.failed))
+      # counted as talk page requests in the metrics, like the action=parse requests of the full mode
+      lengths = fetch_lengths(titles, language, kind="talk")
+      for page in batch:
+         yield page._replace(talk_length=lengths.get(talk_prefix + page.title))
+
+
+# This function returns the wikitext of the talk page of an article, "" when it has none.
+@run_metrics.timed("discussion")
+def discussion(article2):
    try:
-      # Construct the Wikipedia API URL for parsing wikitext
+      url = "https://"+language+".wikipedia.org/w/api.php?action=parse&page=" + discussionURL + article2 + "&prop=wikitext&formatversion=2&format=json&maxlag=5"
+      data = shared_client().get_json(url)
 
-      url = "https://"+language+".wikipedia.org/w/api.php?action=parse&page=" + article2 + "&prop=wikitext&formatversion=2&format=json"
-      json_url = urlopen(url)
-
-      data = json.loads(json_url.read())
-
-      wikitext = data["parse"]["wikitext"]
-      if "#RINVIA"  in wikitext or "#REDIRECT" in wikitext:
-         article2 = wikitext[wikitext.find("[[")+2:]
-         article2 = article2[:article2.find("]]")]
-         article = article2
-         article2 = article2.replace("_"," ")
+      return data["parse"]["wikitext"]
 
    except:
-      pass                                     
-
-   try:
-      article2 = urllib.parse.quote(article)
-      article = article.replace(" ","_")
-      
-      url = "https://"+language+".wikipedia.org/w/api.php?action=query&titles=" + article2 +"&prop=pageprops&format=json&formatversion=2"
-
-      json_url = urlopen(url)
-      data = json.loads(json_url.read())
-      wikidataid = data["query"]["pages"][0]["pageprops"]["wikibase_item"]
-
-      url ="https://www.wikidata.org/wiki/Special:EntityData/"+wikidataid+".json"
-
-      json_url = urlopen(url)
-      wikidata = json.loads(json_url.read())
-
-
+      return ""
 
-      url = "https://"+language+".wikipedia.org/w/api.php?action=parse&page=" + article2 + "&prop=wikitext&formatversion=2&format=json"
 
-      json_url = urlopen(url)
+# This function returns the size of the talk page: its byte length in fast mode, else the length of its wikitext.
+# None when it is not known (not selected, or a dump run).
+def discussion_size(page, wikitext_discussion):
+   if page.talk_length is not None:
+      return str(page.talk_length)
+   if wikitext_discussion is not None:
+      return dimension(wikitext_discussion)
+   return None
 
-      data = json.loads(json_url.read())
 
-      wikitext = data["parse"]["wikitext"]
+# Main analysis function, receives a mediawiki.Page already resolved by the batch fetcher and its wikidata.Entity.
+# Returns the record of the article (column name -> value, see result_schema.py), rendered to a row by analyse_titles().
+@run_metrics.timed("analysis")
+def analysis(page, entity):
+   article = page.title.replace(" ","_") # Wikipedia page titles are case-sensitive and spaces in page titles should be replaced with underscores.
+   article2 = urllib.parse.quote(article)
+   wikitext = page.wikitext or ""
 
-
-
-      try:
-         url = "https://"+language+".wikipedia.org/w/api.php?action=parse&page=" + discussionURL + article2 + "&prop=wikitext&formatversion=2&format=json"
-         json_url = urlopen(url)
-
-         data = json.loads(json_url.read())
-
-         wikitext_discussion = data["parse"]["wikitext"]
-
-      except:
-         wikitext_discussion = ""
-
-      result = result + article + "\t"
-
-      result = result + wikidataid + "\t"
+   try:
+      if page.missing or not page.qid:
+         raise ValueError("page without wikidata item")
+      wikidataid = page.qid
+      page_facts.remember_page(language, page.pageid, page.title, wikidataid, page.sources)
+      entity = entity or Entity(wikidataid, "", "", "", "", "")
+
+      # Articles that were not edited since the last run keep their wikitext metrics, their wikitext was not even downloaded
+      if fetch_plan.needs("wikitext"):
+         metrics = article_state.reuse(page.title, page.revid)
+         if metrics is None:
+            metrics = wikitext_metrics(wikitext)
+            article_state.update(page.title, page.revid, metrics)
+      else:
+         # no selected metric needs the wikitext: it was not downloaded, the stored metrics are kept for the next run
+         article_state.carry_over([page.title])
+         metrics = NO_WIKITEXT_METRICS
+
+
+      # talk pages are not part of a pages-articles dump
+      wikitext_discussion = discussion(article2) if fetch_plan.needs("talk") and not dump_file else None
 
    except:
-      result = result + article +"\t" +"non-existent article"
-
-      
-
-   else:
-
-      if first_edit:
-         result = result + first_edit(article2, language) + "\t"
-
-      if dimension:
-         result = result + dimension(wikitext) + "\t"
-
-      if images:
-         result = result + images(wikitext) + "\t"
-
-      if note:
-         result = result + note(wikitext) + "\t"
-
-         
-
-      if warnings_config:
-         for i in warnings(wikitext):
-            print("some warnings")
-            result = result + i + "\t"   
-
-      if discussion_size:
-         result = result + dimension(wikitext_discussion) + "\t"
-
-      if incipit_size:
-         result = result + calculate_introduction_length(wikitext) + "\t"
-
-
-      if visit:
-         for i in visit(article2, language):
-            result = result + i + "\t"
-
-      if vdq:
-         result = result + vdq(wikitext, display_window_template) + "\t"
-
-
-      if featured_in:
-         result = result + featured_in(wikitext, featured_template) + "\t"
-
-
-
-      if commons_gallery:
-         try:
-            result = result + wikidata["entities"][wikidataid]["claims"]["P373"][0]["mainsnak"]["datavalue"]["value"] + "\t"
-         except:
-            result = result + "" + "\t"
-
-
-
-      if commons_pages:
-         try:
-            result = result + wikidata["entities"][wikidataid]["claims"]["P935"][0]["mainsnak"]["datavalue"]["value"] + "\t"
-         except:
-            result = result + "" + "\t"
-
-
-      if itwikisource:
-         try:
-            result = result + wikidata["entities"][wikidataid]["sitelinks"]["itwikisource"]["title"] + "\t"
-         except:
-
-            result = result + "\t"
-
-      if coordinate:
-         try:
-            result = result + wikidata["entities"][wikidataid]["claims"]["P625"][0]["mainsnak"]["datavalue"]["value"]["latitude"] + "\t"
-            result = result + wikidata["entities"][wikidataid]["claims"]["P625"][0]["mainsnak"]["datavalue"]["value"]["longitude"] + "\t"
-         except:
-            result = result + "\t" + "\t"
-
-   # Open the "results.txt" file in append mode
-   results = open(result_file, 'a', encoding='utf-8', errors="replace")  # open the file in append mode
-   
-   results.write(result + "\n")  # add a line break after each result
-   results.close()  # close the file
-   print (result)
+      return {"article": article, "missing": True}
+
+   record = {
+      "article": article,
+      "id_wikidata": wikidataid,
+      "first_edit": creation_date(page, article2) if fetch_plan.needs("xtools") else None,
+      # in fast mode the size is the byte length of the page info, the wikitext may not even be downloaded
+      "size": str(page.length) if fetch_plan.fast and page.length is not None else metrics["dimension"],
+      "images": metrics["images"],
+      "notes": metrics["note"],
+      "discussion_size": discussion_size(page, wikitext_discussion),
+      "incipit_size": metrics["incipit_size"],
+      "VdQ": metrics["vdq"],
+      "vetrina": metrics["featured_in"],
+      "commonsGallerys": entity.commons_gallery,
+      "commonsPage": entity.commons_pages,
+      "page_on_wikisource": entity.wikisource,
+      "latitude": entity.latitude,
+      "longitude": entity.longitude,
+   }
+
+   if warnings_config:
+      record["issues"], record["issue_sourceNeeded"], record["issue_clarify"] = metrics["warnings"]
+
+   if fetch_plan.needs("pageviews"):
+      record["all_visits"], record["avg_pv_all_time"], record["avg_pv_prev"], record["avg_pv"] = visit(article, language)
+
+   # the columns of the metrics that are not selected are left empty
+   return fetch_plan.keep_selected(record)
 
 if __name__ == "__main__":
    main()
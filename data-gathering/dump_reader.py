@@ -0,0 +1,135 @@
+'''
+Offline access to a MediaWiki XML dump (for example eswiki-20240601-pages-articles.xml.bz2).
+The dump is streamed with constant memory: every <page> element is dropped as soon as it
+has been read, and only the pages of the requested titles are turned into mediawiki.Page
+records, so that bot.py can analyse a whole country without calling the API.
+'''
+
+import bz2
+import gzip
+import xml.etree.ElementTree as ET
+
+from mediawiki import Page
+
+
+# Redirect chains longer than this are reported as missing pages, like the API does for loops
+MAX_REDIRECT_PASSES = 3
+
+
+def open_dump(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+# Tags come with the namespace of the export schema version, e.g. {http://www.mediawiki.org/xml/export-0.10/}page
+def local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+# This function turns an input title into the form used by the dump: spaces and an upper case first letter.
+def normalise_title(title):
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+# This function reads the fields bot.py needs from a <page> element.
+# Returns (title, pageid, revid, redirect target or None, wikitext).
+def page_fields(element):
+    title = redirect = text = None
+    pageid = revid = None
+    for child in element:
+        tag = local_name(child.tag)
+        if tag == "title":
+            title = child.text
+        elif tag == "id":
+            pageid = int(child.text)
+        elif tag == "redirect":
+            redirect = child.get("title")
+        elif tag == "revision":
+            for field in child:
+                name = local_name(field.tag)
+                if name == "id":
+                    revid = int(field.text)
+                elif name == "text":
+                    text = field.text or ""
+    return title, pageid, revid, redirect, text
+
+
+# This function streams the dump once and yields the fields of the pages whose title is in `wanted`.
+# `wanted` may grow while the dump is read, e.g. with the targets of the redirects found on the way.
+def scan_dump(path, wanted):
+    with open_dump(path) as dump:
+        context = ET.iterparse(dump, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or local_name(element.tag) != "page":
+                continue
+            fields = page_fields(element)
+            # the finished page is detached from the tree, which would otherwise hold the whole dump
+            root.clear()
+            if fields[0] in wanted:
+                yield fields
+
+
+# This function yields one Page per distinct page of `titles` found in the dump at `path`.
+# Pages come out in the order of the dump and titles that redirect to the same page are merged into its sources;
+# like mediawiki.fetch_pages, titles found after their page was yielded come out as an alias Page of it.
+# A redirect target that comes before its redirect in the dump is picked up by another pass.
+# qids (canonical title -> QID) fills the Page.qid field, which the dump does not contain.
+def dump_pages(path, titles, qids=None):
+    qids = qids or {}
+    # input titles waiting for their page, by the title currently expected in the dump
+    waiting = {}
+    for title in titles:
+        if title.strip():
+            waiting.setdefault(normalise_title(title), []).append(title.strip())
+
+    found = {}
+    scanned = set()
+    looking_for = set(waiting)
+
+    for _ in range(MAX_REDIRECT_PASSES):
+        complete = set(looking_for)
+        for title, pageid, revid, redirect, text in scan_dump(path, looking_for):
+            sources = waiting.pop(title, [])
+            if redirect is not None:
+                if redirect in found:
+                    if sources:
+                        yield found[redirect]._replace(sources=sources, alias=True)
+                else:
+                    waiting.setdefault(redirect, []).extend(sources)
+                    if redirect not in scanned:
+                        looking_for.add(redirect)
+                continue
+            if title in found:
+                if sources:
+                    yield found[title]._replace(sources=sources, alias=True)
+                continue
+
+            page = Page(
+                title=title,
+                pageid=pageid,
+                revid=revid,
+                qid=qids.get(title),
+                wikitext=text,
+                sources=sources,
+                missing=False,
+                length=len(text.encode("utf-8")),
+            )
+            # the text is not kept so that it can be released once the page is analysed
+            found[title] = page._replace(wikitext=None)
+            yield page
+
+        # titles added during the pass were only looked for in the part of the dump after their redirect
+        scanned |= complete
+        looking_for = {title for title in waiting if title not in scanned}
+        if not looking_for:
+            break
+
+    # titles that are not in the dump, or whose redirect chain is too long
+    for title, sources in waiting.items():
+        if sources:
+            yield Page(title, None, None, None, None, sources, True)
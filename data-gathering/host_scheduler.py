@@ -0,0 +1,167 @@
+'''
+Per-host concurrency and rate limiting for the HTTP client.
+Every upstream host gets its own concurrency limit, adapted AIMD-style (additive
+increase while responses are fast, halved when the host throttles), and a token
+bucket. Throttled and failed requests are retried with jittered exponential
+backoff, honouring Retry-After and MediaWiki maxlag.
+'''
+
+import http.client
+import random
+import threading
+import time
+from collections import namedtuple
+
+
+# initial/min/max: concurrent requests, rate: requests per second, burst: token bucket size,
+# healthy_latency: seconds under which a response lets the limit grow
+HostSettings = namedtuple("HostSettings", ["initial", "min", "max", "rate", "burst", "healthy_latency"])
+
+DEFAULT_SETTINGS = HostSettings(initial=4, min=1, max=16, rate=20.0, burst=20, healthy_latency=2.0)
+
+# Matched against the end of the host name
+HOST_SETTINGS = {
+    "wikipedia.org": HostSettings(initial=4, min=1, max=16, rate=25.0, burst=25, healthy_latency=2.0),
+    "wikidata.org": HostSettings(initial=4, min=1, max=12, rate=20.0, burst=20, healthy_latency=2.0),
+    "wikimedia.org": HostSettings(initial=6, min=1, max=24, rate=50.0, burst=50, healthy_latency=1.0),
+    # the XTools API is slow and asks tools to be gentle
+    "xtools.wmflabs.org": HostSettings(initial=2, min=1, max=4, rate=2.0, burst=4, healthy_latency=10.0),
+    "xtools.wmcloud.org": HostSettings(initial=2, min=1, max=4, rate=2.0, burst=4, healthy_latency=10.0),
+}
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+# HTTP statuses that mean "slow down" or a temporary failure of the upstream
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+
+def settings_for(host):
+    host = host.split(":")[0].lower()
+    for suffix, settings in HOST_SETTINGS.items():
+        if host == suffix or host.endswith("." + suffix):
+            return settings
+    return DEFAULT_SETTINGS
+
+
+# This function reads a Retry-After header given in seconds; HTTP dates are ignored and the backoff is used instead.
+def retry_after_seconds(headers):
+    value = (headers or {}).get("retry-after")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt):
+    # "full jitter": a random delay up to the exponential bound, so that workers do not retry in lockstep
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class HostLimiter:
+    def __init__(self, host, settings):
+        self.host = host
+        self.settings = settings
+        self.limit = float(settings.initial)
+        self.in_flight = 0
+        self.tokens = float(settings.burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    # Blocks until a request to this host may start.
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                elif self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.settings.rate)
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+    # Called when a request ends; throttled=True when the host asked us to slow down.
+    def release(self, latency, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(float(self.settings.min), self.limit / 2)
+            elif latency <= self.settings.healthy_latency:
+                # about +1 per round of `limit` healthy responses
+                self.limit = min(float(self.settings.max), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    # Stops every request to this host for `seconds` (Retry-After, maxlag).
+    def pause(self, seconds):
+        with self.condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.condition.notify_all()
+
+    def refill(self, now):
+        self.tokens = min(float(self.settings.burst), self.tokens + (now - self.refilled_at) * self.settings.rate)
+        self.refilled_at = now
+
+
+class HostScheduler:
+    # settings: HostSettings used for every host instead of HOST_SETTINGS (benchmark.py lifts the limits this way)
+    def __init__(self, max_retries=MAX_RETRIES, settings=None):
+        self.max_retries = max_retries
+        self.settings = settings
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.retries = 0
+
+    def limiter_for(self, host):
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(host, self.settings or settings_for(host))
+            return self.limiters[host]
+
+    # Runs send() -> (status, headers, body) under the limiter of `host`, retrying throttled and failed attempts.
+    # Returns the last response; network errors are raised once the retries are used up.
+    def run(self, host, send):
+        limiter = self.limiter_for(host)
+        attempt = 0
+        while True:
+            limiter.acquire()
+            started = time.monotonic()
+            try:
+                status, headers, body = send()
+            except (OSError, http.client.HTTPException):
+                limiter.release(time.monotonic() - started, throttled=True)
+                if attempt >= self.max_retries:
+                    raise
+                self.wait_before_retry(limiter, attempt, None)
+                attempt += 1
+                continue
+
+            # MediaWiki answers maxlag errors with 200, Retry-After and X-Database-Lag
+            lagged = "x-database-lag" in headers and b"maxlag" in body[:300]
+            throttled = status in THROTTLE_STATUSES or lagged
+            limiter.release(time.monotonic() - started, throttled=throttled)
+
+            if (status in RETRY_STATUSES or lagged) and attempt < self.max_retries:
+                self.wait_before_retry(limiter, attempt, retry_after_seconds(headers))
+                attempt += 1
+                continue
+            if lagged:
+                # still lagged after every retry: report it as unavailable rather than as an empty result
+                return 503, headers, body
+            return status, headers, body
+
+    def wait_before_retry(self, limiter, attempt, retry_after):
+        with self.lock:
+            self.retries += 1
+        delay = retry_after if retry_after is not None else backoff_delay(attempt)
+        if retry_after is not None:
+            # the host asked everybody to wait, not just this request
+            limiter.pause(delay)
+        time.sleep(delay + random.uniform(0, 0.5))
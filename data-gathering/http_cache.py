@@ -0,0 +1,141 @@
+'''
+Persistent on-disk cache for the HTTP responses of the data-gathering scripts.
+Responses are stored in SQLite keyed by their normalised URL, expire after a
+per-endpoint TTL and are revalidated with ETag/Last-Modified when the server supports it.
+'''
+
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "http_cache.sqlite")
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+FOREVER = None
+
+# First matching rule gives the time to live of a response, in seconds (None = never expires)
+TTL_RULES = [
+    # pageview series change every day
+    (re.compile(r"^https://wikimedia\.org/api/rest_v1/metrics/pageviews/"), DAY),
+    # the creation dates are kept for good by the facts store (page_facts.py); an error or a placeholder
+    # answer of XTools must not be, so it is asked again the next day
+    (re.compile(r"^https://xtools\.wmflabs\.org/api/page/articleinfo/"), DAY),
+    # content addressed by revision id is immutable, new edits get a new revision id
+    (re.compile(r"^https://[^/]+/w/api\.php\?.*\brevids="), FOREVER),
+    (re.compile(r"^https://www\.wikidata\.org/"), DAY),
+    (re.compile(r"^https://query\.wikidata\.org/"), DAY),
+    # page info, redirects and talk pages
+    (re.compile(r"^https://[^/]+/w/api\.php\?"), HOUR),
+]
+DEFAULT_TTL = DAY
+
+CacheEntry = namedtuple("CacheEntry", ["body", "etag", "last_modified", "fresh"])
+
+
+# This function builds the cache key of a URL: lowercase scheme and host, query parameters sorted.
+def normalise_url(url):
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ""))
+
+
+def ttl_for(key):
+    for pattern, ttl in TTL_RULES:
+        if pattern.search(key):
+            return ttl
+    return DEFAULT_TTL
+
+
+class ResponseCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revalidated": 0, "stores": 0, "evictions": 0}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, body BLOB, etag TEXT, last_modified TEXT, "
+            "expires_at REAL, accessed_at REAL, size INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    # Returns the CacheEntry stored for a key, or None. Stale entries are returned so they can be revalidated.
+    def lookup(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                "SELECT body, etag, last_modified, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        body, etag, last_modified, expires_at = row
+        # an entry stored for good under a rule that has a TTL now is stale
+        fresh = expires_at > now if expires_at is not None else ttl_for(key) is FOREVER
+        return CacheEntry(zlib.decompress(body), etag, last_modified, fresh)
+
+    def store(self, key, body, headers=None, ttl=None):
+        headers = headers or {}
+        now = time.time()
+        compressed = zlib.compress(body)
+        expires_at = None if ttl is FOREVER else now + ttl
+        with self.lock:
+            previous = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, compressed, headers.get("etag"), headers.get("last-modified"), expires_at, now, len(compressed)),
+            )
+            self.total_bytes += len(compressed) - (previous[0] if previous else 0)
+            self.stats["stores"] += 1
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+            self.db.commit()
+
+    # Extends the life of an entry after the server answered 304 Not Modified.
+    def refresh(self, key, ttl):
+        now = time.time()
+        expires_at = None if ttl is FOREVER else now + ttl
+        with self.lock:
+            self.db.execute("UPDATE responses SET expires_at = ?, accessed_at = ? WHERE key = ?", (expires_at, now, key))
+            self.db.commit()
+
+    # Drops the least recently used entries until the cache is back under 90% of its size limit. Called with the lock held.
+    def evict(self):
+        target = self.max_bytes * 0.9
+        rows = self.db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.total_bytes -= size
+            self.stats["evictions"] += 1
+
+    def summary(self):
+        with self.lock:
+            stats = dict(self.stats)
+        return (f"HTTP cache: {stats['hits']} hits, {stats['revalidated']} revalidated, {stats['misses']} misses, "
+                f"{stats['evictions']} evictions, {self.total_bytes // (1024 * 1024)} MB on disk")
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
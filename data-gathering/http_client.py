@@ -0,0 +1,285 @@
+'''
+Shared HTTP client for the data-gathering scripts.
+Keeps a pool of keep-alive connections per host, asks for gzip/deflate
+compressed responses and lets bot.py drive many articles concurrently from asyncio.
+'''
+
+import asyncio
+import concurrent.futures
+import gzip
+import http.client
+import json
+import os
+import threading
+import time
+import zlib
+from urllib.parse import urljoin, urlsplit
+
+from http_cache import DEFAULT_CACHE_PATH, ResponseCache, normalise_url, ttl_for
+from host_scheduler import HostScheduler
+from pipeline_metrics import shared_metrics
+
+
+USER_AGENT = "wikicurricula-bot/1.0 (https://github.com/wikicurricula-uy/wikicurricula-boilerplate)"
+
+# Errors that mean a pooled keep-alive connection was closed by the server while idle
+STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, http.client.CannotSendRequest, BrokenPipeError, ConnectionResetError)
+
+MAX_REDIRECTS = 5
+
+
+class HTTPError(Exception):
+    def __init__(self, url, status, reason, headers=None, body=b""):
+        super().__init__(f"HTTP {status} {reason} for {url}")
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers or {}
+        self.body = body
+
+
+# This class keeps the idle connections of one scheme://host so that they can be reused.
+class HostPool:
+    def __init__(self, scheme, host, size, timeout):
+        self.scheme = scheme
+        self.host = host
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop(), True
+        if self.scheme == "https":
+            return http.client.HTTPSConnection(self.host, timeout=self.timeout), False
+        return http.client.HTTPConnection(self.host, timeout=self.timeout), False
+
+    def release(self, connection):
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+# This function decodes a response body according to its Content-Encoding header.
+def decode_body(body, encoding):
+    encoding = (encoding or "").lower()
+    if encoding == "gzip":
+        return gzip.decompress(body)
+    if encoding == "deflate":
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # some servers send a raw deflate stream without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class HttpClient:
+    # upstream: optional "http://host:port" that receives every request instead of the host of its URL,
+    # with the original host in the Host header (used to run against replay_server.py)
+    # metrics: where requests, bytes, cache lookups, retries and errors are counted (the process-wide metrics by default)
+    def __init__(self, pool_size=24, timeout=60, user_agent=USER_AGENT, cache=None, scheduler=None, upstream=None, metrics=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.cache = cache
+        self.scheduler = scheduler or HostScheduler()
+        self.upstream = urlsplit(upstream) if upstream else None
+        self.metrics = metrics or shared_metrics()
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool_for(self, scheme, host):
+        key = (scheme, host)
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = HostPool(scheme, host, self.pool_size, self.timeout)
+            return self.pools[key]
+
+    # Sends one GET request over a pooled connection and returns (status, headers, decoded body).
+    # kind: the kind the request is counted under in the metrics, taken from the URL when None.
+    def request(self, url, headers=None, kind=None):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        request_headers = {
+            "User-Agent": self.user_agent,
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        }
+        request_headers.update(headers or {})
+
+        if self.upstream is not None:
+            request_headers["Host"] = parts.netloc
+            pool = self.pool_for(self.upstream.scheme, self.upstream.netloc)
+        else:
+            pool = self.pool_for(parts.scheme, parts.netloc)
+        connection, reused = pool.acquire()
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=request_headers)
+            response = connection.getresponse()
+            body = response.read()
+        except STALE_CONNECTION_ERRORS as error:
+            connection.close()
+            if not reused:
+                self.metrics.request_done(url, time.perf_counter() - started, error=error, kind=kind)
+                raise
+            # the idle connection was dropped by the server, retry once on a fresh one
+            return self.request(url, headers, kind)
+        except Exception as error:
+            connection.close()
+            self.metrics.request_done(url, time.perf_counter() - started, error=error, kind=kind)
+            raise
+        self.metrics.request_done(url, time.perf_counter() - started, len(body), response.status, kind=kind)
+
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        if response.will_close:
+            connection.close()
+        else:
+            pool.release(connection)
+
+        body = decode_body(body, response_headers.get("content-encoding"))
+        return response.status, response_headers, body
+
+    # Sends a GET request following redirects, raises HTTPError for error statuses (304 is returned to the caller).
+    # Every attempt goes through the scheduler of its host, which limits concurrency and retries throttled requests.
+    def fetch(self, url, headers=None, kind=None):
+        for _ in range(MAX_REDIRECTS + 1):
+            host = urlsplit(url).netloc
+            attempts = []
+
+            def send():
+                attempts.append(url)
+                return self.request(url, headers, kind)
+
+            try:
+                status, response_headers, body = self.scheduler.run(host, send)
+            finally:
+                self.metrics.retried(url, len(attempts) - 1, kind)
+            if status in (301, 302, 303, 307, 308) and "location" in response_headers:
+                url = urljoin(url, response_headers["location"])
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, http.client.responses.get(status, ""), response_headers, body)
+            return status, response_headers, body
+        raise HTTPError(url, status, "Too many redirects", response_headers, body)
+
+    # Returns the body of url as bytes. With a cache, fresh entries are served from disk and
+    # stale ones are revalidated with If-None-Match/If-Modified-Since before being downloaded again.
+    def get(self, url, headers=None, kind=None):
+        if self.cache is None:
+            return self.fetch(url, headers, kind)[2]
+
+        key = normalise_url(url)
+        entry = self.cache.lookup(key)
+        if entry is not None and entry.fresh:
+            self.cache.count("hits")
+            self.metrics.cache_lookup(url, "hit", kind)
+            return entry.body
+
+        conditional = dict(headers or {})
+        if entry is not None and entry.etag:
+            conditional["If-None-Match"] = entry.etag
+        if entry is not None and entry.last_modified:
+            conditional["If-Modified-Since"] = entry.last_modified
+
+        status, response_headers, body = self.fetch(url, conditional, kind)
+        if status == 304 and entry is not None:
+            self.cache.count("revalidated")
+            self.metrics.cache_lookup(url, "revalidated", kind)
+            self.cache.refresh(key, ttl_for(key))
+            return entry.body
+
+        self.cache.count("misses")
+        self.metrics.cache_lookup(url, "miss", kind)
+        self.cache.store(key, body, response_headers, ttl_for(key))
+        return body
+
+    # Returns the cached body of url when it is still fresh, without touching the network.
+    def cached(self, url):
+        if self.cache is None:
+            return None
+        entry = self.cache.lookup(normalise_url(url))
+        if entry is None or not entry.fresh:
+            self.metrics.cache_lookup(url, "miss")
+            return None
+        self.cache.count("hits")
+        self.metrics.cache_lookup(url, "hit")
+        return entry.body
+
+    # Stores a body under url, used when one batched response is split into several cacheable parts.
+    def remember(self, url, body):
+        if self.cache is not None:
+            key = normalise_url(url)
+            self.cache.store(key, body, ttl=ttl_for(key))
+
+    def get_json(self, url, headers=None, kind=None):
+        return json.loads(self.get(url, headers, kind))
+
+    def close(self):
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+# Returns the process-wide client so that every caller shares the same connection pools and cache.
+# The cache location can be changed with the WIKICURRICULA_CACHE environment variable, "off" disables it.
+# WIKICURRICULA_UPSTREAM=http://127.0.0.1:8901 sends every request to a local stand-in such as replay_server.py.
+def shared_client():
+    global _shared_client
+    with _shared_lock:
+        if _shared_client is None:
+            cache_path = os.environ.get("WIKICURRICULA_CACHE", DEFAULT_CACHE_PATH)
+            cache = None if cache_path == "off" else ResponseCache(cache_path)
+            _shared_client = HttpClient(cache=cache, upstream=os.environ.get("WIKICURRICULA_UPSTREAM"))
+        return _shared_client
+
+
+# Replaces the process-wide client, closing the previous one; benchmark.py gives every run a fresh client and cache.
+def use_shared_client(client):
+    global _shared_client
+    with _shared_lock:
+        previous, _shared_client = _shared_client, client
+    if previous is not None:
+        previous.close()
+
+
+# Runs func(item) for every item with at most `concurrency` calls in flight and returns the results in order.
+# items may be a generator, it is consumed lazily as workers become free.
+# The blocking work runs on a dedicated thread pool driven by an asyncio event loop;
+# an exception raised for one item is returned in its place instead of stopping the others.
+def map_concurrently(func, items, concurrency):
+    async def run_all():
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for item in items:
+                await semaphore.acquire()
+                task = loop.run_in_executor(executor, func, item)
+                task.add_done_callback(lambda _: semaphore.release())
+                tasks.append(task)
+
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+    return asyncio.run(run_all())
@@ -0,0 +1,118 @@
+'''
+Append-only journal of the articles completed by bot.py.
+Every finished row is appended as one JSON line with a content hash and a timestamp,
+so that an interrupted run can be resumed without analysing those articles again.
+Titles that redirect to a page analysed earlier in the run are appended as alias lines.
+'''
+
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from result_schema import parse_row
+
+
+# This function returns the journal that belongs to a result file (chile_results.txt -> chile_results_journal.jsonl).
+def journal_path(result_file):
+    return os.path.splitext(result_file)[0] + "_journal.jsonl"
+
+
+def row_hash(row):
+    return hashlib.sha1(row.encode("utf-8")).hexdigest()
+
+
+class Journal:
+    # With resume=False the journal of a previous run is discarded, otherwise its entries are loaded.
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = []
+        # canonical title -> input titles that redirect to it and were found after its row was journaled
+        self.aliases = {}
+        self.lock = threading.Lock()
+
+        if resume and os.path.exists(path):
+            self.entries = self.load(path)
+        self.file = open(path, "a" if resume else "w", encoding="utf-8")
+        if resume and self.file.tell() > 0 and not self.ends_with_newline(path):
+            # terminate the line cut by the crash so that the next entry starts on its own line
+            self.file.write("\n")
+
+    def ends_with_newline(self, path):
+        with open(path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    # Reads the journal, skipping a line cut by a crash and rows whose hash does not match.
+    def load(self, path):
+        entries = []
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "alias" in entry:
+                    self.aliases.setdefault(entry["alias"], []).extend(entry.get("titles", []))
+                elif entry.get("hash") == row_hash(entry.get("row", "")):
+                    entries.append(entry)
+        return entries
+
+    # Titles of the input file that are already covered by a finished row.
+    def done_titles(self):
+        return {title for entry in self.entries for title in self.titles_of(entry)}
+
+    # Input titles of an entry, including the ones journaled later as aliases of its page.
+    def titles_of(self, entry):
+        return entry["titles"] + self.aliases.get(entry["page"], [])
+
+    # Canonical titles of the pages that already have a finished row.
+    def done_pages(self):
+        return {entry["page"] for entry in self.entries}
+
+    # index: position of the article in the input file, used to restore the order of the rows.
+    # record: the values of the row by column name, see result_schema.py.
+    # retry: the row is part of the output of this run but is not written to the journal, so that a resumed run
+    # analyses its titles again.
+    def record(self, index, page, titles, row, record=None, retry=False):
+        entry = {
+            "index": index,
+            "page": page,
+            "titles": titles,
+            "row": row,
+            "hash": row_hash(row),
+            "time": datetime.now().isoformat(timespec="seconds"),
+        }
+        if record is not None:
+            entry["record"] = record
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.entries.append(entry)
+            if not retry:
+                self.file.write(line)
+                self.file.flush()
+
+    # Records `titles` as more input titles of the page `page`, which has (or will have) a row of its own.
+    def add_titles(self, page, titles):
+        line = json.dumps({"alias": page, "titles": titles, "time": datetime.now().isoformat(timespec="seconds")}, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.aliases.setdefault(page, []).extend(titles)
+            self.file.write(line)
+            self.file.flush()
+
+    # Every finished row, in the order of the input file.
+    def rows_in_order(self):
+        with self.lock:
+            entries = sorted(self.entries, key=lambda entry: entry["index"])
+        return [entry["row"] for entry in entries]
+
+    # Every finished record, in the order of the input file; rows journaled without one are parsed with `columns`.
+    def records_in_order(self, columns):
+        with self.lock:
+            entries = sorted(self.entries, key=lambda entry: entry["index"])
+        return [entry.get("record") or parse_row(entry["row"], columns) for entry in entries]
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,240 @@
+'''
+Batched access to the MediaWiki action API.
+Titles are resolved 50 at a time: one request returns the canonical title (after
+normalisation and redirects), the Wikidata QID and the current revision id of every page,
+then the wikitext of those revisions is loaded, from the HTTP cache when it was seen before.
+'''
+
+import json
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from http_client import shared_client
+
+
+# The API accepts at most 50 titles per request when the page content is requested
+BATCH_SIZE = 50
+
+# title: canonical title with spaces, revid: current revision id, qid: Wikidata item or None,
+# wikitext: current content or None, sources: the input titles that resolved to this page,
+# missing: True when the page does not exist, length: size of the current revision in bytes (prop=info) or None,
+# talk_length: size of the talk page in bytes, 0 when it has none, None when it was not requested,
+# alias: True when the sources redirect to a page that was already yielded, which is not analysed again,
+# failed: True when the request of its batch failed, so nothing is known about the page
+Page = namedtuple("Page", ["title", "pageid", "revid", "qid", "wikitext", "sources", "missing", "length", "talk_length",
+                           "alias", "failed"], defaults=[None, None, False, False])
+
+
+# The info module accepts 50 titles per request as well
+LENGTH_BATCH_SIZE = 50
+
+# Requests are sent with maxlag so that the API asks us to wait when its replicas are lagging
+MAXLAG = "5"
+
+
+def api_url(language, params):
+    return "https://" + language + ".wikipedia.org/w/api.php?" + urlencode({**params, "maxlag": MAXLAG})
+
+
+# This function yields successive lists of `size` items from any iterable.
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# This function runs one query, following the API "continue" protocol until every page is complete.
+# Returns the pages by title and the normalisation/redirect aliases.
+# cached=False sends every request past the HTTP cache, for responses whose parts are cached separately;
+# kind: the kind the requests are counted under in the metrics, see pipeline_metrics.py.
+def run_query(params, language, client, cached=True, kind=None):
+    pages = {}
+    aliases = {}
+    continuation = {}
+
+    while True:
+        url = api_url(language, {**params, **continuation})
+        data = client.get_json(url, kind=kind) if cached else json.loads(client.fetch(url, kind=kind)[2])
+        query = data.get("query", {})
+
+        for entry in query.get("normalized", []) + query.get("redirects", []):
+            aliases[entry["from"]] = entry["to"]
+
+        for entry in query.get("pages", []):
+            page = pages.setdefault(entry["title"], {})
+            for key, value in entry.items():
+                # later continuation rounds add revisions to pages that were returned without them
+                if value or key not in page:
+                    page[key] = value
+
+        if "continue" not in data:
+            break
+        continuation = data["continue"]
+
+    return pages, aliases
+
+
+# The URL that loads a single revision, used as cache key for its content
+def revision_url(language, revid):
+    return api_url(language, {
+        "action": "query",
+        "format": "json",
+        "formatversion": "2",
+        "prop": "revisions",
+        "rvprop": "content|ids",
+        "rvslots": "main",
+        "revids": str(revid),
+    })
+
+
+# This function returns a dict revid -> wikitext. Revisions already in the HTTP cache are not downloaded,
+# the others are requested in one batch and cached one by one since a revision never changes. The batch response
+# itself is not cached: the next batch never asks for the same set of revisions.
+def fetch_revisions(revids, language, client):
+    contents = {}
+    missing = []
+    for revid in revids:
+        body = client.cached(revision_url(language, revid))
+        if body is None:
+            missing.append(revid)
+        else:
+            contents[revid] = json.loads(body)
+
+    if missing:
+        params = {
+            "action": "query",
+            "format": "json",
+            "formatversion": "2",
+            "prop": "revisions",
+            "rvprop": "content|ids",
+            "rvslots": "main",
+            "revids": "|".join(str(revid) for revid in missing),
+        }
+        pages, _ = run_query(params, language, client, cached=False)
+        for page in pages.values():
+            for revision in page.get("revisions", []):
+                content = revision.get("slots", {}).get("main", {}).get("content")
+                if content is not None:
+                    contents[revision["revid"]] = content
+                    client.remember(revision_url(language, revision["revid"]), json.dumps(content).encode("utf-8"))
+
+    return contents
+
+
+# This function requests the page info of one batch of titles and the wikitext of their current revisions.
+# Pages whose current revision is the one given in known_revisions (title -> revid) are returned without wikitext,
+# and so is every page with content=False.
+def query_batch(titles, language, client, known_revisions=None, content=True):
+    params = {
+        "action": "query",
+        "format": "json",
+        "formatversion": "2",
+        "redirects": "1",
+        "prop": "info|pageprops",
+        "ppprop": "wikibase_item",
+        "titles": "|".join(titles),
+    }
+    pages, aliases = run_query(params, language, client)
+
+    if not content:
+        return pages, aliases
+
+    known_revisions = known_revisions or {}
+    revids = [
+        page["lastrevid"] for title, page in pages.items()
+        if page.get("lastrevid") and known_revisions.get(title) != page["lastrevid"]
+    ]
+    contents = fetch_revisions(revids, language, client)
+    for page in pages.values():
+        page["wikitext"] = contents.get(page.get("lastrevid"))
+
+    return pages, aliases
+
+
+# This function follows normalisation and redirect hops from an input title to its canonical title.
+def resolve_title(title, aliases):
+    seen = set()
+    while title in aliases and title not in seen:
+        seen.add(title)
+        title = aliases[title]
+    return title
+
+
+# This function resolves `titles` in batches and yields one Page per distinct canonical page, in input order.
+# Titles that redirect to the same page in one batch are all in its sources; a title that redirects to a page
+# yielded by an earlier batch comes out as an alias Page of that page, with only that title in its sources.
+# A batch that still fails after the retries of the client yields its titles as failed pages, the run goes on.
+# known_revisions (title -> revid) lists pages whose wikitext is not needed if they were not edited since;
+# content=False only resolves the pages, without downloading any wikitext.
+def fetch_pages(titles, language, client=None, known_revisions=None, content=True):
+    client = client or shared_client()
+    # the pages already yielded, without their wikitext
+    yielded = {}
+
+    for batch in batched((title.strip() for title in titles if title.strip()), BATCH_SIZE):
+        try:
+            pages, aliases = query_batch(batch, language, client, known_revisions, content)
+        except Exception as error:
+            print(f"Failed to resolve {len(batch)} titles ({batch[0]} ...): {error}")
+            for title in batch:
+                yield Page(title, None, None, None, None, [title], False, failed=True)
+            continue
+
+        # every source of every page of the batch is known before the first page is yielded
+        batch_pages = {}
+        for title in batch:
+            canonical = resolve_title(title, aliases)
+            if canonical in batch_pages:
+                batch_pages[canonical].sources.append(title)
+            elif canonical in yielded:
+                batch_pages[canonical] = yielded[canonical]._replace(sources=[title], alias=True)
+            else:
+                entry = pages.get(canonical, {"missing": True})
+                batch_pages[canonical] = Page(
+                    title=canonical,
+                    pageid=entry.get("pageid"),
+                    revid=entry.get("lastrevid"),
+                    qid=entry.get("pageprops", {}).get("wikibase_item"),
+                    wikitext=entry.get("wikitext"),
+                    sources=[title],
+                    missing=bool(entry.get("missing") or entry.get("invalid")),
+                    length=entry.get("length"),
+                )
+
+        for canonical, page in batch_pages.items():
+            if not page.alias:
+                # the wikitext is not kept so that it can be released once the page is analysed
+                yielded[canonical] = page._replace(wikitext=None)
+            yield page
+
+
+# This function returns a dict title -> size in bytes of the current revision, from prop=info, 50 titles per request.
+# Pages that do not exist have length 0; redirects are not followed, like action=parse.
+# The titles of a batch that still fails after the retries of the client are left out, their size is unknown.
+# kind: the kind the requests are counted under in the metrics, bot.py asks for the sizes of talk pages.
+def fetch_lengths(titles, language, client=None, kind=None):
+    client = client or shared_client()
+    lengths = {}
+
+    for batch in batched(sorted(set(titles)), LENGTH_BATCH_SIZE):
+        params = {
+            "action": "query",
+            "format": "json",
+            "formatversion": "2",
+            "prop": "info",
+            "titles": "|".join(batch),
+        }
+        try:
+            pages, aliases = run_query(params, language, client, kind=kind)
+        except Exception as error:
+            print(f"Failed to load the length of {len(batch)} pages ({batch[0]} ...): {error}")
+            continue
+        for title in batch:
+            lengths[title] = pages.get(resolve_title(title, aliases), {}).get("length", 0)
+
+    return lengths
@@ -0,0 +1,120 @@
+'''
+The metrics bot.py can compute and the upstream resources each of them needs.
+A run can select some of the metrics (--metrics size,pageviews or a "metrics" list in
+wikipedia_config.json); the fetch plan then only lists the resources those metrics need,
+and bot.py skips every other request: no wikitext download when no wikitext metric is
+selected, no talk page, no Wikidata entities, no pageviews, no XTools. The columns of the
+metrics that are not selected are left empty, so the result files keep their layout.
+In fast mode (--fast) the sizes of the article and of its talk page are the byte lengths
+of prop=info instead of the length of the downloaded wikitext.
+'''
+
+from collections import namedtuple
+
+
+# Upstream resources: the wikitext of the article, the wikitext of its talk page, the length of its talk page,
+# its Wikidata entity, its pageviews and its creation date from XTools.
+# The page info (title, redirects, QID, length) is always requested.
+RESOURCES = ["wikitext", "talk", "talk_length", "entity", "pageviews", "xtools"]
+
+# name: the name used with --metrics, columns: the result columns it fills (see result_schema.py),
+# resources: what has to be fetched to compute it, fast_resources: the same in fast mode when it differs
+Metric = namedtuple("Metric", ["name", "columns", "resources", "fast_resources"], defaults=[None])
+
+METRICS = [
+    Metric("first_edit", ["first_edit"], {"xtools"}),
+    Metric("size", ["size"], {"wikitext"}, set()),
+    Metric("images", ["images"], {"wikitext"}),
+    Metric("notes", ["notes"], {"wikitext"}),
+    Metric("warnings", ["issues", "issue_sourceNeeded", "issue_clarify"], {"wikitext"}),
+    Metric("discussion_size", ["discussion_size"], {"talk"}, {"talk_length"}),
+    Metric("incipit_size", ["incipit_size"], {"wikitext"}),
+    Metric("pageviews", ["all_visits", "avg_pv_all_time", "avg_pv_prev", "avg_pv"], {"pageviews"}),
+    Metric("vdq", ["VdQ"], {"wikitext"}),
+    Metric("vetrina", ["vetrina"], {"wikitext"}),
+    Metric("commons", ["commonsGallerys", "commonsPage"], {"entity"}),
+    Metric("wikisource", ["page_on_wikisource"], {"entity"}),
+    Metric("coordinates", ["latitude", "longitude"], {"entity"}),
+]
+
+METRICS_BY_NAME = {metric.name: metric for metric in METRICS}
+
+# Columns every row has, whatever the selection
+ALWAYS_COLUMNS = {"article", "id_wikidata", "missing"}
+
+# Host of the requests of every resource, "{language}" is the wiki that is analysed
+RESOURCE_HOSTS = {
+    "info": "{language}.wikipedia.org",
+    "wikitext": "{language}.wikipedia.org",
+    "talk": "{language}.wikipedia.org",
+    "talk_length": "{language}.wikipedia.org",
+    "entity": "www.wikidata.org",
+    "pageviews": "wikimedia.org",
+    "xtools": "xtools.wmflabs.org",
+}
+
+# Pages per request of the batched resources (mediawiki.py and wikidata.py); the others take one request per page
+BATCH_SIZES = {"info": 50, "wikitext": 50, "talk_length": 50, "entity": 50}
+
+
+# This function turns "size,pageviews" (or a list of names) into the list of selected metric names.
+# None or an empty selection selects every metric. Raises ValueError for unknown names.
+def parse_metric_names(names):
+    if names is None:
+        return None
+    if isinstance(names, str):
+        names = names.split(",")
+    names = [name.strip() for name in names if name.strip()]
+    unknown = [name for name in names if name not in METRICS_BY_NAME]
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(unknown)}. Available metrics: {', '.join(METRICS_BY_NAME)}.")
+    return names or None
+
+
+# This class is the fetch plan of a run: the selected metrics and the resources they need.
+class FetchPlan:
+    # metric_names: names from METRICS, None for every metric; fast: take the sizes from prop=info
+    def __init__(self, metric_names=None, fast=False):
+        names = parse_metric_names(metric_names)
+        self.fast = fast
+        self.metrics = [metric for metric in METRICS if names is None or metric.name in names]
+        self.resources = set().union(*(
+            metric.fast_resources if fast and metric.fast_resources is not None else metric.resources
+            for metric in self.metrics
+        ))
+        self.columns = ALWAYS_COLUMNS.union(*(metric.columns for metric in self.metrics))
+
+    def needs(self, resource):
+        return resource in self.resources
+
+    # Empties the columns of the metrics that are not selected; returns the record.
+    def keep_selected(self, record):
+        for column in record:
+            if column not in self.columns:
+                record[column] = None
+        return record
+
+    # Returns {host: number of requests} for analysing `titles` titles. These are upper bounds: cached
+    # responses, unchanged revisions, redirects and creation dates in the facts store are not requested again.
+    # Nothing is requested with a dump, and the pageviews are not requested with pageview dumps.
+    def planned_requests(self, titles, language, dump_file=None, pageview_dumps=None):
+        resources = ["info"] + [resource for resource in RESOURCES if self.needs(resource)]
+        if dump_file:
+            # the dump has the page info and the wikitext, the other resources are not used with a dump
+            resources = []
+        if pageview_dumps and "pageviews" in resources:
+            resources.remove("pageviews")
+
+        requests = {}
+        for resource in resources:
+            batch_size = BATCH_SIZES.get(resource, 1)
+            host = RESOURCE_HOSTS[resource].format(language=language)
+            requests[host] = requests.get(host, 0) + -(-titles // batch_size)
+        return requests
+
+    def describe(self):
+        if len(self.metrics) == len(METRICS):
+            names = "all metrics"
+        else:
+            names = ", ".join(metric.name for metric in self.metrics)
+        return names + (", fast mode" if self.fast else "")
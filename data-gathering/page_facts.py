@@ -0,0 +1,76 @@
+'''
+Permanent store of the facts about an article that practically never change:
+its creation date, its Wikidata QID and the titles that redirect to it.
+Facts are keyed by language and page id and kept in SQLite next to the HTTP cache.
+'''
+
+import os
+import sqlite3
+import threading
+
+from http_cache import DEFAULT_CACHE_PATH
+
+
+DEFAULT_FACTS_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), "page_facts.sqlite")
+
+
+class PageFacts:
+    def __init__(self, path=DEFAULT_FACTS_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "language TEXT, pageid INTEGER, title TEXT, qid TEXT, created TEXT, "
+            "PRIMARY KEY (language, pageid))"
+        )
+        # every title seen for a page: its canonical title and the input titles redirecting to it
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS titles ("
+            "language TEXT, title TEXT, pageid INTEGER, "
+            "PRIMARY KEY (language, title))"
+        )
+        self.db.commit()
+
+    # Records the canonical title and QID of a page and the titles that resolved to it.
+    def remember_page(self, language, pageid, title, qid, sources):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO pages (language, pageid, title, qid) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (language, pageid) DO UPDATE SET title = excluded.title, qid = excluded.qid",
+                (language, pageid, title, qid),
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO titles VALUES (?, ?, ?)",
+                [(language, name, pageid) for name in {title, *sources}],
+            )
+            self.db.commit()
+
+    def remember_creation(self, language, pageid, created):
+        with self.lock:
+            self.db.execute("UPDATE pages SET created = ? WHERE language = ? AND pageid = ?", (created, language, pageid))
+            self.db.commit()
+
+    def creation_date(self, language, pageid):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT created FROM pages WHERE language = ? AND pageid = ?", (language, pageid)
+            ).fetchone()
+        return row[0] if row else None
+
+    # Returns (pageid, canonical title, qid) for a title, following the redirects seen before, or None.
+    def lookup_title(self, language, title):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT pages.pageid, pages.title, pages.qid FROM titles "
+                "JOIN pages ON pages.language = titles.language AND pages.pageid = titles.pageid "
+                "WHERE titles.language = ? AND titles.title = ?",
+                (language, title.replace("_", " ")),
+            ).fetchone()
+        return tuple(row) if row else None
+
+    def close(self):
+        with self.lock:
+            self.db.close()
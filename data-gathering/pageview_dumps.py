@@ -0,0 +1,108 @@
+'''
+Pageview statistics from locally stored Wikimedia pageview dumps (https://dumps.wikimedia.org/other/pageviews/
+and https://dumps.wikimedia.org/other/pageview_complete/).
+Every file is read once as a stream and only running sums for the titles of the curriculum
+are kept, so a country-wide refresh costs one sequential pass over the files instead of one
+REST request per article. The figures are the ones pageviews.pageview_summary() returns.
+'''
+
+import bz2
+import gzip
+import re
+
+from pageviews import DEFAULT_WINDOWS, summarise
+
+
+# The date of a file comes from its name: pageviews-20240101-130000.gz (hourly),
+# pageviews-20240101-user.bz2 (daily) or pageviews-202401-user.bz2 (monthly, counted on the first of the month)
+DAY_IN_NAME = re.compile(r"(?<!\d)(\d{8})(?!\d)")
+MONTH_IN_NAME = re.compile(r"(?<!\d)(\d{6})(?!\d)")
+
+
+def open_lines(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def file_date(path):
+    name = path.replace("\\", "/").rsplit("/", 1)[-1]
+    match = DAY_IN_NAME.search(name)
+    if match:
+        return match.group(1)
+    match = MONTH_IN_NAME.search(name)
+    if match:
+        return match.group(1) + "01"
+    raise ValueError(f"cannot tell the date of {path} from its name")
+
+
+# Dump titles use underscores and an upper case first letter, like the URLs of the REST API
+def dump_title(title):
+    title = title.strip().replace(" ", "_")
+    return title[:1].upper() + title[1:]
+
+
+class PageviewAggregator:
+    # titles: the articles to keep sums for, language: the Wikipedia language code.
+    # Files covering the same days (e.g. hourly and daily files) must not be mixed, they would be counted twice.
+    def __init__(self, titles, language, windows=DEFAULT_WINDOWS):
+        self.windows = windows
+        self.end = max(windows.prev_end, windows.current_end)
+        # hourly files use "es" and "es.m", pageview_complete files use "es.wikipedia"
+        self.projects = {language.encode(), (language + ".m").encode(), (language + ".wikipedia").encode()}
+        self.sums = {dump_title(title).encode("utf-8"): [0, 0, 0] for title in titles if title.strip()}
+        self.files = 0
+
+    # Returns the indexes of the sums (all time, previous year, current year) a day counts for.
+    def windows_of(self, day):
+        windows = self.windows
+        slots = []
+        if windows.all_time_start <= day <= self.end:
+            slots.append(0)
+        if windows.prev_start <= day <= windows.prev_end:
+            slots.append(1)
+        if windows.current_start <= day <= windows.current_end:
+            slots.append(2)
+        return slots
+
+    # This function adds the views of one dump file to the running sums.
+    def add_file(self, path):
+        slots = self.windows_of(file_date(path))
+        if not slots:
+            # the whole file is outside the windows, it is not even opened
+            return
+        self.files += 1
+        projects = self.projects
+        sums = self.sums
+
+        with open_lines(path) as lines:
+            for line in lines:
+                fields = line.split()
+                if len(fields) < 3 or fields[0] not in projects:
+                    continue
+                counts = sums.get(fields[1])
+                if counts is None:
+                    continue
+                # "project title views [bytes]" (hourly) or "project title page_id access daily_total hourly_counts"
+                views = fields[4] if len(fields) >= 6 else fields[2]
+                try:
+                    views = int(views)
+                except ValueError:
+                    continue
+                for slot in slots:
+                    counts[slot] += views
+
+    def add_files(self, paths):
+        for path in sorted(paths):
+            self.add_file(path)
+        return self
+
+    def __contains__(self, title):
+        return dump_title(title).encode("utf-8") in self.sums
+
+    # Same figures, as strings, as pageviews.pageview_summary() for the same windows.
+    def summary(self, title):
+        total, previous, current = self.sums[dump_title(title).encode("utf-8")]
+        return summarise(total, previous, current, self.windows)
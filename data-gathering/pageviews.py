@@ -0,0 +1,100 @@
+'''
+Pageview statistics from the Wikimedia REST API.
+The series of an article is fetched once over the whole configured range and the
+all-time, previous-year and current-year figures are aggregated locally.
+'''
+
+import calendar
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import quote
+
+from http_client import shared_client
+
+
+PAGEVIEWS_API = "https://wikimedia.org/api/rest_v1/metrics/pageviews/per-article/"
+
+# All dates use the YYYYMMDD format, every window is inclusive
+PageviewWindows = namedtuple("PageviewWindows", ["all_time_start", "prev_start", "prev_end", "current_start", "current_end"])
+
+DEFAULT_WINDOWS = PageviewWindows(
+    all_time_start="20150701",
+    prev_start="20230101",
+    prev_end="20231231",
+    current_start="20240101",
+    current_end="20240531",
+)
+
+
+# This function reads the optional "pageview_windows" object of a wikipedia_config.json entry.
+def windows_from_config(file_mapping):
+    overrides = file_mapping.get("pageview_windows", {})
+    return DEFAULT_WINDOWS._replace(**{key: str(value) for key, value in overrides.items()})
+
+
+def parse_date(date):
+    return datetime.strptime(date, "%Y%m%d")
+
+
+def days_between(start, end):
+    return abs((parse_date(end) - parse_date(start)).days) + 1
+
+
+# Monthly totals are enough when every window starts on the first and ends on the last day of a month.
+def monthly_is_enough(windows):
+    for start in (windows.all_time_start, windows.prev_start, windows.current_start):
+        if not start.endswith("01"):
+            return False
+    for end in (windows.prev_end, windows.current_end):
+        date = parse_date(end)
+        if date.day != calendar.monthrange(date.year, date.month)[1]:
+            return False
+    return True
+
+
+# This function downloads the pageview series of an article and returns a list of (YYYYMMDD, views).
+def fetch_series(article, language, start, end, granularity, client=None):
+    client = client or shared_client()
+    title = quote(article.replace(" ", "_"), safe="")
+    url = PAGEVIEWS_API + language + ".wikipedia/all-access/user/" + title + "/" + granularity + "/" + start + "/" + end
+    data = client.get_json(url)
+    return [(item["timestamp"][:8], item["views"]) for item in data.get("items", [])]
+
+
+# This function sums the views of a series inside an inclusive window.
+def window_sum(series, start, end):
+    return sum(views for day, views in series if start <= day <= end)
+
+
+def average(total, start, end):
+    return str(int(round(total / days_between(start, end), 0)))
+
+
+# This function returns visits since the beginning of time, average daily visits since the beginning of time,
+# average daily visits in the previous year and average daily visits in the current year, as strings.
+def pageview_summary(article, language, windows=DEFAULT_WINDOWS, client=None):
+    end = max(windows.prev_end, windows.current_end)
+    granularity = "monthly" if monthly_is_enough(windows) else "daily"
+
+    try:
+        series = fetch_series(article, language, windows.all_time_start, end, granularity, client)
+    except Exception:
+        return "ERROR", "ERROR", "ERROR", "ERROR"
+
+    return summarise(
+        window_sum(series, windows.all_time_start, end),
+        window_sum(series, windows.prev_start, windows.prev_end),
+        window_sum(series, windows.current_start, windows.current_end),
+        windows,
+    )
+
+
+# This function turns the views of the three windows into the four figures of pageview_summary().
+def summarise(total, previous, current, windows=DEFAULT_WINDOWS):
+    end = max(windows.prev_end, windows.current_end)
+    return (
+        str(total),
+        average(total, windows.all_time_start, end),
+        average(previous, windows.prev_start, windows.prev_end),
+        average(current, windows.current_start, windows.current_end),
+    )
@@ -0,0 +1,258 @@
+'''
+Counters and latency histograms of a bot.py run.
+Every HTTP request is counted under the kind of resource it fetches (page info, wikitext,
+talk page, entities, pageviews, XTools...) with its bytes, cache outcome, retries and
+error class, and every metric function of bot.py records how long it took. The figures
+are written next to the result file as a Prometheus textfile (for the node exporter
+textfile collector) and as a JSON summary, at the end of the run and periodically during it.
+'''
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# First matching rule gives the kind of a request, like the TTL rules of http_cache.py
+KIND_RULES = [
+    (re.compile(r"^https?://[^/]+/api/rest_v1/metrics/pageviews/"), "pageviews"),
+    (re.compile(r"^https?://xtools\.[^/]+/api/page/articleinfo/"), "xtools"),
+    (re.compile(r"^https?://query\.wikidata\.org/"), "sparql"),
+    (re.compile(r"[?&]action=wbgetentities\b"), "entity"),
+    (re.compile(r"[?&]action=parse\b"), "talk"),
+    (re.compile(r"[?&]revids="), "wikitext"),
+    (re.compile(r"[?&]titles="), "pageprops"),
+]
+
+METRICS_EVERY = 60
+
+
+# kind: the kind given by the caller, for requests whose URL does not tell (the sizes of talk pages in fast mode)
+def request_kind(url, kind=None):
+    if kind is not None:
+        return kind
+    for pattern, kind in KIND_RULES:
+        if pattern.search(url):
+            return kind
+    return "other"
+
+
+# This function names the class of a failed request: "http_503", "timeout", "ConnectionResetError"...
+def error_class(error=None, status=None):
+    if status is not None:
+        return f"http_{status}"
+    if isinstance(error, TimeoutError):
+        return "timeout"
+    return type(error).__name__
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    # Estimates a quantile (0-1) by linear interpolation inside its bucket, like Prometheus' histogram_quantile.
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[index - 1] if index > 0 else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "p50": round(self.quantile(0.5), 6) if self.count else None,
+            "p90": round(self.quantile(0.9), 6) if self.count else None,
+            "p99": round(self.quantile(0.99), 6) if self.count else None,
+        }
+
+
+# This class holds every counter and histogram of the process, keyed by metric name and label values.
+class PipelineMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+
+    # labels: a dict, e.g. {"kind": "talk"}
+    def count(self, name, labels=None, value=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    # Called by the HTTP client for every attempt sent over the network.
+    def request_done(self, url, seconds, received_bytes=0, status=None, error=None, kind=None):
+        labels = {"kind": request_kind(url, kind)}
+        self.count("requests_total", labels)
+        self.count("response_bytes_total", labels, received_bytes)
+        self.observe("request_seconds", seconds, labels)
+        if error is not None or (status is not None and status >= 400):
+            self.count("request_errors_total", {**labels, "class": error_class(error, None if error is not None else status)})
+
+    # outcome: "hit", "miss" or "revalidated"
+    def cache_lookup(self, url, outcome, kind=None):
+        self.count("cache_lookups_total", {"kind": request_kind(url, kind), "outcome": outcome})
+
+    def retried(self, url, retries, kind=None):
+        if retries:
+            self.count("retries_total", {"kind": request_kind(url, kind)}, retries)
+
+    # Times the block as a run of the stage or metric function `name`, in wall and CPU seconds of the thread.
+    @contextmanager
+    def measure(self, name):
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe("function_seconds", time.perf_counter() - started, {"function": name})
+            self.count("function_cpu_seconds_total", {"function": name}, time.thread_time() - cpu_started)
+
+    # Decorator form of measure()
+    def timed(self, name):
+        def decorate(function):
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                with self.measure(name):
+                    return function(*args, **kwargs)
+            return timed_function
+        return decorate
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(h.counts), h.sum, h.count, h.summary()) for key, h in self.histograms.items()}
+        return counters, histograms
+
+    def prometheus_text(self):
+        counters, histograms = self.snapshot()
+        lines = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = "wikicurricula_" + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{label_text(labels)} {format_number(value)}")
+        for (name, labels), (counts, total, count, _) in sorted(histograms.items()):
+            metric = "wikicurricula_" + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += bucket
+                lines.append(f"{metric}_bucket{label_text(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{metric}_sum{label_text(labels)} {format_number(total)}")
+            lines.append(f"{metric}_count{label_text(labels)} {count}")
+        lines.append("# TYPE wikicurricula_run_start_time_seconds gauge")
+        lines.append(f"wikicurricula_run_start_time_seconds {format_number(self.started)}")
+        return "\n".join(lines) + "\n"
+
+    # Counters and histogram summaries grouped by metric name, then by label values ("kind=talk").
+    def summary(self):
+        counters, histograms = self.snapshot()
+        document = {"started": self.started, "elapsed_seconds": round(time.time() - self.started, 3), "counters": {}, "histograms": {}}
+        for (name, labels), value in sorted(counters.items()):
+            document["counters"].setdefault(name, {})[label_key(labels)] = round(value, 6)
+        for (name, labels), (_, _, _, summary) in sorted(histograms.items()):
+            document["histograms"].setdefault(name, {})[label_key(labels)] = summary
+        return document
+
+    # Writes <prefix>_metrics.prom and <prefix>_metrics.json; files are replaced atomically so a collector never reads half of one.
+    def write(self, prefix):
+        write_atomically(prefix + "_metrics.prom", self.prometheus_text())
+        write_atomically(prefix + "_metrics.json", json.dumps(self.summary(), indent=1))
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def label_key(labels):
+    return ",".join(f"{name}={value}" for name, value in labels) or "all"
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def write_atomically(path, text):
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(path + ".tmp", path)
+
+
+# This function returns the metrics file prefix of a result file (chile_results.txt -> chile_results).
+def metrics_prefix(result_file):
+    return os.path.splitext(result_file)[0]
+
+
+# This class writes the metrics every `interval` seconds from a background thread and once more when it is stopped.
+class MetricsReporter:
+    def __init__(self, metrics, prefix, interval=METRICS_EVERY):
+        self.metrics = metrics
+        self.prefix = prefix
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        if interval and interval > 0:
+            self.thread = threading.Thread(target=self.run, name="metrics-reporter", daemon=True)
+            self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.metrics.write(self.prefix)
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.metrics.write(self.prefix)
+
+
+_shared_metrics = PipelineMetrics()
+
+
+# Returns the process-wide metrics that the HTTP client and bot.py record into.
+def shared_metrics():
+    return _shared_metrics
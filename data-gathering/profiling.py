@@ -0,0 +1,129 @@
+'''
+Opt-in CPU and memory profiling of the stages of bot.py and translate.py (--profile).
+A sampled fraction of the runs of a stage (the analysis of one article, the entities of one
+batch...) is run under cProfile, timed with the CPU time of the thread, and under tracemalloc.
+At the end the per-function CPU time and the biggest allocation sites of every stage are
+written to <result>_profile.txt, and the raw profile of every stage to <result>_<stage>.prof
+(readable with pstats or snakeviz).
+'''
+
+import cProfile
+import io
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# Share of the runs of a stage that are profiled when --profile is given without a value
+DEFAULT_FRACTION = 0.05
+
+TOP_FUNCTIONS = 25
+TOP_ALLOCATIONS = 15
+
+
+class StageStats:
+    def __init__(self):
+        self.profile = cProfile.Profile(time.thread_time)
+        self.samples = 0
+        self.runs = 0
+        self.peak = 0
+        # (filename, lineno) -> [bytes, blocks] still allocated at the end of the sampled runs
+        self.allocations = {}
+
+
+# This class profiles a sampled fraction of the runs of every stage.
+# Profiled runs take a lock, so only one of them is measured at a time while the other workers go on unprofiled:
+# cProfile only sees the thread that enabled it, but tracemalloc sees every thread, so its figures are approximate.
+class StageProfiler:
+    # fraction: share of the runs profiled, 0 turns the profiler into a no-op
+    def __init__(self, fraction=0.0, seed=None):
+        self.fraction = fraction
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # held by the profiled run in progress
+        self.profiled_run = threading.Lock()
+        self.stages = {}
+        self.local = threading.local()
+
+    @property
+    def enabled(self):
+        return self.fraction > 0
+
+    def stats_for(self, name):
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageStats()
+            return self.stages[name]
+
+    # Runs the block as one run of stage `name`, profiled if it is sampled; sample=False profiles every run.
+    @contextmanager
+    def stage(self, name, sample=True):
+        if not self.enabled or getattr(self.local, "active", False):
+            yield
+            return
+        stats = self.stats_for(name)
+        with self.lock:
+            stats.runs += 1
+            chosen = not sample or self.random.random() < self.fraction
+        if not chosen:
+            yield
+            return
+
+        with self.profiled_run:
+            self.local.active = True
+            tracemalloc.start()
+            stats.profile.enable()
+            try:
+                yield
+            finally:
+                stats.profile.disable()
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.local.active = False
+                self.add_allocations(stats, snapshot, peak)
+
+    def add_allocations(self, stats, snapshot, peak):
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        with self.lock:
+            stats.samples += 1
+            stats.peak = max(stats.peak, peak)
+            for statistic in snapshot.statistics("lineno"):
+                frame = statistic.traceback[0]
+                site = stats.allocations.setdefault((frame.filename, frame.lineno), [0, 0])
+                site[0] += statistic.size
+                site[1] += statistic.count
+
+    def report(self):
+        lines = [f"Profile of {self.fraction:.0%} of the runs of every stage; CPU seconds of the profiled thread, "
+                 "allocations still held at the end of the sampled runs.\n"]
+        for name, stats in sorted(self.stages.items()):
+            lines.append(f"== {name}: {stats.samples} of {stats.runs} runs profiled, peak traced memory {stats.peak / 1024:.0f} KiB ==\n")
+            if not stats.samples:
+                continue
+
+            for order in ("tottime", "cumulative"):
+                stream = io.StringIO()
+                pstats.Stats(stats.profile, stream=stream).strip_dirs().sort_stats(order).print_stats(TOP_FUNCTIONS)
+                lines.append(f"-- functions by {order} CPU time --")
+                lines.append(stream.getvalue().strip() + "\n")
+
+            lines.append("-- biggest allocation sites --")
+            sites = sorted(stats.allocations.items(), key=lambda item: item[1][0], reverse=True)[:TOP_ALLOCATIONS]
+            for (filename, lineno), (size, count) in sites:
+                lines.append(f"{size / stats.samples / 1024:10.1f} KiB/run {count / stats.samples:10.1f} blocks/run  {filename}:{lineno}")
+            lines.append("")
+        return "\n".join(lines)
+
+    # Writes <prefix>_profile.txt and one <prefix>_<stage>.prof per profiled stage; returns the report path.
+    def write(self, prefix):
+        for name, stats in self.stages.items():
+            if stats.samples:
+                stats.profile.dump_stats(f"{prefix}_{name}.prof")
+        path = prefix + "_profile.txt"
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.report())
+        return path
@@ -1,11 +1,9 @@
-import json
 import csv
+import os
 import sys
-from SPARQLWrapper import SPARQLWrapper, JSON
-
-# Load configuration from JSON file
-with open("wikipedia_config.json", "r") as config_file:
-    CONFIG = json.load(config_file)
+from urllib.parse import urlencode
+from http_client import shared_client
+from analysis_config import load_entries
 
 # SPARQL query template
 SPARQL_QUERY = """
@@ -25,18 +23,60 @@ WHERE {{
 }}
 """
 
+# Large curricula are fetched in pages; the ORDER BY over every selected variable keeps the pages stable
+PAGE_CLAUSE = """ORDER BY ?item ?nombreDelArticulo ?programaLabel
+LIMIT {limit} OFFSET {offset}
+"""
+QUERY_PAGE_SIZE = 10000
+
+# The endpoint can be pointed to a local stand-in (see sparql_stub.py) with WIKICURRICULA_SPARQL_ENDPOINT
+# or with the "sparql_endpoint" key of a wikipedia_config.json entry
+DEFAULT_ENDPOINT = "https://query.wikidata.org/sparql"
+SPARQL_ENDPOINT = os.environ.get("WIKICURRICULA_SPARQL_ENDPOINT", DEFAULT_ENDPOINT)
 
-def fetch_wikidata_info(wikipedia_language_code, country_code):
-    # Wikidata endpoint URL for the SPARQL query
-    wikidata_endpoint = "https://query.wikidata.org/sparql"
-    user_agent = "WDQS-example Python/%s.%s" % (sys.version_info[0], sys.version_info[1])
 
+# This function runs the curriculum query page by page and yields its result bindings one by one.
+# Every page goes through the shared client, so it is kept in the HTTP cache under its query text and
+# revalidated with ETag/Last-Modified when it expires.
+def fetch_bindings(wikipedia_language_code, country_code, endpoint=None, page_size=QUERY_PAGE_SIZE):
+    endpoint = endpoint or SPARQL_ENDPOINT
     sparql_query = SPARQL_QUERY.format(wikipedia_language_code=wikipedia_language_code, country_code=country_code)
 
-    sparql = SPARQLWrapper(wikidata_endpoint, agent=user_agent)
-    sparql.setQuery(sparql_query)
-    sparql.setReturnFormat(JSON)
-    return sparql.query().convert()
+    offset = 0
+    while True:
+        page_query = sparql_query + PAGE_CLAUSE.format(limit=page_size, offset=offset)
+        url = endpoint + "?" + urlencode({"query": page_query, "format": "json"})
+        data = shared_client().get_json(url, headers={"Accept": "application/sparql-results+json"})
+        bindings = data["results"]["bindings"]
+        yield from bindings
+        if len(bindings) < page_size:
+            break
+        offset += page_size
+
+
+def fetch_wikidata_info(wikipedia_language_code, country_code, endpoint=None):
+    # The whole result in the format of the query service, for the callers that need it at once
+    return {"results": {"bindings": list(fetch_bindings(wikipedia_language_code, country_code, endpoint))}}
+
+
+# This function writes the article file and the subject file in a single pass over the bindings.
+# Only the distinct article names are kept in memory; returns them as a dict article name -> QID.
+def store_query_results(bindings, article_file, subject_file):
+    article_qids = {}
+    with open(subject_file, "w", encoding="utf-8", newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(["id_wikidata", "material", "grade"])
+        for result in bindings:
+            writer.writerow(subject_row(result))
+            article_name = result.get("nombreDelArticulo", {}).get("value", "")
+            if article_name:
+                article_qids.setdefault(article_name, result.get("qid", {}).get("value", ""))
+
+    with open(article_file, "w", encoding="utf-8", errors="replace") as file:
+        for article_name in sorted(article_qids):
+            file.write(f"{article_name}\n")
+
+    return article_qids
 
 
 def store_articles(results, article_file):
@@ -59,138 +99,142 @@ def get_id_and_subjects_and_grade(results, subject_file):
         writer = csv.writer(file)
         writer.writerow(["id_wikidata", "material", "grade"])
         for result in results['results']['bindings']:
-            id_wikidata = result.get("qid", {}).get("value", "")
-            material = result.get("programaLabel", {}).get("value", "")
-            grade = result.get("programaLabel", {}).get("value", "")
-            # Additional processing for grade and material
-            if "7" in grade:
-                grade = "7"
-                
-            if "8" in grade:
-                grade = "8"
-
-            if "9" in grade:
-                grade = "9"
-
-            if "Core" in grade:
-                grade = "core"
-                
-            if "Scuole superiori italiane" in grade:
-                grade ="Scuole superiori italiane"
-            if "scuola media italiana" or "escuela secundaria italiana" in grade:
-                grade = "scuola media italiana"
-            if "Scuola primaria italiana" in grade:
-                grade = "Scuola primaria italiana"
-            if "Salud y Sexualidad" in material:
-                material = "Salud y sexualidad"
-                
-            if "Programa de " in material:
-
-                if "Artes Visuales" in material:
-                    material = "Artes Visuales"
-
-                if "Ciencias Naturales" in material:
-                    material = "Ciencias naturales"
-
-                if "Educación Física" in material:
-                    material = "Educación Física y Salud"
-
-                if "Historia" in material:
-                    material = "Historia, Geografía y Ciencias Sociales"
-
-                if "Inglés" in material:
-                    material = "Inglés"
-
-                if "Tecnología" in material:
-                    material = "Tecnología"
-                
-                if "Matemática" in material:
-                    material = "Matemática"
-
-                if "Lenguaje" in material:
-                    material = "Lenguaje y Comunicación"
-
-                if "Música" in material:
-                    material = "Música"
-
-                if "Orientación" in material:
-                    material = "Orientación"
-
-
-                if "Educación musical" in material or  "Educación Musical" in material:
-                    material = "Educación musical"
-
-                if "Comunicación Visual" in material or "Comunicación visual" in material:
-                    material = "Comunicación visual"
-
-                if "Formación para la ciudadanía" in material:
-                    material = "Formación para la ciudadanía"
-
-                if "Educación física y recreación" in material:
-                    material = "Educación física y recreación"
-
-                if "Ciencias del Ambiente" in material or "Ciencias de la computación" in material:
-                    material = "Ciencias del ambiente"
-
-                if "Ciencias de la computación" in material or "Ciencias de la Computación" in material:
-                    material = "Ciencias de la computación"
-
-                if "Comunicación y sociedad" in material:
-                    material = "Comunicación y sociedad"
-
-                if "Comunicación Visual y diseño" in material:
-                    material = "Comunicación visual y diseño"
-                
-                if "Diseño" in material:
-                    material = "Diseño"
-
-                if "Comunicación Visual" in material:
-                    material = "Comunicación Visual"
-                    
-            if "Programma di " or "Programa de" in material:
-
-                if "storia per" in material:
-                    material = "Storia"
-                if "grammatica italiana" in material:
-                    material = "Grammatica Italiana"
-                if "matematica e geometria" in material or "Matematica e Geometria" in material:
-                    material = "Matematica e Geometria"
-                if "musicale" in material:
-                    material = "Musica"
-                if "scienze per" in material:
-                    material = "Scienze"
-                if "Scienze e Tecnologie" in material:
-                    material = "Scienze e Tecnologia"
-                if "Educazione Civica" in material:
-                    material = "Educazione Civica"
-                if "Informatica" in material:
-                    material = "Informatica"
-                if "grammatica latina" in material:
-                    material = "Grammatica Latina"
-                if "biologia" in material:
-                    material = "Biologia"
-                if "chimica" in material:
-                    material = "Chimica"
-                if " Diritto ed Economia" in material or"diritto ed economia" in material:
-                    material = "Diritto ed Economia"
-                if "filosofia" in material:
-                    material = "Filosofia"
-                if "fisica" in material:
-                    material = "Fisica"
-                if "literatura italiana"in material:
-                    material = "Literatura Italiana"
-                
-                if "storia dell'arte" in material:
-                    material = "Storia dell'arte"
-
-            if "Curriculum" in material:
-                material = material.split("Curriculum")[0]
-
-                            
-            if "Science" in material:
-                material = "Science"
-            # Write to CSV
-            writer.writerow([id_wikidata, material, grade])
+            writer.writerow(subject_row(result))
+
+
+# This function returns the subject file row [id_wikidata, material, grade] of one query result.
+def subject_row(result):
+    id_wikidata = result.get("qid", {}).get("value", "")
+    material = result.get("programaLabel", {}).get("value", "")
+    grade = result.get("programaLabel", {}).get("value", "")
+    # Additional processing for grade and material
+    if "7" in grade:
+        grade = "7"
+
+    if "8" in grade:
+        grade = "8"
+
+    if "9" in grade:
+        grade = "9"
+
+    if "Core" in grade:
+        grade = "core"
+
+    if "Scuole superiori italiane" in grade:
+        grade ="Scuole superiori italiane"
+    if "scuola media italiana" or "escuela secundaria italiana" in grade:
+        grade = "scuola media italiana"
+    if "Scuola primaria italiana" in grade:
+        grade = "Scuola primaria italiana"
+    if "Salud y Sexualidad" in material:
+        material = "Salud y sexualidad"
+
+    if "Programa de " in material:
+
+        if "Artes Visuales" in material:
+            material = "Artes Visuales"
+
+        if "Ciencias Naturales" in material:
+            material = "Ciencias naturales"
+
+        if "Educación Física" in material:
+            material = "Educación Física y Salud"
+
+        if "Historia" in material:
+            material = "Historia, Geografía y Ciencias Sociales"
+
+        if "Inglés" in material:
+            material = "Inglés"
+
+        if "Tecnología" in material:
+            material = "Tecnología"
+
+        if "Matemática" in material:
+            material = "Matemática"
+
+        if "Lenguaje" in material:
+            material = "Lenguaje y Comunicación"
+
+        if "Música" in material:
+            material = "Música"
+
+        if "Orientación" in material:
+            material = "Orientación"
+
+
+        if "Educación musical" in material or  "Educación Musical" in material:
+            material = "Educación musical"
+
+        if "Comunicación Visual" in material or "Comunicación visual" in material:
+            material = "Comunicación visual"
+
+        if "Formación para la ciudadanía" in material:
+            material = "Formación para la ciudadanía"
+
+        if "Educación física y recreación" in material:
+            material = "Educación física y recreación"
+
+        if "Ciencias del Ambiente" in material or "Ciencias de la computación" in material:
+            material = "Ciencias del ambiente"
+
+        if "Ciencias de la computación" in material or "Ciencias de la Computación" in material:
+            material = "Ciencias de la computación"
+
+        if "Comunicación y sociedad" in material:
+            material = "Comunicación y sociedad"
+
+        if "Comunicación Visual y diseño" in material:
+            material = "Comunicación visual y diseño"
+
+        if "Diseño" in material:
+            material = "Diseño"
+
+        if "Comunicación Visual" in material:
+            material = "Comunicación Visual"
+
+    if "Programma di " or "Programa de" in material:
+
+        if "storia per" in material:
+            material = "Storia"
+        if "grammatica italiana" in material:
+            material = "Grammatica Italiana"
+        if "matematica e geometria" in material or "Matematica e Geometria" in material:
+            material = "Matematica e Geometria"
+        if "musicale" in material:
+            material = "Musica"
+        if "scienze per" in material:
+            material = "Scienze"
+        if "Scienze e Tecnologie" in material:
+            material = "Scienze e Tecnologia"
+        if "Educazione Civica" in material:
+            material = "Educazione Civica"
+        if "Informatica" in material:
+            material = "Informatica"
+        if "grammatica latina" in material:
+            material = "Grammatica Latina"
+        if "biologia" in material:
+            material = "Biologia"
+        if "chimica" in material:
+            material = "Chimica"
+        if " Diritto ed Economia" in material or"diritto ed economia" in material:
+            material = "Diritto ed Economia"
+        if "filosofia" in material:
+            material = "Filosofia"
+        if "fisica" in material:
+            material = "Fisica"
+        if "literatura italiana"in material:
+            material = "Literatura Italiana"
+
+        if "storia dell'arte" in material:
+            material = "Storia dell'arte"
+
+    if "Curriculum" in material:
+        material = material.split("Curriculum")[0]
+
+
+    if "Science" in material:
+        material = "Science"
+    return [id_wikidata, material, grade]
 
 
 if __name__ == "__main__":
@@ -203,13 +247,12 @@ if __name__ == "__main__":
 
     # Check if the language and country code combination is supported
     config_key = f"{wikipedia_language_code}_{country_code}"
-    file_mapping = CONFIG.get(config_key)
+    file_mapping = load_entries().get(config_key)
     if not file_mapping:
         print("Unsupported language or country code.")
         sys.exit(1)
 
     article_file, subject_file = file_mapping['article_file'], file_mapping['subject_file']
 
-    query_results = fetch_wikidata_info(wikipedia_language_code, country_code)
-    store_articles(query_results, article_file)
-    get_id_and_subjects_and_grade(query_results, subject_file)
+    bindings = fetch_bindings(wikipedia_language_code, country_code, file_mapping.get("sparql_endpoint"))
+    store_query_results(bindings, article_file, subject_file)
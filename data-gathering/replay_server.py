@@ -0,0 +1,311 @@
+'''
+Local stand-in for the MediaWiki, Wikidata, pageviews and XTools endpoints used by bot.py.
+Requests are answered from recorded responses (an HTTP cache file written by a live run,
+looked up by the same normalised URL) and, for URLs that were never recorded, with
+synthetic responses generated from the title or id, so that any title list can be run.
+Latency and errors can be injected to see how the client behaves against a slow or failing upstream:
+
+    python3 replay_server.py --recorded .cache/http_cache.sqlite --latency 50 --error-rate 0.01
+    WIKICURRICULA_UPSTREAM=http://127.0.0.1:8901 WIKICURRICULA_CACHE=off python3 bot.py es 77
+
+benchmark.py starts it on its own.
+'''
+
+import argparse
+import calendar
+import json
+import random
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from http_cache import normalise_url
+
+
+STATS_PATH = "/__replay/stats"
+
+WORDS = ("la el de que en los las un una por con para su es como más fue entre sobre también desde "
+         "historia ciencia sistema forma parte países siglo desarrollo estudio agua tierra proceso").split()
+SECTIONS = ["Historia", "Características", "Clasificación", "Usos", "Véase también", "Referencias"]
+
+
+# This function returns a number that only depends on `text`, so that every run gets the same synthetic answers.
+def seed_of(text):
+    return zlib.crc32(text.encode("utf-8"))
+
+
+# This function generates the wikitext of a synthetic article: an infobox, a lead section and a few sections
+# with links, references, images and now and then a maintenance template. Sizes spread from ~1 kB to ~100 kB.
+def synthetic_wikitext(seed):
+    generator = random.Random(seed)
+    paragraphs = max(1, int(generator.lognormvariate(2.3, 0.9)))
+    parts = ["{{Ficha de concepto\n|nombre = Artículo " + str(seed) + "\n|imagen = Ejemplo_" + str(seed) + ".jpg\n}}\n"]
+    if generator.random() < 0.05:
+        parts.append("{{artículo bueno}}\n")
+    if generator.random() < 0.1:
+        parts.append("{{sin referencias|fecha=enero de 2024}}\n")
+
+    for number in range(paragraphs):
+        if number == 1 or (number > 1 and generator.random() < 0.3):
+            parts.append("\n== " + generator.choice(SECTIONS) + " ==\n")
+        sentence = []
+        for _ in range(generator.randint(40, 160)):
+            word = generator.choice(WORDS)
+            roll = generator.random()
+            if roll < 0.04:
+                word = "[[" + word + "]]"
+            elif roll < 0.05:
+                word = word + "<ref>{{cita web|url=https://example.org/" + str(generator.randint(1, 10 ** 6)) + "|título=" + word + "}}</ref>"
+            elif roll < 0.051:
+                word = word + "{{cita requerida}}"
+            elif roll < 0.052:
+                word = word + "{{qué}}"
+            sentence.append(word)
+        parts.append(" ".join(sentence) + ".\n")
+        if generator.random() < 0.2:
+            parts.append("[[Archivo:Figura_" + str(generator.randint(1, 10 ** 6)) + ".png|miniatura|" + generator.choice(WORDS) + "]]\n")
+
+    parts.append("\n== Referencias ==\n{{listaref}}\n")
+    return "".join(parts)
+
+
+# Talk namespaces of the wikis in wikipedia_config.json
+TALK_NAMESPACES = {"discusión", "discussione", "talk"}
+
+
+# This function generates the wikitext of the talk page `page` (as bot.py writes it, "discusión:Agua"), None when it has none.
+def synthetic_talk(page):
+    page = page.replace("_", " ")
+    seed = seed_of(page[:1].lower() + page[1:])
+    # about a third of the articles have no talk page
+    if seed % 3 == 0:
+        return None
+    return synthetic_wikitext(seed)[: 200 + seed % 5000]
+
+
+# This function generates the MediaWiki action API answer for one request of bot.py.
+def synthetic_action_api(params):
+    action = params.get("action")
+    if action == "parse":
+        page = params.get("page", "")
+        wikitext = synthetic_talk(page)
+        if wikitext is None:
+            return {"error": {"code": "missingtitle", "info": "The page you specified doesn't exist."}}
+        return {"parse": {"title": page, "pageid": seed_of(page), "wikitext": wikitext}}
+
+    if action != "query":
+        return {"error": {"code": "badvalue", "info": f"unsupported action {action}"}}
+
+    if "revids" in params:
+        pages = []
+        for revid in params["revids"].split("|"):
+            pages.append({
+                "pageid": int(revid),
+                "title": f"Revision {revid}",
+                "revisions": [{"revid": int(revid), "slots": {"main": {"content": synthetic_wikitext(int(revid))}}}],
+            })
+        return {"batchcomplete": True, "query": {"pages": pages}}
+
+    pages = []
+    normalized = []
+    for title in params.get("titles", "").split("|"):
+        if not title:
+            continue
+        canonical = title.replace("_", " ")
+        canonical = canonical[:1].upper() + canonical[1:]
+        if canonical != title:
+            normalized.append({"fromencoded": False, "from": title, "to": canonical})
+        if canonical.split(":", 1)[0].lower() in TALK_NAMESPACES:
+            # talk pages are only asked for their length (bot.py --fast)
+            wikitext = synthetic_talk(title)
+            if wikitext is None:
+                pages.append({"ns": 1, "title": canonical, "missing": True})
+            else:
+                pages.append({"pageid": seed_of(canonical), "ns": 1, "title": canonical, "length": len(wikitext.encode("utf-8"))})
+            continue
+        seed = seed_of(canonical)
+        pages.append({
+            "pageid": seed,
+            "ns": 0,
+            "title": canonical,
+            "lastrevid": seed % 10 ** 9 + 1,
+            "length": len(synthetic_wikitext(seed % 10 ** 9 + 1).encode("utf-8")),
+            "pageprops": {"wikibase_item": f"Q{seed % 10 ** 8 + 1}"},
+        })
+    query = {"pages": pages}
+    if normalized:
+        query["normalized"] = normalized
+    return {"batchcomplete": True, "query": query}
+
+
+def synthetic_entities(params):
+    entities = {}
+    for qid in params.get("ids", "").split("|"):
+        if not qid:
+            continue
+        seed = seed_of(qid)
+        claims = {}
+        if seed % 2 == 0:
+            claims["P373"] = [{"mainsnak": {"datavalue": {"value": f"Category {qid}"}}}]
+        if seed % 7 == 0:
+            claims["P935"] = [{"mainsnak": {"datavalue": {"value": f"Gallery {qid}"}}}]
+        if seed % 11 == 0:
+            claims["P625"] = [{"mainsnak": {"datavalue": {"value": {"latitude": (seed % 180) - 90.0, "longitude": (seed % 360) - 180.0}}}}]
+        entities[qid] = {"type": "item", "id": qid, "claims": claims, "sitelinks": {}}
+    return {"entities": entities, "success": 1}
+
+
+# .../per-article/es.wikipedia/all-access/user/<title>/<monthly|daily>/<start>/<end>
+def synthetic_pageviews(path):
+    parts = path.split("/")
+    title, granularity, start, end = unquote(parts[-4]), parts[-3], parts[-2][:8], parts[-1][:8]
+    generator = random.Random(seed_of(title))
+    level = generator.lognormvariate(3, 1.5)
+    day = date(int(start[:4]), int(start[4:6]), int(start[6:8]))
+    last = date(int(end[:4]), int(end[4:6]), int(end[6:8]))
+
+    items = []
+    while day <= last:
+        if granularity == "monthly":
+            days = calendar.monthrange(day.year, day.month)[1]
+            following = (day.replace(day=1) + timedelta(days=days))
+        else:
+            days = 1
+            following = day + timedelta(days=1)
+        items.append({"timestamp": day.strftime("%Y%m%d") + "00", "views": int(level * days * generator.uniform(0.5, 1.5))})
+        day = following
+    return {"items": items}
+
+
+def synthetic_articleinfo(path):
+    seed = seed_of(unquote(path.rsplit("/", 1)[-1]))
+    created = date(2002, 1, 1) + timedelta(days=seed % 8000)
+    return {"created_at": created.isoformat() + "T12:00:00Z", "revisions": 10 + seed % 2000}
+
+
+# This class answers requests from a recording when it has one and with synthetic responses otherwise.
+class Responder:
+    def __init__(self, recorded=None):
+        self.recorded = sqlite3.connect(recorded, check_same_thread=False) if recorded else None
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "recorded": 0, "synthetic": 0, "injected_errors": 0, "not_found": 0, "by_host": {}}
+
+    def count(self, name, host=None):
+        with self.lock:
+            self.stats[name] += 1
+            if host is not None:
+                self.stats["by_host"][host] = self.stats["by_host"].get(host, 0) + 1
+
+    def recording(self, url):
+        if self.recorded is None:
+            return None
+        with self.lock:
+            row = self.recorded.execute("SELECT body FROM responses WHERE key = ?", (normalise_url(url),)).fetchone()
+        return zlib.decompress(row[0]) if row else None
+
+    # Returns (status, body) for a GET of https://host/path
+    def answer(self, host, path):
+        body = self.recording("https://" + host + path)
+        if body is not None:
+            self.count("recorded")
+            return 200, body
+
+        parts = urlsplit(path)
+        params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if host.endswith(".wikipedia.org") and parts.path == "/w/api.php":
+            data = synthetic_action_api(params)
+        elif host == "www.wikidata.org" and params.get("action") == "wbgetentities":
+            data = synthetic_entities(params)
+        elif host == "wikimedia.org" and "/metrics/pageviews/per-article/" in parts.path:
+            data = synthetic_pageviews(parts.path)
+        elif host.startswith("xtools.") and "/api/page/articleinfo/" in parts.path:
+            data = synthetic_articleinfo(parts.path)
+        else:
+            self.count("not_found")
+            return 404, b'{"error":"not recorded"}'
+        self.count("synthetic")
+        return 200, json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    # keep-alive, like the real endpoints
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with Nagle every response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+    # set by serve()
+    responder = None
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    error_status = 503
+
+    def do_GET(self):
+        responder = self.responder
+        if self.path == STATS_PATH:
+            with responder.lock:
+                self.send_body(200, json.dumps(responder.stats).encode("utf-8"))
+            return
+
+        host = (self.headers.get("Host") or "").split(":")[0].lower()
+        responder.count("requests", host)
+        delay = random.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        if self.error_rate and random.random() < self.error_rate:
+            responder.count("injected_errors")
+            self.send_body(self.error_status, b'{"error":"injected"}')
+            return
+        status, body = responder.answer(host, self.path)
+        self.send_body(status, body)
+
+    def send_body(self, status, body):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# This function starts the stand-in on localhost and returns the server; with background=True it runs in a daemon thread.
+# latency and jitter are in milliseconds, error_rate is the share of requests answered with error_status.
+def serve(port=8901, recorded=None, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, background=False):
+    handler = type("Handler", (ReplayHandler,), {
+        "responder": Responder(recorded),
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "error_status": error_status,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        # benchmark.py reads the port from this line
+        print(f"Replaying at http://127.0.0.1:{server.server_port}", flush=True)
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer the requests of bot.py from recorded or synthetic responses.")
+    parser.add_argument("--port", type=int, default=8901, help="0 picks a free port")
+    parser.add_argument("--recorded", metavar="CACHE", help="HTTP cache file of a live run (.cache/http_cache.sqlite)")
+    parser.add_argument("--latency", type=float, default=0.0, help="added latency per request, in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="standard deviation of the latency, in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    options = parser.parse_args()
+    try:
+        serve(options.port, options.recorded, options.latency, options.jitter, options.error_rate, options.error_status)
+    except KeyboardInterrupt:
+        sys.exit(0)
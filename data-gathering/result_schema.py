@@ -0,0 +1,203 @@
+'''
+Layout of the results written by bot.py and read by translate.py.
+Besides the tab-separated result file, bot.py writes the same rows to a typed, columnar JSON
+file: numbers are stored as numbers, failed or unavailable values as null, the subject and the
+grade of every article are added from the subject file of the query, and the QID, subject, grade
+and Commons/Wikisource columns are dictionary-encoded. Readers find the columns by name, whatever the toggles were.
+'''
+
+import csv
+import json
+import os
+import re
+
+
+FORMAT = "wikicurricula-results"
+SCHEMA_VERSION = 1
+
+# (name, type) in the order of the tab-separated result file
+BASE_COLUMNS = [
+    ("article", "string"),
+    ("id_wikidata", "string"),
+    ("first_edit", "date"),
+    ("size", "int"),
+    ("images", "int"),
+    ("notes", "int"),
+]
+# only written when the "warnings_config" of the entry is on
+WARNING_COLUMNS = [
+    ("issues", "int"),
+    ("issue_sourceNeeded", "int"),
+    ("issue_clarify", "int"),
+]
+TAIL_COLUMNS = [
+    ("discussion_size", "int"),
+    ("incipit_size", "int"),
+    ("all_visits", "int"),
+    ("avg_pv_all_time", "int"),
+    ("avg_pv_prev", "int"),
+    ("avg_pv", "int"),
+    ("VdQ", "int"),
+    ("vetrina", "int"),
+    ("commonsGallerys", "string"),
+    ("commonsPage", "string"),
+    ("page_on_wikisource", "string"),
+    ("latitude", "float"),
+    ("longitude", "float"),
+]
+
+# Only in the columnar file: the curriculum of the article, looked up by QID in the subject file written by query.py
+CURRICULUM_COLUMNS = [
+    ("subject", "string"),
+    ("grade", "string"),
+]
+
+# String columns stored as indexes into a list of their distinct values
+DICTIONARY_COLUMNS = {"id_wikidata", "subject", "grade", "commonsPage", "page_on_wikisource"}
+
+DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# What the tab-separated file says about an article that does not exist or has no Wikidata item
+MISSING_ARTICLE = "non-existent article"
+
+
+def result_columns(warnings_enabled):
+    return BASE_COLUMNS + (WARNING_COLUMNS if warnings_enabled else []) + TAIL_COLUMNS
+
+
+def column_names(warnings_enabled):
+    return [name for name, _ in result_columns(warnings_enabled)]
+
+
+# This function returns the columnar file of a result file (chile_results.txt -> chile_results_columns.json).
+def columnar_path(result_file):
+    return os.path.splitext(result_file)[0] + "_columns.json"
+
+
+# This function converts a value of a record to the type of its column; None when it is empty or an error.
+def typed(value, column_type):
+    if value is None or value == "":
+        return None
+    try:
+        if column_type == "int":
+            return int(value)
+        if column_type == "float":
+            return float(value)
+    except (TypeError, ValueError):
+        return None
+    if column_type == "date" and not DATE.fullmatch(str(value)):
+        return None
+    return str(value)
+
+
+# This function renders a record (column name -> value) as a line of the tab-separated result file.
+def format_row(record, columns):
+    if record.get("missing"):
+        return record["article"] + "\t" + MISSING_ARTICLE
+    return "".join(("" if record.get(name) is None else str(record[name])) + "\t" for name, _ in columns)
+
+
+# This function turns a line of the tab-separated result file back into a record.
+def parse_row(row, columns):
+    values = row.split("\t")
+    if len(values) > 1 and values[1] == MISSING_ARTICLE:
+        return {"article": values[0], "missing": True}
+    return {name: value for (name, _), value in zip(columns, values)}
+
+
+# This function reads the subject file once and returns a dictionary that associates every Wikidata ID with its (subject, grade) pair,
+# so that articles can be categorized by subject and grade.
+def create_subject_index(file_path):
+    id_subject_grade_map = {}
+
+    # open file with id subject grade rows in read mode
+    with open(file_path, 'r', encoding='utf-8', errors="replace") as file:
+        reader = csv.reader(file, delimiter=',')
+        header = next(reader, None)
+
+        for row in reader:
+            id_subject_grade_map[row[0]] = (row[1].strip(), row[2].strip())
+
+    return id_subject_grade_map
+
+
+# This function returns the records with the subject and the grade of their QID added.
+def with_curriculum(records, subject_index):
+    for record in records:
+        subject, grade = subject_index.get(record.get("id_wikidata"), (None, None))
+        yield {**record, "subject": subject, "grade": grade}
+
+
+# This function writes records, in order, to a columnar file; the file is replaced only once it is complete.
+# subject_file: the subject file of the query, its subject and grade columns are added when it exists.
+def write_columnar(path, records, columns, subject_file=None):
+    if subject_file and os.path.exists(subject_file):
+        columns = columns + CURRICULUM_COLUMNS
+        records = with_curriculum(records, create_subject_index(subject_file))
+    data = {name: [] for name, _ in columns}
+    dictionaries = {name: {} for name, _ in columns if name in DICTIONARY_COLUMNS}
+    missing = []
+
+    for record in records:
+        is_missing = bool(record.get("missing"))
+        missing.append(is_missing)
+        for name, column_type in columns:
+            value = typed(record.get(name), column_type) if not is_missing or name == "article" else None
+            if name in dictionaries and value is not None:
+                value = dictionaries[name].setdefault(value, len(dictionaries[name]))
+            data[name].append(value)
+
+    document = {
+        "format": FORMAT,
+        "schema_version": SCHEMA_VERSION,
+        "rows": len(missing),
+        "columns": [
+            {"name": name, "type": column_type, "encoding": "dictionary" if name in dictionaries else "plain"}
+            for name, column_type in columns
+        ],
+        "dictionaries": {name: list(values) for name, values in dictionaries.items()},
+        "missing": missing,
+        "data": data,
+    }
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(document, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+# This function yields the records of a columnar file as dicts keyed by column name, plus "missing".
+def read_columnar(path):
+    with open(path, "r", encoding="utf-8") as file:
+        document = json.load(file)
+    if document.get("format") != FORMAT or document.get("schema_version", 0) > SCHEMA_VERSION:
+        raise ValueError(f"{path} is not a results file of schema version {SCHEMA_VERSION} or older")
+
+    names = [column["name"] for column in document["columns"]]
+    columns = []
+    for name in names:
+        values = document["data"][name]
+        dictionary = document["dictionaries"].get(name)
+        if dictionary is not None:
+            values = [None if index is None else dictionary[index] for index in values]
+        columns.append(values)
+
+    for position, is_missing in enumerate(document["missing"]):
+        record = {name: values[position] for name, values in zip(names, columns)}
+        record["missing"] = is_missing
+        yield record
+
+
+# This function yields the records of a tab-separated result file, every value as a string.
+def read_tsv(path, warnings_enabled=False):
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        for row in csv.DictReader(file, fieldnames=column_names(warnings_enabled), delimiter="\t"):
+            row["missing"] = row["id_wikidata"] == MISSING_ARTICLE
+            yield row
+
+
+# This function yields the records of a result file by column name, from its columnar file when it is
+# up to date and from the tab-separated file otherwise; warnings_enabled tells the layout of the latter.
+def read_results(result_file, warnings_enabled=False):
+    columnar = columnar_path(result_file)
+    if os.path.exists(columnar) and (not os.path.exists(result_file) or os.path.getmtime(columnar) >= os.path.getmtime(result_file)):
+        return read_columnar(columnar)
+    return read_tsv(result_file, warnings_enabled)
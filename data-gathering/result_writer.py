@@ -0,0 +1,87 @@
+'''
+Single writer for the result file.
+Worker threads hand their rows to a bounded queue; one background thread writes
+them in batches and, if asked to, puts them back in the order of the input file.
+'''
+
+import queue
+import threading
+import time
+
+
+_CLOSE = object()
+
+
+class ResultWriter:
+    # Rows are numbered by the caller from 0; with ordered=True row n is only written after rows 0..n-1.
+    # progress_every: print a progress line every that many rows (0 disables it), verbose: print every row.
+    def __init__(self, path, ordered=True, batch_size=100, flush_interval=5.0, queue_size=1000,
+                 progress_every=100, verbose=False):
+        self.path = path
+        self.ordered = ordered
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.progress_every = progress_every
+        self.verbose = verbose
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.thread = threading.Thread(target=self.run, name="result-writer", daemon=True)
+        self.thread.start()
+
+    # Hands a row to the writer; row None means that this number produced no row. Blocks while the queue is full.
+    def put(self, number, row):
+        self.queue.put((number, row))
+
+    def close(self):
+        self.queue.put(_CLOSE)
+        self.thread.join()
+
+    def run(self):
+        pending = {}
+        next_number = 0
+        buffer = []
+        last_flush = time.monotonic()
+
+        with open(self.path, "w", encoding="utf-8", errors="replace") as results:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = None
+
+                if item is _CLOSE:
+                    break
+
+                if item is not None:
+                    number, row = item
+                    if not self.ordered:
+                        if row is not None:
+                            buffer.append(row)
+                    else:
+                        pending[number] = row
+                        while next_number in pending:
+                            row = pending.pop(next_number)
+                            next_number += 1
+                            if row is not None:
+                                buffer.append(row)
+
+                if len(buffer) >= self.batch_size or (buffer and time.monotonic() - last_flush >= self.flush_interval):
+                    self.flush(results, buffer)
+                    buffer = []
+                    last_flush = time.monotonic()
+
+            # rows still waiting for a missing predecessor are written in number order
+            buffer.extend(row for _, row in sorted(pending.items()) if row is not None)
+            self.flush(results, buffer)
+
+    def flush(self, results, rows):
+        if not rows:
+            return
+        results.write("".join(row + "\n" for row in rows))
+        results.flush()
+        for row in rows:
+            self.written += 1
+            if self.verbose:
+                print(row)
+            elif self.progress_every and self.written % self.progress_every == 0:
+                print(f"{self.written} articles written to {self.path}")
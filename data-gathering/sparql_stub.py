@@ -0,0 +1,99 @@
+'''
+Local stand-in for the Wikidata Query Service, serving recorded query results.
+A fixture is the JSON result of the curriculum query of one wikipedia_config.json entry,
+saved as <fixtures>/<language>_<country>.json (e.g. tests/fixtures/sparql/es_77.json). The stub applies the
+LIMIT/OFFSET of each request and answers conditional requests, so that query.py can be
+run and tried out without the real endpoint:
+
+    python3 sparql_stub.py tests/fixtures/sparql --port 8900
+    WIKICURRICULA_SPARQL_ENDPOINT=http://localhost:8900/sparql python3 query.py es 77
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+COUNTRY = re.compile(r"wdt:P17\s+wd:Q(\d+)")
+LANGUAGE = re.compile(r"<https://([\w-]+)\.wikipedia\.org/>")
+LIMIT = re.compile(r"\bLIMIT\s+(\d+)", re.IGNORECASE)
+OFFSET = re.compile(r"\bOFFSET\s+(\d+)", re.IGNORECASE)
+
+
+# This function returns the fixture key (language_country) a curriculum query asks for, or None.
+def fixture_key(query):
+    country = COUNTRY.search(query)
+    language = LANGUAGE.search(query)
+    if not country or not language:
+        return None
+    return f"{language.group(1)}_{country.group(1)}"
+
+
+# This function applies the LIMIT and OFFSET of a query to the bindings of a fixture.
+def page_of(bindings, query):
+    offset = OFFSET.search(query)
+    limit = LIMIT.search(query)
+    start = int(offset.group(1)) if offset else 0
+    end = start + int(limit.group(1)) if limit else None
+    return bindings[start:end]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # set by serve()
+    fixtures = None
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query).get("query", [""])[0]
+        key = fixture_key(query)
+        path = os.path.join(self.fixtures, f"{key}.json") if key else None
+        if path is None or not os.path.exists(path):
+            self.send_error(404, f"no fixture for {key}")
+            return
+
+        with open(path, "r", encoding="utf-8") as fixture:
+            data = json.load(fixture)
+        data["results"]["bindings"] = page_of(data["results"]["bindings"], query)
+        body = json.dumps(data).encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/sparql-results+json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# This function starts the stub on localhost and returns the server; with background=True it runs in a daemon thread.
+def serve(fixtures, port=8900, background=False):
+    handler = type("FixtureHandler", (StubHandler,), {"fixtures": fixtures})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        print(f"Serving the fixtures of {fixtures} at http://127.0.0.1:{server.server_port}/sparql")
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve recorded curriculum query results like the Wikidata Query Service.")
+    parser.add_argument("fixtures", help="directory with one <language>_<country>.json result per curriculum")
+    parser.add_argument("--port", type=int, default=8900)
+    options = parser.parse_args()
+    serve(options.fixtures, options.port)
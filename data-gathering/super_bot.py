@@ -1,47 +1,158 @@
-import sys  # Import the sys module to access command-line arguments
-import multiprocessing #for parallel execution of subprocesses.
-import subprocess  # for running external shell commands.
+'''
+Runs the whole pipeline, query -> bot -> translate, for the entries of wikipedia_config.json in one process.
+Every step starts when the steps it depends on are finished, and all of them share the HTTP
+client, its cache and the facts store. Entries analysed on the same wiki with the same settings
+(es_77 and es_298 for instance) are analysed together: an article in both curricula is fetched
+and analysed once and its row is written to the result file of each entry.
+'''
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import bot
+import translate
+from analysis_config import load_entries, config_from_entry
+from http_client import shared_client
+from query import fetch_bindings, store_query_results
+from result_schema import result_columns, parse_row, columnar_path, write_columnar
+
+
+# The query step of several entries runs at the same time, it is a few paged requests (or cache hits) per entry
+QUERY_WORKERS = 4
+
+# The entries whose articles are analysed together must give the same row for the same article
+SHARED_SETTINGS = ["language", "discussionURL", "warnings_config", "featured_template", "display_window_template", "pageview_windows", "metrics", "fast"]
+
+
+# "es_298" -> ("es", "298")
+def split_key(key):
+    language_code, country_id = key.rsplit("_", 1)
+    return language_code, country_id
+
+
+# This function groups the configuration keys that can share the analysis of their articles, keeping the input order.
+def group_keys(keys, config):
+    groups = {}
+    for key in keys:
+        mapping = config[key]
+        settings = (split_key(key)[0],) + tuple(json.dumps(mapping.get(name), sort_keys=True) for name in SHARED_SETTINGS)
+        groups.setdefault(settings, []).append(key)
+    return list(groups.values())
+
+
+# The result file of a group (es_77 + es_298 -> .cache/es_77_es_298_results.txt). It only feeds the result files
+# of the entries, so it is kept with its journal and state file in the .cache folder next to them.
+def group_result_file(keys, config):
+    if len(keys) == 1:
+        return config[keys[0]]["result_file"]
+    directory = os.path.join(os.path.dirname(config[keys[0]]["result_file"]), ".cache")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, "_".join(keys) + "_results.txt")
+
+
+def query_step(key, config):
+    language_code, country_id = split_key(key)
+    mapping = config[key]
+    bindings = fetch_bindings(language_code, country_id, mapping.get("sparql_endpoint"))
+    store_query_results(bindings, mapping["article_file"], mapping["subject_file"])
+    print(f"{key}: article and subject files written")
+
+
+# This function writes the result file of every entry of a group from the rows of the group journal.
+# Each entry gets the rows of its own titles, in the order of its own article file, one row per page.
+def fan_out(journal, keys, config):
+    entry_of = {}
+    for entry in journal.entries:
+        for title in journal.titles_of(entry):
+            entry_of.setdefault(title, entry)
+
+    columns = result_columns(bot.warnings_config)
+    for key in keys:
+        mapping = config[key]
+        written = set()
+        records = []
+        with open(mapping["result_file"], "w", encoding="utf-8", errors="replace") as results:
+            for title in bot.read_titles(mapping["file_to_be_analysed"]):
+                entry = entry_of.get(title)
+                if entry is None or entry["page"] in written:
+                    continue
+                written.add(entry["page"])
+                results.write(entry["row"] + "\n")
+                records.append(entry.get("record") or parse_row(entry["row"], columns))
+        write_columnar(columnar_path(mapping["result_file"]), records, columns, mapping["subject_file"])
+        print(f"{key}: {len(written)} rows written to {mapping['result_file']}")
+
+
+def analysis_step(keys, config, options):
+    bot.configure(config_from_entry(
+        keys[0], config[keys[0]],
+        result_file=group_result_file(keys, config),
+        progress_every=options.progress_every,
+        resume=options.resume,
+        verbose=options.verbose,
+    ))
+
+    # the union of the article files, each title once, in the order of the entries
+    titles = []
+    seen = set()
+    for key in keys:
+        for title in bot.read_titles(config[key]["file_to_be_analysed"]):
+            if title not in seen:
+                seen.add(title)
+                titles.append(title)
+    if len(keys) > 1:
+        print(f"{' + '.join(keys)}: {len(titles)} distinct titles")
+
+    journal = bot.analyse_titles(titles)
+    if len(keys) > 1:
+        fan_out(journal, keys, config)
+
+
+def translate_step(key, config):
+    translate.process_country(key)
+    print(f"{key}: {config[key]['output_file_path']} written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run query.py, bot.py and translate.py for several curricula in one process.")
+    parser.add_argument("keys", nargs="*", help="wikipedia_config.json entries to run, e.g. es_77 es_298 (default: all, or all of --language)")
+    parser.add_argument("--language", help="only run the entries of this Wikipedia language, e.g. es")
+    parser.add_argument("--verbose", action="store_true", help="print every result row")
+    parser.add_argument("--progress-every", type=int, default=100, help="print a progress line every N articles (0 to disable)")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted runs from their journals")
+    options = parser.parse_args()
+
+    config = load_entries()
+    keys = options.keys or list(config)
+    unknown = [key for key in keys if key not in config]
+    if unknown:
+        print(f"Unsupported language or country code: {', '.join(unknown)}")
+        sys.exit(1)
+    if options.language:
+        keys = [key for key in keys if split_key(key)[0] == options.language]
+
+    with ThreadPoolExecutor(max_workers=QUERY_WORKERS) as pool:
+        # 1. every query at once
+        for future in [pool.submit(query_step, key, config) for key in keys]:
+            future.result()
+
+        # 2. one analysis per group, one group at a time since every group uses all the workers of bot.py;
+        # 3. the translation of a group runs in the pool while the next group is analysed
+        translations = []
+        for group in group_keys(keys, config):
+            analysis_step(group, config, options)
+            translations += [pool.submit(translate_step, key, config) for key in group]
+        for future in translations:
+            future.result()
+
+    bot.page_facts.close()
+    if shared_client().cache is not None:
+        print(shared_client().cache.summary())
+    print("All steps have completed.")
 
-# Check if the language code is provided as a command-line argument
-if len(sys.argv) > 1:
-    WIKIPEDIA_LANGUAGE  = sys.argv[1]
-else:
-    WIKIPEDIA_LANGUAGE = "en"  # Default to "en" if no argument is provided
-
-# or exit the process
-# if len(sys.argv) < 2:
-#     print("Please provide the language code as a command-line argument (e.g., 'en' for English).")
-#     sys.exit(1)
-
-def run_subprocess(command):
-    # Function to run a subprocess
-    subprocess.run(command, shell=True)
 
 if __name__ == "__main__":
-    # List of commands to run in parallel
-    commands = [
-        f"python query.py {WIKIPEDIA_LANGUAGE}",
-        f"python bot.py {WIKIPEDIA_LANGUAGE}",
-        "python translate.py",
-    ]
-
-    # creates a multiprocessing pool with a specified number of processes (in this case, 3).
-    num_processes = 3
-    pool = multiprocessing.Pool(processes=num_processes)
-    pool.map(run_subprocess, commands)      # Use the pool to run the commands concurrently
-
-    # Close the pool and wait for all processes to finish
-    pool.close()
-    pool.join()
-
-    print("All subprocesses have completed.")
-
-
-
-
-
-
-
-
-
-
+    main()
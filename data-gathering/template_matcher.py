@@ -0,0 +1,87 @@
+'''
+Counting of the maintenance templates listed in language_template_config.json.
+The configuration is read once per process and every pattern of a language is
+compiled into one regular expression, so an article is scanned once for all categories.
+'''
+
+import functools
+import json
+import os
+import re
+from collections import Counter
+
+
+TEMPLATE_CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "language_template_config.json")
+
+# categories added up in the first value returned by warnings()
+WARNING_CATEGORIES = [
+    "to_check", "synoptic", "correct", "curiosity", "divide", "sources", "localism", "pov",
+    "nn", "recentism", "manual_style", "translation", "wikificare", "stub", "stub_section", "copy_control",
+]
+
+
+@functools.lru_cache(maxsize=None)
+def load_template_config(path=TEMPLATE_CONFIG_FILE):
+    with open(path, "r") as config_file:
+        return json.load(config_file)
+
+
+# This function brings the text to the form the patterns are written for: lowercase, without spaces and newlines.
+def normalise_text(text):
+    return text.replace("\n", "").replace(" ", "").lower()
+
+
+class TemplateMatcher:
+    def __init__(self, language_config):
+        self.categories = {name: list(patterns) for name, patterns in language_config.items()}
+
+        # Patterns with spaces or capital letters can never occur in the normalised text,
+        # they are kept in the categories (counting 0) but left out of the expression.
+        searchable = sorted({
+            pattern for patterns in self.categories.values() for pattern in patterns
+            if pattern and pattern == normalise_text(pattern)
+        })
+        self.by_first_char = {}
+        for pattern in searchable:
+            self.by_first_char.setdefault(pattern[0], []).append(pattern)
+
+        # one match at every position where at least one pattern starts; only the first character is consumed
+        # so that no start is skipped, and when all patterns share it (they all begin with "{{") the regex
+        # engine can jump between occurrences of that literal
+        if not searchable:
+            self.starts = None
+        elif len(self.by_first_char) == 1:
+            first = searchable[0][0]
+            rests = "|".join(re.escape(pattern[1:]) for pattern in sorted(searchable, key=len, reverse=True))
+            self.starts = re.compile(re.escape(first) + "(?=" + rests + ")")
+        else:
+            alternatives = "|".join(re.escape(pattern) for pattern in sorted(searchable, key=len, reverse=True))
+            self.starts = re.compile("(?=" + alternatives + ")")
+
+    # Returns a Counter pattern -> occurrences, counted like str.count (occurrences of one pattern do not overlap).
+    def count_patterns(self, text):
+        counts = Counter()
+        if self.starts is None:
+            return counts
+        next_allowed = {}
+        for match in self.starts.finditer(text):
+            position = match.start()
+            for pattern in self.by_first_char[text[position]]:
+                if position >= next_allowed.get(pattern, 0) and text.startswith(pattern, position):
+                    counts[pattern] += 1
+                    next_allowed[pattern] = position + len(pattern)
+        return counts
+
+    # Returns a dict category -> number of matching templates in an already normalised text.
+    def count_categories(self, text):
+        counts = self.count_patterns(text)
+        return {name: sum(counts[pattern] for pattern in patterns) for name, patterns in self.categories.items()}
+
+
+@functools.lru_cache(maxsize=None)
+def matcher_for(language, path=TEMPLATE_CONFIG_FILE):
+    language_template_config = load_template_config(path)
+    if language not in language_template_config:
+        print(f"Configuration not found for language '{language}'.")
+        return TemplateMatcher({})
+    return TemplateMatcher(language_template_config[language])
@@ -0,0 +1,88 @@
+'''
+Tests of dump_reader.py on a small synthetic pages-articles dump: redirects found before and
+after their target, a target that comes before its redirect and titles that are not in the dump.
+'''
+
+import bz2
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dump_reader import dump_pages
+
+
+# (title, pageid, revid, redirect target or None, text), in the order of the dump
+PAGES = [
+    ("Ciudad", 1, 101, None, "Una '''ciudad''' es un área urbana."),
+    ("Célula", 2, 102, None, "La '''célula''' es la unidad de los seres vivos."),
+    ("Celula", 3, 103, "Célula", "#REDIRECCIÓN [[Célula]]"),
+    ("Fotosintesis", 4, 104, "Fotosíntesis", "#REDIRECCIÓN [[Fotosíntesis]]"),
+    ("Fotosíntesis", 5, 105, None, "La '''fotosíntesis''' es la conversión de materia inorgánica."),
+    ("Urbe", 6, 106, "Ciudad", "#REDIRECCIÓN [[Ciudad]]"),
+]
+
+
+def page_xml(title, pageid, revid, redirect, text):
+    redirect = f'<redirect title="{redirect}" />' if redirect else ""
+    return (f"<page><title>{title}</title><ns>0</ns><id>{pageid}</id>{redirect}"
+            f"<revision><id>{revid}</id><text>{text}</text></revision></page>")
+
+
+def write_dump(path, pages):
+    xml = ('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10">'
+           + "".join(page_xml(*page) for page in pages) + "</mediawiki>")
+    with bz2.open(path, "wb") as dump:
+        dump.write(xml.encode("utf-8"))
+
+
+class DumpPages(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "eswiki-pages-articles.xml.bz2")
+        write_dump(self.path, PAGES)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def pages(self, titles, qids=None):
+        return list(dump_pages(self.path, titles, qids))
+
+    def test_page_fields(self):
+        page, = self.pages(["fotosíntesis"], {"Fotosíntesis": "Q11982"})
+        self.assertEqual((page.title, page.pageid, page.revid, page.qid), ("Fotosíntesis", 5, 105, "Q11982"))
+        self.assertEqual(page.sources, ["fotosíntesis"])
+        self.assertEqual(page.length, len(PAGES[4][4].encode("utf-8")))
+        self.assertFalse(page.missing or page.alias)
+
+    def test_redirect_before_its_target(self):
+        # the redirect comes first in the dump, so both titles are sources of the one page
+        page, = self.pages(["Fotosintesis", "Fotosíntesis"])
+        self.assertEqual(page.title, "Fotosíntesis")
+        self.assertEqual(sorted(page.sources), ["Fotosintesis", "Fotosíntesis"])
+        self.assertIn("fotosíntesis", page.wikitext)
+
+    def test_redirect_after_its_target(self):
+        # the page was yielded before its redirect was read: the redirect comes out as an alias without wikitext
+        page, alias = self.pages(["Célula", "Celula"])
+        self.assertEqual((page.title, page.sources, page.alias), ("Célula", ["Célula"], False))
+        self.assertEqual((alias.title, alias.sources, alias.alias), ("Célula", ["Celula"], True))
+        self.assertEqual(alias.pageid, 2)
+        self.assertIsNone(alias.wikitext)
+
+    def test_target_before_its_redirect_takes_another_pass(self):
+        # only the redirect is asked for and its target comes earlier in the dump
+        page, = self.pages(["Urbe"])
+        self.assertEqual((page.title, page.pageid, page.sources, page.alias), ("Ciudad", 1, ["Urbe"], False))
+        self.assertIn("ciudad", page.wikitext)
+
+    def test_title_not_in_the_dump(self):
+        pages = self.pages(["Ciudad", "Mitocondria"])
+        self.assertEqual([(page.title, page.missing) for page in pages], [("Ciudad", False), ("Mitocondria", True)])
+        self.assertEqual(pages[1].sources, ["Mitocondria"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+'''
+Tests of the time to live of the responses kept by http_cache.py.
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_cache import DAY, FOREVER, ResponseCache, normalise_url, ttl_for
+
+
+XTOOLS_URL = normalise_url("https://xtools.wmflabs.org/api/page/articleinfo/es.wikipedia.org/Fotos%C3%ADntesis")
+REVISION_URL = normalise_url("https://es.wikipedia.org/w/api.php?action=query&revids=123&format=json")
+
+
+class TimeToLive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(os.path.join(self.directory.name, "http_cache.sqlite"))
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def test_xtools_answers_expire(self):
+        self.assertEqual(ttl_for(XTOOLS_URL), DAY)
+        self.assertIs(ttl_for(REVISION_URL), FOREVER)
+
+    def test_entry_stored_for_good_by_an_older_rule_is_stale(self):
+        # an XTools error page cached by a version that kept every XTools answer for good
+        self.cache.store(XTOOLS_URL, b'{"error": "timeout"}', ttl=FOREVER)
+        self.assertFalse(self.cache.lookup(XTOOLS_URL).fresh)
+
+        self.cache.store(REVISION_URL, b'"wikitext"', ttl=FOREVER)
+        self.assertTrue(self.cache.lookup(REVISION_URL).fresh)
+
+    def test_entry_within_its_ttl_is_fresh(self):
+        self.cache.store(XTOOLS_URL, b'{"created_at": "2002-01-15"}', ttl=ttl_for(XTOOLS_URL))
+        self.assertTrue(self.cache.lookup(XTOOLS_URL).fresh)
+
+
+if __name__ == "__main__":
+    unittest.main()
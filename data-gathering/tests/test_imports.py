@@ -0,0 +1,38 @@
+'''
+Checks that the scripts can be imported from any working directory without side effects:
+no configuration file is opened at import time, and the configuration files are found
+next to the modules.
+'''
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+DATA_GATHERING = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_elsewhere(code):
+    with tempfile.TemporaryDirectory() as directory:
+        environment = dict(os.environ, PYTHONPATH=DATA_GATHERING)
+        result = subprocess.run([sys.executable, "-c", code], cwd=directory, env=environment,
+                                capture_output=True, text=True)
+        return result, os.listdir(directory)
+
+
+class ImportFromAnotherDirectory(unittest.TestCase):
+    def test_scripts_import_without_side_effects(self):
+        result, written = run_elsewhere("import bot, query, translate, super_bot")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, "")
+        self.assertEqual(written, [])
+
+    def test_configuration_is_found(self):
+        result, _ = run_elsewhere("from analysis_config import config_for; print(config_for('es', '77').article_file)")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "uruguay_article_file.csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+'''
+Tests of the batch requests of mediawiki.py when the API keeps failing: run_query is replaced
+by a stand-in that raises the HTTPError the client gives up with for some batches.
+The rows of the pages that could not be fetched are not journaled, so --resume tries them again.
+'''
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+import mediawiki
+from http_client import HTTPError
+from journal import Journal
+from mediawiki import Page, fetch_lengths, fetch_pages
+
+
+# This function returns a stand-in of run_query that fails for the batches containing `failing_title`
+# and gives every other page a length of 100 bytes.
+def run_query_failing_on(failing_title, kinds=None):
+    def run_query(params, language, client, cached=True, kind=None):
+        if kinds is not None:
+            kinds.append(kind)
+        titles = params["titles"].split("|")
+        if failing_title in titles:
+            raise HTTPError("https://es.wikipedia.org/w/api.php", 503, "Service Unavailable")
+        return {title: {"title": title, "length": 100} for title in titles}, {}
+    return run_query
+
+
+class FetchLengths(unittest.TestCase):
+    def test_failed_batch_is_left_out(self):
+        titles = [f"Discusión:Artículo {number:02d}" for number in range(60)]
+        with mock.patch.object(mediawiki, "run_query", run_query_failing_on(titles[0])):
+            lengths = fetch_lengths(titles, "es", client=object())
+        # the first batch of 50 titles failed, the second one was loaded
+        self.assertEqual(sorted(lengths), titles[50:])
+        self.assertEqual(set(lengths.values()), {100})
+
+    def test_talk_length_of_a_failed_batch_is_empty(self):
+        pages = [Page(f"Artículo {number:02d}", number, number, "Q1", None, [f"Artículo {number:02d}"], False)
+                 for number in range(60)]
+        kinds = []
+        with mock.patch.object(mediawiki, "run_query", run_query_failing_on("Discusión:Artículo 00", kinds)), \
+                mock.patch.object(bot, "discussionURL", "Discusi%C3%B3n:", create=True), \
+                mock.patch.object(bot, "language", "es", create=True):
+            pages = list(bot.with_talk_lengths(pages))
+        self.assertEqual([page.talk_length for page in pages], [None] * 50 + [100] * 10)
+        self.assertIsNone(bot.discussion_size(pages[0], None))
+        self.assertEqual(bot.discussion_size(pages[50], None), "100")
+        # the prop=info requests of talk pages are counted as talk page requests
+        self.assertEqual(kinds, ["talk", "talk"])
+
+
+class FetchPages(unittest.TestCase):
+    def test_failed_batch_is_not_missing(self):
+        titles = [f"Artículo {number:02d}" for number in range(60)]
+        with mock.patch.object(mediawiki, "run_query", run_query_failing_on(titles[0])):
+            pages = list(fetch_pages(titles, "es", client=object(), content=False))
+        self.assertEqual([page.title for page in pages], titles)
+        self.assertTrue(all(page.failed and not page.missing for page in pages[:50]))
+        self.assertFalse(any(page.failed or page.missing for page in pages[50:]))
+
+
+class RetriedRows(unittest.TestCase):
+    def test_retried_rows_are_written_but_not_resumed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "results_journal.jsonl")
+            journal = Journal(path)
+            journal.record(0, "Fotosíntesis", ["Fotosíntesis"], "Fotosíntesis\tQ11982\t")
+            journal.record(1, "Río de la Plata", ["Río de la Plata"], "Río_de_la_Plata\t\t", retry=True)
+            self.assertEqual(len(journal.rows_in_order()), 2)
+            journal.close()
+
+            resumed = Journal(path, resume=True)
+            self.assertEqual(resumed.done_titles(), {"Fotosíntesis"})
+            resumed.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
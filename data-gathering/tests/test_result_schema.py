@@ -0,0 +1,73 @@
+'''
+Tests of the columnar result file of result_schema.py: typed values, dictionary-encoded string
+columns and the subject and grade joined from the subject file of the query.
+'''
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_schema import columnar_path, read_columnar, result_columns, write_columnar
+from translate import translated_rows
+
+
+RECORDS = [
+    {"article": "Fotosíntesis", "id_wikidata": "Q11982", "size": "2420", "commonsPage": "", "latitude": None},
+    {"article": "Río_de_la_Plata", "id_wikidata": "Q19413", "size": "1103", "commonsPage": "Río de la Plata"},
+    {"article": "Artigas", "missing": True},
+]
+
+SUBJECT_FILE = "id_wikidata,material,grade\nQ11982,Ciencias naturales,7\nQ19413, Geografía ,7\n"
+
+
+class ColumnarFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = columnar_path(os.path.join(self.directory.name, "results.txt"))
+        self.subject_file = os.path.join(self.directory.name, "subjects.csv")
+        with open(self.subject_file, "w", encoding="utf-8") as file:
+            file.write(SUBJECT_FILE)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_dictionary_columns(self):
+        write_columnar(self.path, RECORDS, result_columns(False), self.subject_file)
+        with open(self.path, "r", encoding="utf-8") as file:
+            document = json.load(file)
+        encodings = {column["name"]: column["encoding"] for column in document["columns"]}
+        for name in ("id_wikidata", "subject", "grade", "commonsPage", "page_on_wikisource"):
+            self.assertEqual(encodings[name], "dictionary")
+        self.assertEqual(encodings["size"], "plain")
+        self.assertEqual(document["dictionaries"]["grade"], ["7"])
+        self.assertEqual(document["data"]["grade"], [0, 0, None])
+        self.assertEqual(document["data"]["size"], [2420, 1103, None])
+
+    def test_records_are_read_back_by_name(self):
+        write_columnar(self.path, RECORDS, result_columns(False), self.subject_file)
+        records = list(read_columnar(self.path))
+        self.assertEqual([record["id_wikidata"] for record in records], ["Q11982", "Q19413", None])
+        self.assertEqual([record["subject"] for record in records], ["Ciencias naturales", "Geografía", None])
+        self.assertEqual([record["missing"] for record in records], [False, False, True])
+        self.assertEqual(records[1]["commonsPage"], "Río de la Plata")
+
+    def test_translate_reads_the_subject_column(self):
+        write_columnar(self.path, RECORDS, result_columns(False), self.subject_file)
+        rows = list(translated_rows(read_columnar(self.path), {}))
+        self.assertEqual([(row["subject"], row["grade"]) for row in rows], [("Ciencias naturales", "7"), ("Geografía", "7"), (None, None)])
+
+    def test_without_subject_file(self):
+        write_columnar(self.path, RECORDS, result_columns(False), os.path.join(self.directory.name, "none.csv"))
+        records = list(read_columnar(self.path))
+        self.assertNotIn("subject", records[0])
+        # translate.py joins the subject file itself
+        rows = list(translated_rows(records, {"Q11982": ("Ciencias naturales", "7")}))
+        self.assertEqual(rows[0]["subject"], "Ciencias naturales")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+'''
+Tests of the paged curriculum query of query.py against sparql_stub.py, which serves the
+recorded result of fixtures/sparql/es_77.json.
+'''
+
+import csv
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sparql_stub
+from http_client import HTTPError, HttpClient, use_shared_client
+from query import SPARQL_QUERY, PAGE_CLAUSE, fetch_bindings, store_query_results
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "sparql")
+
+
+def recorded_bindings():
+    with open(os.path.join(FIXTURES, "es_77.json"), "r", encoding="utf-8") as fixture:
+        return json.load(fixture)["results"]["bindings"]
+
+
+class StubQueries(unittest.TestCase):
+    def test_fixture_key(self):
+        query = SPARQL_QUERY.format(wikipedia_language_code="es", country_code="77")
+        self.assertEqual(sparql_stub.fixture_key(query), "es_77")
+        self.assertIsNone(sparql_stub.fixture_key("SELECT ?item WHERE { ?item wdt:P31 wd:Q5. }"))
+
+    def test_page_of(self):
+        bindings = list(range(5))
+        self.assertEqual(sparql_stub.page_of(bindings, PAGE_CLAUSE.format(limit=2, offset=0)), [0, 1])
+        self.assertEqual(sparql_stub.page_of(bindings, PAGE_CLAUSE.format(limit=2, offset=4)), [4])
+        self.assertEqual(sparql_stub.page_of(bindings, PAGE_CLAUSE.format(limit=2, offset=6)), [])
+        self.assertEqual(sparql_stub.page_of(bindings, "SELECT ?item"), bindings)
+
+
+class PagedQuery(unittest.TestCase):
+    def setUp(self):
+        self.server = sparql_stub.serve(FIXTURES, port=0, background=True)
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/sparql"
+        use_shared_client(HttpClient(cache=None))
+
+    def tearDown(self):
+        use_shared_client(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_pages_are_joined_in_order(self):
+        # 5 bindings: pages of 2, 2 and 1; pages of 5 and an empty one; a single page
+        for page_size in (2, 5, 100):
+            with self.subTest(page_size=page_size):
+                bindings = list(fetch_bindings("es", "77", endpoint=self.endpoint, page_size=page_size))
+                self.assertEqual(bindings, recorded_bindings())
+
+    def test_missing_fixture(self):
+        with self.assertRaises(HTTPError):
+            list(fetch_bindings("es", "1", endpoint=self.endpoint, page_size=2))
+
+    def test_store_query_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            article_file = os.path.join(directory, "articles.csv")
+            subject_file = os.path.join(directory, "subjects.csv")
+            bindings = fetch_bindings("es", "77", endpoint=self.endpoint, page_size=2)
+            article_qids = store_query_results(bindings, article_file, subject_file)
+
+            self.assertEqual(article_qids, {"Fotosíntesis": "Q11982", "Río de la Plata": "Q19413", "Sistema solar": "Q7860"})
+            with open(article_file, "r", encoding="utf-8") as file:
+                self.assertEqual(file.read().splitlines(), ["Fotosíntesis", "Río de la Plata", "Sistema solar"])
+            with open(subject_file, "r", encoding="utf-8", newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows[0], ["id_wikidata", "material", "grade"])
+            self.assertEqual([row[0] for row in rows[1:]], ["Q11982", "Q11982", "Q19413", "Q7860", "Q38066"])
+            self.assertEqual(rows[1][1], "Ciencias naturales")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+'''
+Regression tests of wikitext_scanner.py against the text metrics bot.py computed before it.
+The functions below are the previous implementations of note(), images() and
+calculate_introduction_length(), kept as a reference; every article of fixtures/wikitext
+must give the same figures with scan_wikitext().
+'''
+
+import glob
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wikitext_scanner import scan_wikitext
+
+
+CORPUS = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "wikitext", "*.wiki")))
+
+
+# The previous implementations, copied unchanged from bot.py (indentation included)
+def reference_note(text):
+   return str(text.count('</ref>'))
+
+
+def reference_images(text):
+   t = text.lower()
+   img = str(t.count('.jpg')+t.count('.svg')+t.count('.jpeg')+t.count('.png')+t.count('.tiff')+t.count('.gif')+t.count('.tif')+t.count('.xcf'))
+   return img
+
+
+def reference_find_template(text):
+
+   tmp = text[2:]
+   tmp2 = text[2:]
+   tmp = tmp[:tmp.find("}}")+2]
+
+   if "{{" in tmp:
+
+      tmp3 = tmp[tmp.find("{{"):]
+      tmp2 = tmp2.replace(tmp3,"$$$$$$$$$$$$$$")
+
+
+      tmp2 = tmp2[:tmp2.find("}}")+2]
+      tmp2 = tmp2.replace("$$$$$$$$$$$$$$",tmp3)
+
+      return tmp2
+   return tmp
+
+
+def reference_calculate_introduction_length(text):
+   incipit = text
+   incipit = incipit[:incipit.find("\n==")]
+   template_count  =incipit.count('{{')
+
+   format_num = incipit.count("{{formatnum:")
+
+   for i in range(format_num):
+      tmp = incipit[incipit.find("{{formatnum:"):]
+      tmp = tmp[:tmp.find("}}")+2]
+      tmp2 = tmp.replace("{{formatnum:","")
+
+      tmp2 = tmp2.replace("}}","")
+      incipit = incipit.replace(tmp, tmp2)
+
+   template_count = incipit.count("{{")
+
+   for i in range(template_count):
+      text = incipit[incipit.find("{{"):]
+      template = reference_find_template(text)
+      text = text.replace("{{"+template,"")
+      incipit = incipit.replace("{{"+template,"")
+   incipit = incipit.replace("</ref>","")
+
+   n = incipit.count("<ref")
+
+   for i in range(n):
+
+      tmp = incipit[incipit.find("<ref"):]
+      tmp = tmp[:tmp.find(">")+1]
+      incipit = incipit.replace(tmp,"")
+
+   incipit = incipit.replace("[[","")
+   incipit = incipit.replace("]]","")
+   incipit = incipit.replace("|","")
+   introduction_length = len(incipit)
+   return str(introduction_length)
+
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
+
+class ScannerMatchesReference(unittest.TestCase):
+    def test_corpus_is_there(self):
+        self.assertGreaterEqual(len(CORPUS), 6)
+
+    def test_size_images_and_notes(self):
+        for path in CORPUS:
+            text = read(path)
+            with self.subTest(article=os.path.basename(path)):
+                scan = scan_wikitext(text)
+                self.assertEqual(scan.size, len(text))
+                self.assertEqual(str(scan.images), reference_images(text))
+                self.assertEqual(str(scan.notes), reference_note(text))
+
+    def test_introduction_length(self):
+        for path in CORPUS:
+            text = read(path)
+            with self.subTest(article=os.path.basename(path)):
+                self.assertEqual(str(scan_wikitext(text).intro_length), reference_calculate_introduction_length(text))
+
+
+# The two cases where the previous implementation was wrong and the scanner deliberately differs
+class KnownDifferences(unittest.TestCase):
+    def test_templates_nested_twice_are_removed(self):
+        text = "{{a|{{b|{{c}}}}}}Texto visible.\n== Sección ==\n"
+        self.assertNotEqual(reference_calculate_introduction_length(text), str(len("Texto visible.")))
+        self.assertEqual(scan_wikitext(text).intro_length, len("Texto visible."))
+
+    def test_template_at_the_end_of_an_article_without_heading(self):
+        # without a heading the last character is left out; the old code cut the closing brace and counted
+        # what was left of the template as text
+        text = "Texto visible.{{esbozo}}"
+        self.assertNotEqual(reference_calculate_introduction_length(text), str(len("Texto visible.")))
+        self.assertEqual(scan_wikitext(text).intro_length, len("Texto visible."))
+
+
+if __name__ == "__main__":
+    unittest.main()
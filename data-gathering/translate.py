@@ -4,10 +4,12 @@ import os
 from datetime import datetime
 import sys
 import json
-
-# Load configuration from JSON file
-with open("wikipedia_config.json", "r") as config_file:
-    CONFIG = json.load(config_file)
+import heapq
+import math
+from concurrent.futures import ProcessPoolExecutor
+from result_schema import read_results, create_subject_index, MISSING_ARTICLE
+from profiling import StageProfiler
+from analysis_config import load_entries
 
 #This function calculates the number of days between two given date strings.
 #It first converts the date strings into datetime objects and then calculates the difference in days between them.
@@ -26,130 +28,259 @@ def get_incipit_on_size(incipit_size,size):
     return round((int(incipit_size) / int(size))*100,2)
 
 
-#This function creates a subject mapping dictionary based on data from a specified CSV file.
-#It reads the file and associates Wikidata IDs with their corresponding subjects, forming a mapping that can be used to categorize articles by subject.   
-def create_subject_mapping(file_path):
-    id_subject_map = {}
-
-    # open file with id subject pairs in read mode
-    with open(file_path, 'r',  encoding='utf-8', errors="replace") as file:
-        reader = csv.reader(file, delimiter=',')
-        header = next(reader, None)
-
-        for row in reader:
-            id_subject_map[row[0]] = row[1].strip()
-
-    return id_subject_map
-
-def create_grade_mapping(file_path):
-    id_grade_map = {}
-
-    with open(file_path, 'r', encoding='utf-8') as file:
-        reader = csv.reader(file, delimiter=',')
-        header = next(reader, None)
-        for row in reader:
-            id_grade_map[row[0]] = row[2].strip()
-    return id_grade_map
-
-
-
-def process_input_file(input_file, output_file, subject_file):
-    grade_map = create_grade_mapping(subject_file)
-    subject_map = create_subject_mapping(subject_file); 
-
-
-
-    # Open the input file
-    with open(input_file, 'r',  encoding='utf-8', errors="replace") as input_file:
-
-        input_header = [
-            'article',
-            'id_wikidata',
-            'first_edit',
-            'size',
-            'images',
-            'notes',
-            'discussion_size',
-            'incipit_size',
-            'all_visits',
-            'avg_pv_all_time',
-            'avg_pv_prev',
-            'avg_pv',
-            'vetrina',
-            'VdQ',
-            'commonsGallerys',
-            'commonsPage',
-            'page_on_wikisource'
-        ]
-        
-        reader = csv.DictReader(input_file, fieldnames=input_header, delimiter='\t')
-
-        # Create a list to store the rows
-        rows = []
-
-        # Iterate over the rows in the input file
-        for row in reader:
-            # Reorder the columns and replace missing values with zeros
-            new_row = {
-                'id_wikidata': row['id_wikidata'].replace("_", " "),
-                'article': row['article'],
-                'grade': grade_map.get(row['id_wikidata']),
-                'subject': subject_map.get(row['id_wikidata']),
-                'avg_pv': row['avg_pv'],
-                'avg_pv_prev': row['avg_pv_prev'],
-                'size': row['size'],
-                'size_prev': '-',
-                'notes': row['notes'],
-                'notes_prev': '-',
-                'images': row['images'],
-                'images_prev': '-',
-                'references': '0',
-                'references_prev': '-',
-                'incipit_size': row['incipit_size'],
-                'incipit_on_size': get_incipit_on_size(row['incipit_size'],row['size']),
-                'incipit_prev': '-',
-                'issues': '0',
-                'issues_prev': '-',
-                'issue_sourceNeeded': '0',
-                'issue_clarify': '0',
-                'discussion_size': row['discussion_size'],
-                'discussion_prev': '-',
-                'first_edit': row['first_edit'],
-                'days': get_days_between(row['first_edit'], '2022-12-31'),
-                'all_visits': row['all_visits'],
-                'VdQ': row['VdQ'],
-                'vetrina': row['vetrina'],
-                'commonsGallerys': row['commonsGallerys'],
-                'commonsPage': row['commonsPage'],
-                'page_on_wikisource': row['page_on_wikisource']
-            }
-            rows.append(new_row)
-        
-
-  # Open the file in write mode with encoding and newline settings
-    with open(output_file, 'w', encoding='utf-8', newline='') as output_file:
-   
-        output_file.truncate(0) # This line clears the content of the file
-   
-        writer = csv.DictWriter(output_file, fieldnames=new_row.keys(), delimiter='\t')
+# Columns of the file read by the visualization, the header is written even when there is no row
+OUTPUT_HEADER = [
+    'id_wikidata', 'article', 'grade', 'subject', 'avg_pv', 'avg_pv_prev', 'size', 'size_prev', 'notes', 'notes_prev',
+    'images', 'images_prev', 'references', 'references_prev', 'incipit_size', 'incipit_on_size', 'incipit_prev',
+    'issues', 'issues_prev', 'issue_sourceNeeded', 'issue_clarify', 'discussion_size', 'discussion_prev',
+    'first_edit', 'days', 'all_visits', 'VdQ', 'vetrina', 'commonsGallerys', 'commonsPage', 'page_on_wikisource'
+]
+
+
+#This function returns a value of a record, or `default` when the record does not have it.
+def value_or(row, column, default):
+    value = row.get(column)
+    return default if value is None else value
+
+
+#This function converts the records of a result file one at a time, so that memory does not grow with the number of articles.
+#Records come from result_schema.read_results(), by column name, with numbers as numbers when they come from the columnar file.
+def translated_rows(records, subject_index):
+    for row in records:
+        id_wikidata = MISSING_ARTICLE if row['missing'] else (row['id_wikidata'] or '')
+        # the columnar file has the subject and the grade of every article, older files and the TSV file are joined here
+        if 'subject' in row:
+            subject, grade = row['subject'], row['grade']
+        else:
+            subject, grade = subject_index.get(id_wikidata, (None, None))
+        # Reorder the columns and replace missing values with zeros
+        yield {
+            'id_wikidata': id_wikidata.replace("_", " "),
+            'article': row['article'],
+            'grade': grade,
+            'subject': subject,
+            'avg_pv': row['avg_pv'],
+            'avg_pv_prev': row['avg_pv_prev'],
+            'size': row['size'],
+            'size_prev': '-',
+            'notes': row['notes'],
+            'notes_prev': '-',
+            'images': row['images'],
+            'images_prev': '-',
+            'references': '0',
+            'references_prev': '-',
+            'incipit_size': row['incipit_size'],
+            'incipit_on_size': get_incipit_on_size(row['incipit_size'],row['size']),
+            'incipit_prev': '-',
+            # the warning columns are only in the results when the "warnings_config" of the entry is on
+            'issues': value_or(row, 'issues', '0'),
+            'issues_prev': '-',
+            'issue_sourceNeeded': value_or(row, 'issue_sourceNeeded', '0'),
+            'issue_clarify': value_or(row, 'issue_clarify', '0'),
+            'discussion_size': row['discussion_size'],
+            'discussion_prev': '-',
+            'first_edit': row['first_edit'],
+            'days': get_days_between(row['first_edit'], '2022-12-31'),
+            'all_visits': row['all_visits'],
+            'VdQ': row['VdQ'],
+            'vetrina': row['vetrina'],
+            'commonsGallerys': row['commonsGallerys'],
+            'commonsPage': row['commonsPage'],
+            'page_on_wikisource': row['page_on_wikisource']
+        }
+
+
+# Columns summarised in the aggregate file, with counts, percentiles and means
+SUMMARY_COLUMNS = ['size', 'avg_pv', 'avg_pv_prev', 'notes', 'images', 'incipit_size', 'discussion_size']
+
+# Columns whose [min, max] the charts use as scale domains
+DOMAIN_COLUMNS = ['avg_pv', 'size', 'days', 'discussion_size', 'incipit_size', 'issues', 'images', 'notes']
+
+# dv1.js only draws the articles of a subject with the most daily pageviews, the domains are computed on them
+CHART_ARTICLES = 120
+
+SUMMARY_VERSION = 1
+
+
+#This function returns the file with the precomputed aggregates of an output file (chile_es_voci_2023.tsv -> chile_es_voci_2023_summary.json).
+def summary_path(output_file):
+    return os.path.splitext(output_file)[0] + "_summary.json"
+
+
+#This function converts a cell to a number like the "+" of JavaScript does for the visualization; None when it is not a number.
+def to_number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+#This function returns the quantile of sorted values with linear interpolation, like d3.quantile.
+def quantile(values, fraction):
+    position = (len(values) - 1) * fraction
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+#This function keeps the numbers of the summary short: integers when possible, two decimals otherwise.
+def compact(number):
+    number = round(number, 2)
+    return int(number) if number == int(number) else number
+
+
+def describe(values):
+    if not values:
+        return {'count': 0}
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'min': compact(values[0]),
+        'p10': compact(quantile(values, 0.10)),
+        'p25': compact(quantile(values, 0.25)),
+        'median': compact(quantile(values, 0.50)),
+        'p75': compact(quantile(values, 0.75)),
+        'p90': compact(quantile(values, 0.90)),
+        'max': compact(values[-1]),
+        'mean': compact(sum(values) / len(values)),
+    }
+
+
+#This class collects, for one group of articles (all, a subject or a grade), the numbers the summary needs.
+class GroupSummary:
+    def __init__(self):
+        self.count = 0
+        self.values = {column: [] for column in SUMMARY_COLUMNS}
+        # the CHART_ARTICLES articles with the most daily pageviews, as (avg_pv, -position, row numbers)
+        self.chart = []
+
+    def add(self, position, row):
+        self.count += 1
+        numbers = {column: to_number(row[column]) for column in set(SUMMARY_COLUMNS) | set(DOMAIN_COLUMNS)}
+        for column in SUMMARY_COLUMNS:
+            if numbers[column] is not None:
+                self.values[column].append(numbers[column])
+
+        # the charts read an empty cell as 0, like the "+" of JavaScript
+        numbers = {column: 0 if row[column] in (None, '') else number for column, number in numbers.items()}
+        numbers['first_edit'] = row['first_edit'] if row['first_edit'] not in ('', 'ERROR') else None
+        entry = (numbers['avg_pv'] or 0, -position, numbers)
+        if len(self.chart) < CHART_ARTICLES:
+            heapq.heappush(self.chart, entry)
+        elif entry > self.chart[0]:
+            heapq.heapreplace(self.chart, entry)
+
+    def domains(self):
+        chart = [numbers for _, _, numbers in self.chart]
+        domains = {}
+        for column in DOMAIN_COLUMNS + ['first_edit']:
+            values = [numbers[column] for numbers in chart if numbers[column] is not None]
+            if column == 'first_edit':
+                domains[column] = [min(values), max(values)] if values else None
+            else:
+                domains[column] = [compact(min(values)), compact(max(values))] if values else None
+        sizes = [numbers['size'] for numbers in chart if numbers['size'] is not None]
+        # the radius of the article circles is sqrt(size / 3.14)
+        domains['radius'] = [0, compact(max(math.sqrt(size / 3.14) for size in sizes))] if sizes else None
+        return domains
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'stats': {column: describe(values) for column, values in self.values.items()},
+            'domains': self.domains(),
+        }
+
+
+#This function passes the translated rows through unchanged while adding them to the summary groups.
+def summarised_rows(rows, groups):
+    for position, row in enumerate(rows):
+        # like dv1.js, "all" is made of the articles that have a subject
+        if row['subject']:
+            groups['all'].add(position, row)
+            groups['by_subject'].setdefault(row['subject'], GroupSummary()).add(position, row)
+        if row['grade']:
+            groups['by_grade'].setdefault(row['grade'], GroupSummary()).add(position, row)
+        yield row
+
+
+#This function writes the precomputed aggregates of a country: per-subject and per-grade counts, percentiles and scale domains.
+def write_summary(groups, subject_index, output_file, summary_file):
+    summary = {
+        'version': SUMMARY_VERSION,
+        'data_file': os.path.basename(output_file),
+        'subjects': sorted({subject for subject, _ in subject_index.values() if subject}),
+        'grades': sorted({grade for _, grade in subject_index.values() if grade}),
+        'all': groups['all'].as_dict(),
+        'by_subject': {name: group.as_dict() for name, group in sorted(groups['by_subject'].items())},
+        'by_grade': {name: group.as_dict() for name, group in sorted(groups['by_grade'].items())},
+    }
+    with open(summary_file, 'w', encoding='utf-8') as file:
+        json.dump(summary, file, ensure_ascii=False, separators=(',', ':'))
+
+
+# input_file: the result file of bot.py, read from its columnar file when there is one;
+# warnings_enabled: whether the tab-separated result file has the three warning columns.
+def process_input_file(input_file, output_file, subject_file, summary_file=None, warnings_enabled=False):
+    subject_index = create_subject_index(subject_file)
+    groups = {'all': GroupSummary(), 'by_subject': {}, 'by_grade': {}}
+
+    # Read the input file and write the output file at the same time, one row in memory at a time
+    with open(output_file, 'w', encoding='utf-8', newline='') as target:
+        records = read_results(input_file, warnings_enabled)
+        writer = csv.DictWriter(target, fieldnames=OUTPUT_HEADER, delimiter='\t')
         writer.writeheader()
-        writer.writerows(rows)
+        writer.writerows(summarised_rows(translated_rows(records, subject_index), groups))
+
+    write_summary(groups, subject_index, output_file, summary_file or summary_path(output_file))
+
+
+#This function converts the result file of one wikipedia_config.json entry (e.g. "es_77").
+# profile: also write the CPU time per function and the biggest allocation sites of the conversion next to the result file
+def process_country(config_key, profile=False):
+    file_mapping = load_entries()[config_key]
+    output_file = os.path.abspath(file_mapping['output_file_path'])
+    profiler = StageProfiler(1.0 if profile else 0)
+    with profiler.stage('translate', sample=False):
+        process_input_file(file_mapping['result_file'], output_file, file_mapping['subject_file'],
+                           warnings_enabled=bool(file_mapping.get('warnings_config')))
+    if profiler.enabled:
+        print(f"Profile written to {profiler.write(os.path.splitext(file_mapping['result_file'])[0] + '_translate')}")
+    return config_key
+
+
+#This function converts the result files of several entries in parallel, one process per entry up to `workers`.
+def process_countries(config_keys, workers=None):
+    config = load_entries()
+    with ProcessPoolExecutor(max_workers=workers or min(len(config_keys), os.cpu_count() or 1)) as pool:
+        for config_key in pool.map(process_country, config_keys):
+            print(f"{config_key}: {config[config_key]['output_file_path']} written")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
+    # translate.py es 77, or several entries at once: translate.py es_77 es_298 en_117; --profile profiles every conversion
+    arguments = [argument for argument in sys.argv[1:] if argument != "--profile"]
+    profile = len(arguments) < len(sys.argv) - 1
+    if len(arguments) == 2 and arguments[1].isdigit():
+        config_keys = [f"{arguments[0]}_{arguments[1]}"]
+    else:
+        config_keys = arguments
+
+    if not config_keys:
         print("Please provide both the wikipedia_language and country code as command-line arguments.")
         sys.exit(1)
 
-    wikipedia_language_code = sys.argv[1]
-    country_code = sys.argv[2]
-
     # Check if the language and country code combination is supported
-    config_key = f"{wikipedia_language_code}_{country_code}"
-    file_mapping = CONFIG.get(config_key)
-    if not file_mapping:
-        print("Unsupported language or country code.")
-        sys.exit(1)
+    config = load_entries()
+    for config_key in config_keys:
+        if config_key not in config:
+            print("Unsupported language or country code.")
+            sys.exit(1)
 
-    input_file, output_file_path, subject_file = file_mapping['result_file'], os.path.abspath(file_mapping['output_file_path']), file_mapping['subject_file']
-    process_input_file(input_file, output_file_path, subject_file)
+    if len(config_keys) == 1 or profile:
+        # profiled conversions run one after the other in this process
+        for config_key in config_keys:
+            process_country(config_key, profile)
+    else:
+        process_countries(config_keys)
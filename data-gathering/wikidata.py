@@ -0,0 +1,84 @@
+'''
+Batched loading of the few Wikidata statements bot.py reports.
+Entities are requested 50 at a time through wbgetentities and reduced to a compact Entity record.
+'''
+
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from http_client import shared_client
+from mediawiki import batched, MAXLAG
+
+
+WIKIDATA_API = "https://www.wikidata.org/w/api.php?"
+
+# wbgetentities accepts at most 50 ids per request
+BATCH_SIZE = 50
+
+COMMONS_CATEGORY = "P373"
+COMMONS_GALLERY = "P935"
+COORDINATE_LOCATION = "P625"
+WIKISOURCE_SITE = "itwikisource"
+
+# Compact per-QID record, every field is a string ("" when the item does not have it)
+Entity = namedtuple("Entity", ["qid", "commons_gallery", "commons_pages", "wikisource", "latitude", "longitude"])
+
+
+# This function returns the datavalue of the first statement for a property, or None.
+def first_value(claims, prop):
+    try:
+        return claims[prop][0]["mainsnak"]["datavalue"]["value"]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+# This function reduces a full wbgetentities entity to the fields used by bot.py.
+def compact_entity(qid, entity):
+    claims = entity.get("claims", {})
+    sitelinks = entity.get("sitelinks", {})
+    coordinate = first_value(claims, COORDINATE_LOCATION) or {}
+    return Entity(
+        qid=qid,
+        commons_gallery=first_value(claims, COMMONS_CATEGORY) or "",
+        commons_pages=first_value(claims, COMMONS_GALLERY) or "",
+        wikisource=sitelinks.get(WIKISOURCE_SITE, {}).get("title", ""),
+        latitude=str(coordinate.get("latitude", "")),
+        longitude=str(coordinate.get("longitude", "")),
+    )
+
+
+# This function loads the entities for `qids` and returns a dict QID -> Entity; items that are missing, or whose
+# batch failed after the retries of the client, are not in it.
+# Only claims and the Wikisource sitelink are requested: labels, descriptions, aliases and the
+# other sitelinks, which are most of the payload for well-linked items, are never downloaded.
+def load_entities(qids, client=None):
+    client = client or shared_client()
+    records = {}
+
+    for batch in batched(sorted(set(qids)), BATCH_SIZE):
+        params = {
+            "action": "wbgetentities",
+            "format": "json",
+            "ids": "|".join(batch),
+            "props": "claims|sitelinks",
+            "sitefilter": WIKISOURCE_SITE,
+            "maxlag": MAXLAG,
+        }
+        try:
+            data = client.get_json(WIKIDATA_API + urlencode(params))
+        except Exception as error:
+            # the items of a batch that still fails after the retries are left out, like missing items
+            print(f"Failed to load {len(batch)} Wikidata items ({batch[0]} ...): {error}")
+            continue
+        entities = data.get("entities", {})
+
+        for qid in batch:
+            entity = entities.get(qid)
+            if entity is None:
+                # redirected items are returned under the id of their target
+                entity = next((e for e in entities.values() if e.get("redirects", {}).get("from") == qid), None)
+            if entity is None or "missing" in entity:
+                continue
+            records[qid] = compact_entity(qid, entity)
+
+    return records
@@ -0,0 +1,121 @@
+'''
+Single-pass scanner computing the text metrics of an article.
+The wikitext is tokenised once; a stack of open templates tells which characters of
+the introduction are visible, so nested templates are removed correctly and no
+intermediate copies of the text are built.
+'''
+
+import re
+from collections import Counter, namedtuple
+from itertools import chain
+
+
+# size: characters, images: image file references, notes: closed <ref> tags,
+# intro_length: visible characters before the first section heading, templates: Counter of template names
+TextMetrics = namedtuple("TextMetrics", ["size", "images", "notes", "intro_length", "templates"])
+
+TOKEN = re.compile(
+    r"(?P<formatnum>\{\{formatnum:)"
+    r"|(?P<open>\{\{)(?=(?P<name>[^{}|\n]*))"
+    r"|(?P<close>\}\})"
+    r"|(?P<ref_close></ref>)"
+    r"|(?P<ref_open><ref)"
+    r"|(?P<link>\[\[|\]\]|\|)"
+    r"|(?P<image>(?i:\.(?:jpe?g|svg|png|tiff?|gif|xcf)))"
+)
+
+# after the introduction only the tokens that feed the whole-article counters are needed
+BODY_TOKEN = re.compile(
+    r"(?P<formatnum>\{\{formatnum:)"
+    r"|(?P<open>\{\{)(?=(?P<name>[^{}|\n]*))"
+    r"|(?P<ref_close></ref>)"
+    r"|(?P<image>(?i:\.(?:jpe?g|svg|png|tiff?|gif|xcf)))"
+)
+
+FORMATNUM = "formatnum"
+TEMPLATE = "template"
+
+
+def template_name(raw):
+    name = raw.strip().replace("_", " ").lower()
+    # parser functions such as {{#if:...}} are counted by their function name
+    if name.startswith("#"):
+        name = name.split(":", 1)[0]
+    return name
+
+
+def scan_wikitext(text):
+    # the introduction ends at the first section heading; without headings the last character is
+    # left out, as the original implementation did
+    heading = text.find("\n==")
+    split = len(text) if heading == -1 else heading
+    intro_end = max(len(text) - 1, 0) if heading == -1 else heading
+
+    images = 0
+    notes = 0
+    templates = Counter()
+    stack = []
+    visible = True
+    intro_length = 0
+    cursor = 0
+
+    # the introduction is walked with the full tokenizer, the rest of the article with the lighter one
+    tokens = chain(TOKEN.finditer(text, 0, split), BODY_TOKEN.finditer(text, split))
+
+    for match in tokens:
+        kind = match.lastgroup
+        if kind == "name":
+            kind = "open"
+        start, end = match.span()
+
+        if kind == "image":
+            # ".tiff" also contains ".tif" and was always counted twice
+            images += 2 if match.group().lower() == ".tiff" else 1
+            continue
+        if kind == "ref_close":
+            notes += 1
+        elif kind == "open":
+            templates[template_name(match.group("name"))] += 1
+        elif kind == "formatnum":
+            templates[FORMATNUM] += 1
+
+        if start < cursor or start >= intro_end:
+            # inside a <ref ...> tag that was already skipped, or past the introduction
+            continue
+
+        # text between the previous token and this one
+        if visible:
+            intro_length += start - cursor
+        cursor = min(end, intro_end)
+
+        if end > intro_end:
+            # a token cut by the end of the introduction is ordinary text
+            if visible:
+                intro_length += intro_end - start
+            continue
+
+        if kind == "formatnum":
+            stack.append(FORMATNUM)
+        elif kind == "open":
+            stack.append(TEMPLATE)
+            visible = False
+        elif kind == "close":
+            if stack:
+                stack.pop()
+                visible = TEMPLATE not in stack
+            elif visible:
+                # a stray "}}" outside any template is ordinary text
+                intro_length += end - start
+        elif kind == "ref_open" and visible:
+            # the whole opening tag is dropped, the content of the note is kept
+            tag_end = text.find(">", end, intro_end)
+            if tag_end == -1:
+                intro_length += end - start
+            else:
+                cursor = tag_end + 1
+        # ref_close and link tokens are dropped
+
+    if visible and cursor < intro_end:
+        intro_length += intro_end - cursor
+
+    return TextMetrics(len(text), images, notes, intro_length, templates)
@@ -1,5 +1,6 @@
 let wiki_link, dataFile;
-let subject_file;
+// subject list and scale domains per subject, written by translate.py next to the data file (null when there is none)
+let summaryFile, summary = null;
 let subjects = ["all"];
  const starting_year = 2023;
 function format_date(date) {
@@ -112,6 +113,16 @@ pageSelector.addEventListener("change", function () {
 	}		
 });
 
+// [min, max] of a column over the articles drawn for a subject: from the summary when it has them,
+// otherwise computed from the rows; value reads the column of a row
+function scale_domain(the_subject, column, data, value) {
+	const group = summary && (the_subject == "all" ? summary.all : summary.by_subject[the_subject]);
+	if (group && group.domains[column]) {
+		return group.domains[column];
+	}
+	return d3.extent(data, value || ((d) => d[column]));
+}
+
 function dv1(year, the_subject, sort) {
 	// d3.tsv(`assets/data/${filename}` + year + ".tsv").then(loaded);
 	d3.tsv(dataFile).then(loaded);
@@ -208,17 +219,13 @@ function dv1(year, the_subject, sort) {
 		// console.log(filtered_data);
 
 		// scale
-		let y_max = d3.max(filtered_data, function (d) {
-			return +d.avg_pv;
-		});
+		let y_max = scale_domain(the_subject, "avg_pv", filtered_data, (d) => +d.avg_pv)[1];
 		let x_max = d3.max(filtered_data, function (d) {
 			return +d.first_edit;
 		});
 		// console.log("x_max"+ x_max)
 
-		let r_max = d3.max(filtered_data, function (d) {
-			return Math.sqrt(+d.size / 3.14);
-		});
+		let r_max = scale_domain(the_subject, "radius", filtered_data, (d) => Math.sqrt(+d.size / 3.14))[1];
 
 		let y = d3
 			.scaleLinear()
@@ -228,9 +235,7 @@ function dv1(year, the_subject, sort) {
 		let x_ScaleTime = d3
 			.scaleTime()
 			.domain(
-				d3.extent(filtered_data, function (d) {
-					return new Date(d.first_edit);
-				})
+				scale_domain(the_subject, "first_edit", filtered_data, (d) => new Date(d.first_edit)).map((d) => new Date(d))
 			)
 			.range([0, width]);
 
@@ -238,52 +243,20 @@ function dv1(year, the_subject, sort) {
 			max = total;
 			min = 0;
 		} else if (sort == 2) {
-			max = d3.min(filtered_data, function (d) {
-				return d.days;
-			});
-			min = d3.max(filtered_data, function (d) {
-				return d.days;
-			});
+			[max, min] = scale_domain(the_subject, "days", filtered_data);
 		} else if (sort == 3) {
-			min = d3.min(filtered_data, function (d) {
-				return d.size;
-			});
-			max = d3.max(filtered_data, function (d) {
-				return d.size;
-			});
+			[min, max] = scale_domain(the_subject, "size", filtered_data);
 		} else if (sort == 4) {
-			min = d3.min(filtered_data, function (d) {
-				return d.discussion_size;
-			});
-			max = d3.max(filtered_data, function (d) {
-				return d.discussion_size;
-			});
+			[min, max] = scale_domain(the_subject, "discussion_size", filtered_data);
 		} else if (sort == 5) {
-			min = d3.min(filtered_data, function (d) {
-				return d.incipit_size;
-			});
-			max = d3.max(filtered_data, function (d) {
-				return d.incipit_size;
-			});
+			[min, max] = scale_domain(the_subject, "incipit_size", filtered_data);
 		} else if (sort == 6) {
 			min = 0;
-			max = d3.max(filtered_data, function (d) {
-				return d.issues;
-			});
+			max = scale_domain(the_subject, "issues", filtered_data)[1];
 		} else if (sort == 7) {
-			min = d3.min(filtered_data, function (d) {
-				return d.images;
-			});
-			max = d3.max(filtered_data, function (d) {
-				return d.images;
-			});
+			[min, max] = scale_domain(the_subject, "images", filtered_data);
 		} else if (sort == 8) {
-			min = d3.min(filtered_data, function (d) {
-				return d.notes;
-			});
-			max = d3.max(filtered_data, function (d) {
-				return d.notes;
-			});
+			[min, max] = scale_domain(the_subject, "notes", filtered_data);
 		}
 
 		x = d3
@@ -1066,9 +1039,7 @@ function dv1(year, the_subject, sort) {
 			});
 
 			// scale
-			y_max = d3.max(filtered_data, function (d) {
-				return +d.avg_pv;
-			});
+			y_max = scale_domain(the_subject, "avg_pv", filtered_data, (d) => +d.avg_pv)[1];
 
 			y = d3
 				.scaleLinear()
@@ -1079,52 +1050,20 @@ function dv1(year, the_subject, sort) {
 				max = total;
 				min = 0;
 			} else if (the_sort == 2) {
-				min = d3.max(filtered_data, function (d) {
-					return d.days;
-				});
-				max = d3.min(filtered_data, function (d) {
-					return d.days;
-				});
+				[max, min] = scale_domain(the_subject, "days", filtered_data);
 			} else if (the_sort == 3) {
-				min = d3.min(filtered_data, function (d) {
-					return d.size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.size;
-				});
+				[min, max] = scale_domain(the_subject, "size", filtered_data);
 			} else if (the_sort == 4) {
-				min = d3.min(filtered_data, function (d) {
-					return d.discussion_size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.discussion_size;
-				});
+				[min, max] = scale_domain(the_subject, "discussion_size", filtered_data);
 			} else if (the_sort == 5) {
-				min = d3.min(filtered_data, function (d) {
-					return d.incipit_size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.incipit_size;
-				});
+				[min, max] = scale_domain(the_subject, "incipit_size", filtered_data);
 			} else if (the_sort == 6) {
 				min = 0;
-				max = d3.max(filtered_data, function (d) {
-					return d.issues;
-				});
+				max = scale_domain(the_subject, "issues", filtered_data)[1];
 			} else if (the_sort == 7) {
-				min = d3.min(filtered_data, function (d) {
-					return d.images;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.images;
-				});
+				[min, max] = scale_domain(the_subject, "images", filtered_data);
 			} else if (the_sort == 8) {
-				min = d3.min(filtered_data, function (d) {
-					return d.notes;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.notes;
-				});
+				[min, max] = scale_domain(the_subject, "notes", filtered_data);
 			}
 
 			x = d3
@@ -1484,52 +1423,20 @@ function dv1(year, the_subject, sort) {
 				max = total;
 				min = 0;
 			} else if (the_sort == 2) {
-				max = d3.min(filtered_data, function (d) {
-					return d.days;
-				});
-				min = d3.max(filtered_data, function (d) {
-					return d.days;
-				});
+				[max, min] = scale_domain(the_subject, "days", filtered_data);
 			} else if (the_sort == 3) {
-				min = d3.min(filtered_data, function (d) {
-					return d.size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.size;
-				});
+				[min, max] = scale_domain(the_subject, "size", filtered_data);
 			} else if (the_sort == 4) {
-				min = d3.min(filtered_data, function (d) {
-					return d.discussion_size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.discussion_size;
-				});
+				[min, max] = scale_domain(the_subject, "discussion_size", filtered_data);
 			} else if (the_sort == 5) {
-				min = d3.min(filtered_data, function (d) {
-					return d.incipit_size;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.incipit_size;
-				});
+				[min, max] = scale_domain(the_subject, "incipit_size", filtered_data);
 			} else if (the_sort == 6) {
 				min = 0;
-				max = d3.max(filtered_data, function (d) {
-					return d.issues;
-				});
+				max = scale_domain(the_subject, "issues", filtered_data)[1];
 			} else if (the_sort == 7) {
-				min = d3.min(filtered_data, function (d) {
-					return d.images;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.images;
-				});
+				[min, max] = scale_domain(the_subject, "images", filtered_data);
 			} else if (the_sort == 8) {
-				min = d3.min(filtered_data, function (d) {
-					return d.notes;
-				});
-				max = d3.max(filtered_data, function (d) {
-					return d.notes;
-				});
+				[min, max] = scale_domain(the_subject, "notes", filtered_data);
 			}
 
 			x = d3
@@ -1629,31 +1536,45 @@ $(document).ready(async function () {
 	dataFile = `assets/data/${country.toLowerCase()}${lang}_voci_2023.tsv`;
 	wiki_link = `https://${lang}.wikipedia.org/wiki/`;
 
-	subject_file = `../data-gathering/${country.toLowerCase()}${lang}_subject_file.csv`;
-	// Fetch the CSV file and initialize page
-	d3.csv(subject_file).then((data) => {
-		data.forEach((d) => {
-			d.material = d.material.trim()
-			if(!subjects.includes(d.material)){
-				subjects.push(d.material)
-			}
-		})
-		// Remove "all" from the array
-		const indexAll = subjects.indexOf("all");
-		if (indexAll !== -1) {
-			subjects.splice(indexAll, 1);
+	// precomputed subject list and scale domains written by translate.py next to the data file
+	summaryFile = dataFile.replace(/\.tsv$/, "_summary.json");
+
+	// The subjects come from the summary; without one they are read from the subject column of the data file
+	d3.json(summaryFile).then(
+		(data) => {
+			summary = data;
+			add_subjects(data.subjects);
+			initialize_page(lang);
+		},
+		() => {
+			d3.tsv(dataFile).then((data) => {
+				add_subjects(data.map((d) => d.subject.trim()).filter((subject) => subject !== ""));
+				initialize_page(lang);
+			});
+		}
+	);
+});
+
+function add_subjects(names) {
+	names.forEach((name) => {
+		if(!subjects.includes(name)){
+			subjects.push(name)
 		}
+	})
+	// Remove "all" from the array
+	const indexAll = subjects.indexOf("all");
+	if (indexAll !== -1) {
+		subjects.splice(indexAll, 1);
+	}
 
-		// Sort the rest of the subjects alphabetically
-		subjects.sort();
+	// Sort the rest of the subjects alphabetically
+	subjects.sort();
 
-		// Add "all" back at the beginning
-		subjects.unshift("all");
+	// Add "all" back at the beginning
+	subjects.unshift("all");
 
-		console.log(subjects);
-		initialize_page(lang);
-	});
-});
+	console.log(subjects);
+}
 
 // top the top arrow 
 const toTop = document.querySelector(".to-top");